@@ -10,6 +10,7 @@ from flask_jwt_extended import JWTManager
 from flask_mail import Mail
 from config import Config
 from app.db import db
+from app import mailer, compression
 
 jwt = JWTManager()
 mail = Mail()
@@ -25,9 +26,12 @@ def create_app(config_class=Config):
     jwt.init_app(app)
     mail.init_app(app) 
     db.init_app(app)
+    mailer.init_app(app)
+    compression.init_app(app)
 
-    from app.api.v1 import bp as api_v1
+    from app.api.v1 import bp as api_v1, persistence
     app.register_blueprint(api_v1, url_prefix='/api/v1')
+    persistence.init_app(app)
 
     from app.api.v2 import bp as api_v2
     app.register_blueprint(api_v2, url_prefix='/api/v2')
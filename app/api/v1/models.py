@@ -7,16 +7,118 @@
 
 """
 
-from datetime import datetime
-import copy
+from datetime import datetime, timedelta
+import threading
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+
+class Store:
+    """
+    Items by id, shared by the threads of a worker. Writes take a
+    lock. Reads of single items don't, and reads of all items return
+    an immutable snapshot that is only rebuilt after a write, so
+    listings never copy the items.
+
+    With a journal (see app.api.v1.persistence) every write is also
+    passed to journal.append while the lock is held, so the journal
+    sees writes in the order they were made.
+    """
+
+    def __init__(self):
+        self._items = {}
+        self._lock = threading.Lock()
+        #: The last id given out
+        self._last_id = 0
+        self.journal = None
+        #: Incremented by every write
+        self._version = 0
+        #: (version, serialized items)
+        self._snapshot = (-1, ())
+
+    def next_id(self):
+        """
+        Returns a new id, never the same twice
+        """
+        with self._lock:
+            self._last_id += 1
+            return self._last_id
+
+    def get(self, item_id):
+        return self._items.get(item_id)
+
+    def put(self, item_id, item):
+        with self._lock:
+            if self.journal is not None:
+                self.journal.append('put', item_id, item)
+            self._items[item_id] = item
+            self._version += 1
+
+    def delete(self, item_id):
+        """
+        Returns True if an item was deleted
+        """
+        with self._lock:
+            if item_id not in self._items:
+                return False
+            if self.journal is not None:
+                self.journal.append('delete', item_id)
+            del self._items[item_id]
+            self._version += 1
+            return True
+
+    def clear(self):
+        with self._lock:
+            if self.journal is not None:
+                self.journal.append('clear')
+            self._items.clear()
+            self._version += 1
+
+    def load(self, items, last_id):
+        """
+        Replaces the items with items (a dict by id), as restored by a
+        journal. last_id -> the last id given out.
+        """
+        with self._lock:
+            self._items = items
+            self._last_id = max([self._last_id, last_id] + list(items))
+            self._version += 1
+
+    def copy(self, callback):
+        """
+        Returns a dict of the items, the last id given out and the
+        result of callback(), called with the lock held so that no
+        write falls between them
+        """
+        with self._lock:
+            return dict(self._items), self._last_id, callback()
+
+    def snapshot(self):
+        """
+        Returns a tuple of the serialized items. The dicts are shared
+        between readers and must not be changed.
+        """
+        version, items = self._snapshot
+        if version == self._version:
+            return items
+        with self._lock:
+            version = self._version
+            values = tuple(self._items.values())
+        items = tuple(value.serialize for value in values)
+        #: A reader that raced with a write may store an older version,
+        #: the next read then rebuilds it
+        self._snapshot = (version, items)
+        return items
+
 
 class Model:
     """
-    Base class for all database objects
+    Base class for all database objects. Changes to an item are only
+    seen by readers of all items once it is put() again.
     """
     # These fields are private to this class
-    _id = 0
-    _db = {}
+    _store = Store()
 
     def __init__(self):
         self.created = datetime.utcnow()
@@ -27,7 +129,7 @@ class Model:
         Returns an item given an id
         Assumes item_id is of type int
         """
-        return cls._db.get(item_id)
+        return cls._store.get(item_id)
 
     @classmethod
     def all(cls):
@@ -35,8 +137,7 @@ class Model:
         Returns all items as a list collection
         of dictionary elements
         """
-        db_copy = copy.deepcopy(cls._db)
-        return [v.serialize for _, v in db_copy.items()]
+        return list(cls._store.snapshot())
 
     @classmethod
     def put(cls, item):
@@ -46,7 +147,7 @@ class Model:
         """
         if not isinstance(item, Model):
             raise ValueError('Data item should be a Model object')
-        cls._db[item.data_id] = item
+        cls._store.put(item.data_id, item)
         return True
 
     @classmethod
@@ -54,18 +155,16 @@ class Model:
         """
         Deletes an item from the internal database
         """
-        try:
-            del cls._db[item_id]
+        if cls._store.delete(item_id):
             return True
-        except KeyError:
-            return
+        return None
+
     @classmethod
     def clear_all(cls):
         """
         Removes all items from the database model
         """
-        cls._db.clear()
-
+        cls._store.clear()
 
     def add_field(self, field, data):
         """
@@ -73,6 +172,45 @@ class Model:
         """
         setattr(self, field, data)
 
+    @property
+    def state(self):
+        """
+        Returns the item's attributes as a JSON serializable dict, with
+        its class name in 'kind'. Related items are saved by their id,
+        in '@'.
+        """
+        #: Copied at once, a snapshot may read it while a request adds
+        #: an attribute
+        state = dict(vars(self))
+        state['kind'] = type(self).__name__
+        state['created'] = (self.created - EPOCH) // MICROSECOND
+        related = {name: value.data_id for name, value in state.items()
+                   if isinstance(value, Model)}
+        if related:
+            for name in related:
+                del state[name]
+            state['@'] = related
+        return state
+
+    @staticmethod
+    def from_state(state, items, kinds=None):
+        """
+        Returns the item saved as state, which it takes over.
+        items -> the items restored so far by id, to look related
+        items up in. kinds -> the Model classes by name, looked up if
+        not given.
+        """
+        if kinds is None:
+            kinds = {cls.__name__: cls for cls in Model.__subclasses__()}
+        item = object.__new__(kinds[state.pop('kind')])
+        related = state.pop('@', None)
+        state['created'] = EPOCH + timedelta(microseconds=state['created'])
+        item.__dict__.update(state)
+        if related:
+            for name, item_id in related.items():
+                setattr(item, name, items.get(item_id))
+        return item
+
 class Record(Model):
     """
     Stores all data related to a record
@@ -88,8 +226,7 @@ class Record(Model):
         self.video = [] if video is None else video
         self.user = user
         Model.__init__(self)
-        self._id = self.data_id + 1
-        Record._id = self.data_id
+        self._id = self._store.next_id()
 
     @property
     def data_id(self):
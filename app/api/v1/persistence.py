@@ -0,0 +1,279 @@
+"""
+    app.api.v1.persistence
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    Optional durable mode for the v1 in-memory store.
+
+    With V1_STORE_PATH set, every write to the store is appended to a
+    log in that directory, one JSON line per write with a sequence
+    number. After V1_STORE_SNAPSHOT_OPS writes, a background thread
+    writes the whole store to a snapshot and removes the logs it
+    covers. On start the latest snapshot is read through mmap and the
+    logs written after it are replayed, so a restarted worker gets its
+    store back.
+
+    V1_STORE_FSYNC says when the log is forced to disk:
+
+        always    after every write; nothing is lost
+        interval  every V1_STORE_FSYNC_INTERVAL seconds; a power failure
+                  loses up to that much
+        never     when the OS chooses
+
+    Each write is handed to the OS as it is made, so a crash of the
+    process alone loses nothing under any policy. The store belongs to
+    one process, so only one process may use a directory at a time.
+
+"""
+
+import atexit
+import fcntl
+import gc
+import json
+import mmap
+import os
+import threading
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+#: Zero padded so that names sort by sequence number
+SNAPSHOT = 'snapshot-{:020d}.jsonl'
+LOG = 'log-{:020d}.jsonl'
+
+FSYNC_POLICIES = ('always', 'interval', 'never')
+
+
+if orjson is not None:
+    _dumps, _loads = orjson.dumps, orjson.loads
+else:  # pragma: no cover
+    def _dumps(data):
+        return json.dumps(data, separators=(',', ':')).encode('utf-8')
+    _loads = json.loads
+
+
+def _lines(filename):
+    """
+    Yields the lines of a file, read through mmap
+    """
+    with open(filename, 'rb') as file:
+        if not os.fstat(file.fileno()).st_size:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for line in iter(data.readline, b''):
+                yield line
+
+
+class Journal:
+    """
+    The log and snapshots of a Store in the directory `path`
+    """
+
+    def __init__(self, path, fsync='interval', fsync_interval=1.0, snapshot_ops=100000):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError('V1_STORE_FSYNC should be one of {}'.format(', '.join(FSYNC_POLICIES)))
+        self.path = os.path.abspath(path)
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.snapshot_ops = snapshot_ops
+        self.store = None
+        #: Sequence number of the last write logged
+        self.seq = 0
+        self.log = None
+        self._lock_file = None
+        self._since_snapshot = 0
+        self._compacting = False
+        self._dirty = False
+        self._closed = threading.Event()
+
+    def _files(self, prefix):
+        """
+        Returns (sequence number, path) of the files called prefix-*,
+        oldest first
+        """
+        files = []
+        for name in os.listdir(self.path):
+            if name.startswith(prefix + '-') and name.endswith('.jsonl'):
+                files.append((int(name[len(prefix) + 1:-6]), os.path.join(self.path, name)))
+        return sorted(files)
+
+    def open(self, store):
+        """
+        Restores store from the directory and logs its writes from now on
+        """
+        os.makedirs(self.path, exist_ok=True)
+        self._lock_file = open(os.path.join(self.path, 'lock'), 'w')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._lock_file.close()
+            raise RuntimeError('{} is used by another process'.format(self.path))
+        #: Restoring makes millions of objects and no garbage, collecting
+        #: while at it only slows it down
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            items, last_id = self.recover()
+        finally:
+            if collecting:
+                gc.enable()
+        store.load(items, last_id)
+        self._open_log()
+        self.store = store
+        store.journal = self
+        if self.fsync == 'interval':
+            threading.Thread(target=self._sync_every_interval, daemon=True).start()
+
+    def recover(self):
+        """
+        Returns the items (by id) and the last id given out, read from
+        the latest snapshot and the logs written after it
+        """
+        from app.api.v1.models import Model
+        kinds = {cls.__name__: cls for cls in Model.__subclasses__()}
+        items, last_id = {}, 0
+        snapshots = self._files('snapshot')
+        if snapshots:
+            lines = _lines(snapshots[-1][1])
+            header = _loads(next(lines))
+            self.seq, last_id = header['seq'], header['last_id']
+            for line in lines:
+                item = Model.from_state(_loads(line), items, kinds)
+                items[item.data_id] = item
+        for _, filename in self._files('log'):
+            for line in _lines(filename):
+                try:
+                    entry = _loads(line)
+                except ValueError:
+                    #: The write a crash cut short, the last of its log
+                    break
+                if entry['seq'] <= self.seq:
+                    continue
+                self.seq = entry['seq']
+                if entry['op'] == 'put':
+                    items[entry['id']] = Model.from_state(entry['item'], items, kinds)
+                    last_id = max(last_id, entry['id'])
+                elif entry['op'] == 'delete':
+                    items.pop(entry['id'], None)
+                elif entry['op'] == 'clear':
+                    items.clear()
+        return items, last_id
+
+    def _open_log(self):
+        #: Unbuffered, each write goes straight to the OS
+        self.log = open(os.path.join(self.path, LOG.format(self.seq)), 'ab', buffering=0)
+
+    def append(self, op, item_id=None, item=None):
+        """
+        Logs a write to the store. Called by the store with its lock held.
+        """
+        entry = {'seq': self.seq + 1, 'op': op}
+        if item_id is not None:
+            entry['id'] = item_id
+        if item is not None:
+            entry['item'] = item.state
+        self.log.write(_dumps(entry) + b'\n')
+        self.seq += 1
+        if self.fsync == 'always':
+            os.fsync(self.log.fileno())
+        else:
+            self._dirty = True
+        self._since_snapshot += 1
+        if self.snapshot_ops and self._since_snapshot >= self.snapshot_ops and not self._compacting:
+            self._compacting = True
+            threading.Thread(target=self.compact, daemon=True).start()
+
+    def _sync_every_interval(self):
+        while not self._closed.wait(self.fsync_interval):
+            self.sync()
+
+    def sync(self):
+        """
+        Forces the writes logged so far to disk
+        """
+        log = self.log
+        if self._dirty and log is not None:
+            self._dirty = False
+            try:
+                os.fsync(log.fileno())
+            except (OSError, ValueError):
+                #: The log was closed by a rotation, which synced it
+                pass
+
+    def _rotate(self):
+        #: Called with the store's lock held: later writes go to a new log
+        self._since_snapshot = 0
+        old = self.log
+        self._open_log()
+        if self.fsync != 'never':
+            os.fsync(old.fileno())
+        old.close()
+        return self.seq
+
+    def compact(self):
+        """
+        Writes a snapshot of the store and removes the snapshots and
+        logs it replaces
+        """
+        try:
+            items, last_id, seq = self.store.copy(self._rotate)
+            filename = os.path.join(self.path, SNAPSHOT.format(seq))
+            with open(filename + '.tmp', 'wb') as snapshot:
+                snapshot.write(_dumps({'seq': seq, 'last_id': last_id}) + b'\n')
+                for item in items.values():
+                    snapshot.write(_dumps(item.state) + b'\n')
+                snapshot.flush()
+                os.fsync(snapshot.fileno())
+            os.replace(filename + '.tmp', filename)
+            self._sync_directory()
+            for start, old in self._files('snapshot') + self._files('log'):
+                if start < seq:
+                    os.remove(old)
+        finally:
+            self._compacting = False
+
+    def _sync_directory(self):
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def close(self):
+        """
+        Syncs and closes the log and lets another process use the directory
+        """
+        if self.log is None:
+            return
+        self._closed.set()
+        if self.store is not None:
+            self.store.journal = None
+            self.store = None
+        if self.fsync != 'never':
+            os.fsync(self.log.fileno())
+        self.log.close()
+        self.log = None
+        self._lock_file.close()
+
+
+def init_app(app):
+    """
+    Makes the v1 store durable if V1_STORE_PATH is set
+    """
+    path = app.config.get('V1_STORE_PATH')
+    if not path:
+        return
+    from app.api.v1.models import Model
+    store = Model._store
+    if store.journal is not None:
+        #: Another app of this process opened it
+        if store.journal.path != os.path.abspath(path):
+            raise RuntimeError('The v1 store is already kept in {}'.format(store.journal.path))
+        return
+    journal = Journal(path,
+                      fsync=app.config.get('V1_STORE_FSYNC', 'interval'),
+                      fsync_interval=app.config.get('V1_STORE_FSYNC_INTERVAL', 1.0),
+                      snapshot_ops=app.config.get('V1_STORE_SNAPSHOT_OPS', 100000))
+    journal.open(store)
+    atexit.register(journal.close)
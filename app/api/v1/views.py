@@ -30,7 +30,6 @@ class CreateOrReturnRedflags(Resource):
         """
         Returns a collection of all red-flag records
         """
-        records = Record.all()
         output = {'status': 200, 'data': Record.all()}
         return output
 
@@ -8,9 +8,12 @@
 
 from flask import Blueprint
 from flask_restful import Api
+from app.encoding import output_json
 
 bp = Blueprint('v2', __name__)
 api_bp = Api(bp)
+#: Encode responses with the fastest JSON encoder installed
+api_bp.representations['application/json'] = output_json
 
 from app.api.v2 import incidents, auth
 
@@ -18,11 +21,14 @@ from app.api.v2 import incidents, auth
 from app.api.v2.auth import SignUp, Login, RefreshToken, LogoutRefresh, LogoutAccess
 
 #: Incident records resources
-from app.api.v2.incidents import Incidents, UpdateIncident
+from app.api.v2.incidents import Incidents, UpdateIncident, IncidentsWithin, IncidentsNearby
 
 #: Users resource
 from app.api.v2.users import User, Users
 
+#: Monitoring resource
+from app.api.v2.stats import Stats
+
 #: Authentication routes
 api_bp.add_resource(SignUp, '/auth/signup', endpoint='signup')
 api_bp.add_resource(Login, '/auth/login', endpoint='login')
@@ -38,6 +44,16 @@ api_bp.add_resource(
     endpoint='incidents'
     )
 
+api_bp.add_resource(
+    IncidentsWithin,
+    '/<incident_type>/within',
+    endpoint='incidents_within')
+
+api_bp.add_resource(
+    IncidentsNearby,
+    '/<incident_type>/nearby',
+    endpoint='incidents_nearby')
+
 api_bp.add_resource(
 	UpdateIncident, 
 	'/<incident_type>/<_id>/<field>',
@@ -52,4 +68,10 @@ api_bp.add_resource(
 api_bp.add_resource(
         Users,
         '/users',
-        endpoint='users')
\ No newline at end of file
+        endpoint='users')
+
+#: monitoring resources
+api_bp.add_resource(
+        Stats,
+        '/stats',
+        endpoint='stats')
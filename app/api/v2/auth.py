@@ -9,35 +9,39 @@
 from flask_jwt_extended import (create_access_token, create_refresh_token,
                                 jwt_refresh_token_required, get_jwt_identity,
                                 jwt_required, get_raw_jwt)
-from flask_restful import Resource, reqparse
-from app.utils import (valid_email, valid_password, update_createdon, valid_username, raise_error)
-from app.models import User, Blacklist
+from flask_restful import Resource
+from app.utils import (valid_email, valid_password, update_createdon, valid_username, raise_error,
+                       revoke_token)
+from app.models import User
+from app.passwords import HashPoolBusy
+from app.schema import Field, Invalid, Schema
 from . import api_bp
 
 #:
-#: Sign Up parser
+#: Sign Up schema
 #:
-signup_parser = reqparse.RequestParser()
-signup_parser.add_argument('username', type=str, required=True,
-                         help='Please enter username and password')
-signup_parser.add_argument('password', type=str, required=True,
-                         help='Please enter username and password')
-#: Optional fields
-signup_parser.add_argument('email', type=str)
-signup_parser.add_argument('phone', type=str)
-signup_parser.add_argument('firstname', type=str)
-signup_parser.add_argument('lastname', type=str)
-signup_parser.add_argument('othernames', type=str)
-signup_parser.add_argument('isadmin', type=str)
+signup_schema = Schema(
+    Field('username', required=True, missing='Please enter username and password',
+          check=valid_username,
+          invalid="Invalid Username. It should be at least 3 characters long and"
+                  "the first character should be a letter."),
+    Field('password', required=True, missing='Please enter username and password',
+          check=valid_password,
+          invalid="Invalid password. Ensure the password is at least 5 characters long"),
+    #: Optional fields
+    Field('email', check=valid_email, invalid="Invalid email format"),
+    Field('phone'),
+    Field('firstname'),
+    Field('lastname'),
+    Field('othernames'),
+    Field('isadmin'))
 
 #:
-#: Log In parser
+#: Log In schema
 #:
-login_parser = reqparse.RequestParser()
-login_parser.add_argument('username', type=str, required=True,
-                    help='Please enter username and password')
-login_parser.add_argument('password', type=str, required=True,
-                    help='Please enter username and password')
+login_schema = Schema(
+    Field('username', required=True, missing='Please enter username and password'),
+    Field('password', required=True, missing='Please enter username and password'))
 
 
 class SignUp(Resource):
@@ -52,7 +56,10 @@ class SignUp(Resource):
 
         USER = User()
 
-        data = signup_parser.parse_args()
+        try:
+            data = signup_schema.parse()
+        except Invalid as error:
+            return error.response()
         username = data.get('username')
         password = data.get('password')
         email = data.get('email')
@@ -62,23 +69,18 @@ class SignUp(Resource):
         othernames = data.get('othernames')
         isadmin = data.get('isadmin')
 
-        username = valid_username(username)
-        if not username:
-            return raise_error(400, "Invalid Username. It should be at least 3 characters long and"
-                               "the first character should be a letter.")
-        if USER.filter_by('username', username):
+        if USER.by_username(username):
             return raise_error(400, "Please use a different username")
-        if email and not valid_email(email):
-            return raise_error(400, "Invalid email format")
         if email and USER.filter_by('email', email):
             return raise_error(400, "Please use a different email")
-        if not valid_password(password):
-            return raise_error(400, "Invalid password. "
-                               "Ensure the password is at least 5 characters long")
-        USER.add(username=username, password=password, email=email, firstname=firstname,
-                    lastname=lastname, othernames=othernames, phone_number=phone, isadmin=isadmin)
+        try:
+            user = USER.add(username=username, password=password, email=email,
+                            firstname=firstname, lastname=lastname, othernames=othernames,
+                            phone_number=phone, isadmin=isadmin)
+        except HashPoolBusy:
+            return raise_error(503, "The server is busy. Please try again later")
     
-        access_token = create_access_token(identity=username, fresh=True)
+        access_token = create_access_token(identity=user, fresh=True)
         refresh_token = create_refresh_token(identity=username)
 
         return {
@@ -102,29 +104,31 @@ class Login(Resource):
         """
         USER = User()
 
-        data = login_parser.parse_args()
-        username = data.get('username')
-        password = data.get('password')
-
-        if username is None:
-            return raise_error(400, "Missing 'username' in body")
-        if password is None:
-            return raise_error(400, "Missing 'password' in body")
+        try:
+            data = login_schema.parse()
+        except Invalid as error:
+            return error.response()
+        username = data['username']
+        password = data['password']
 
         #: Get the user object -  a dictionary
-        user = USER.by_username(username)
+        #: Read past the cache, which does not hold password hashes
+        user = USER.by_username(username, cached=False)
         p_hash = user.get('password_hash', '')
 
         #: validate password
-        if not user or not USER.check_password(p_hash, password):
-            return raise_error(401, "Invalid username or password")
+        try:
+            if not user or not USER.check_password(p_hash, password):
+                return raise_error(401, "Invalid username or password")
+            #: Upgrade hashes made before PASSWORD_HASH_METHOD was changed
+            USER.rehash_password(user, password)
+        except HashPoolBusy:
+            return raise_error(503, "The server is busy. Please try again later")
 
         #: create tokens
-        access_token = create_access_token(identity=username, fresh=True)
+        access_token = create_access_token(identity=user, fresh=True)
         refresh_token = create_refresh_token(identity=username)
-        user = {field_name: field_val for field_name, field_val
-                in user.items() if field_name != 'password_hash'}
-        user = update_createdon(user)
+        user = update_createdon(user.without('password_hash'))
 
         return {
             'status': 200,
@@ -144,8 +148,12 @@ class RefreshToken(Resource):
         """
         Returns a new access token
         """
-        current_user = get_jwt_identity()
-        new_token = create_access_token(identity=current_user, fresh=False)
+        #: Read the user again, uncached, so the new token carries
+        #: current claims
+        user = User().by_username(get_jwt_identity(), cached=False)
+        if not user:
+            return raise_error(401, "User no longer exists")
+        new_token = create_access_token(identity=user, fresh=False)
         return {
             'status': 200,
             'data': [{'access_token': new_token
@@ -163,11 +171,8 @@ class LogoutAccess(Resource):
         Revokes the current user's access token by storing it in
         the blacklist table
         """
-        BLACLIST = Blacklist()
-
-        # jti: json token identifier (unique identifier)
-        jti = get_raw_jwt()['jti']
-        BLACLIST.add(jti=jti)
+        # jti, the json token identifier, is stored in the blacklist
+        revoke_token(get_raw_jwt())
     
         return {
             "status": 200,
@@ -185,13 +190,8 @@ class LogoutRefresh(Resource):
         Revokes the current user's refresh token
         """
 
-        BLACLIST = Blacklist()
-
-        # jti: json token identifier
-        jti = get_raw_jwt()['jti']
-
-        #: store jti in the database
-        BLACLIST.add(jti=jti)
+        #: store the token's jti in the database
+        revoke_token(get_raw_jwt())
         
         return {
             "status": 200,
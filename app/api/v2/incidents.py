@@ -6,19 +6,94 @@
 
 """
 
-from flask_restful import Resource, reqparse, url_for
-from flask import current_app
-from flask_jwt_extended import jwt_required, get_jwt_identity, fresh_jwt_required
+from flask_restful import Resource, url_for
+from flask import current_app, request
+from flask_jwt_extended import jwt_required, fresh_jwt_required
 from app.utils import (valid_location, valid_comment, valid_status,
-                           update_createdon, raise_error)
+                           update_createdon, raise_error, get_current_user, is_admin,
+                           encode_cursor, decode_cursor, stream_collection, parse_fields, only,
+                           parse_datetime, make_etag, validators, not_modified, page_version)
+from app.encoding import output_rendered
 from app.helpers import send_email
 from app.models import Record, User
+from app.schema import INVALID, Field, Invalid, Schema
+
+
+LOCATION_ERROR = ("Invalid location. Either it is empty,"
+                  "does not conform to 'lat, long' format"
+                  "or exceeds valid ranges(+/- 90, +/- 180)")
+
+#: create incident schema
+create_incident_schema = Schema(
+    Field('comment', required=True, missing='comment not provided', check=valid_comment,
+          invalid="Invalid  comment. Check that the comment "
+                  "is not empty/blank and that it has meaningful words"),
+    Field('location', required=True, missing='location not provided', check=valid_location,
+          invalid="Invalid location. Check that the location field"
+                  "is not empty and that it has a 'lat,long' format"
+                  "and is within valid ranges (+/-90, +/-180)."),
+    strict=True)
+
+#: update incident schemas, by the field updated
+update_incident_schemas = {
+    'location': Schema(Field('location', required=True, check=valid_location,
+                             invalid=LOCATION_ERROR, clean=True), strict=True),
+    'comment': Schema(Field('comment', required=True, check=valid_comment,
+                            invalid='comment field should not be empty', clean=True),
+                      strict=True),
+    'status': Schema(Field('status', required=True, check=valid_status,
+                           invalid="Invalid status type. Status is either empty or "
+                                   "is not one of 'resolved','under investigation' or"
+                                   " 'unresolved' ", clean=True),
+                     strict=True),
+}
+
+
+def incident_filters(incident_type, args):
+    """
+    Returns the conditions for listing incidents of the given type
+    from the query parameters:
+
+        status=<status>
+        from=<date or datetime>, to=<date or datetime> (createdon range)
+        createdby=<user id>
 
+    Raises ValueError if a parameter is invalid
+    """
+    conditions = [('type', '=', incident_type)]
+    status = args.get('status')
+    if status is not None:
+        if not (valid_status(status) or status.lower() == 'draft'):
+            raise ValueError("Invalid status filter")
+        conditions.append(('status', 'ieq', status))
+    if args.get('from'):
+        conditions.append(('createdon', '>=', parse_datetime(args['from'])))
+    if args.get('to'):
+        conditions.append(('createdon', '<', parse_datetime(args['to'])))
+    if args.get('createdby') is not None:
+        if not args['createdby'].isnumeric():
+            raise ValueError("Invalid createdby filter. Should be a user id")
+        conditions.append(('createdby', '=', int(args['createdby'])))
+    return conditions
+
+
+def page_args(args, ranked=False):
+    """
+    Returns the page size and the key to start after from the limit
+    and cursor query parameters. Raises ValueError if they are invalid.
 
-#: create incident parser
-create_incident_parser = reqparse.RequestParser()
-create_incident_parser.add_argument('comment', type=str, required=True, help='comment not provided')
-create_incident_parser.add_argument('location', type=str, required=True, help='location not provided')
+    ranked -> True if the cursor should come from a page of search results
+    """
+    limit = args.get('limit', current_app.config['PAGE_SIZE'], type=int)
+    if not 0 < limit <= current_app.config['MAX_PAGE_SIZE']:
+        raise ValueError("Invalid limit. It should be between 1 and "
+                         "{}".format(current_app.config['MAX_PAGE_SIZE']))
+    after = None
+    if args.get('cursor'):
+        after = decode_cursor(args['cursor'])
+        if isinstance(after[0], float) != ranked:
+            raise ValueError('Invalid cursor')
+    return limit, after
 
 
 class Incidents(Resource):
@@ -35,34 +110,26 @@ class Incidents(Resource):
         if _id is not None:
             return raise_error(405, 'Method not allowed for the requested URL')
         #: Initialize database access objects
-        USER = User()
         RECORD = Record()
 
         if incident_type not in ('red-flags', 'interventions'):
             return raise_error(404, "The requested url cannot be found")
         incident_type = incident_type[:-1]
 
-        data = create_incident_parser.parse_args(strict=True)
-        location = data.get('location')
-        comment = data.get('comment')
-
-        if not valid_location(location):
-            return raise_error(400, "Invalid location. Check that the location field"
-                                    "is not empty and that it has a 'lat,long' format"
-                                    "and is within valid ranges (+/-90, +/-180).")
-        if not valid_comment(comment):
-            return raise_error(400, "Invalid  comment. Check that the comment "
-                                    "is not empty/blank and that it has meaningful words")
+        try:
+            data = create_incident_schema.parse()
+        except Invalid as error:
+            return error.response()
 
-        current_user = get_jwt_identity()
-        user_id = USER.filter_by('username', current_user)[0].get('id')
+        user_id = get_current_user()['id']
 
+        #: The record's uri is the collection's url followed by its id
+        uri_prefix = url_for('v2.incidents', incident_type=incident_type + 's',
+                             _external=True) + '/'
         record = RECORD.add(location=data['location'], comment=data['comment'],
-                        _type=incident_type, user_id=int(user_id))
-        record_id = RECORD.get_last_inserted_id()
-        uri = url_for('v2.incidents',
-                      incident_type=incident_type + 's', _id=record_id, _external=True)
-        RECORD.update(record_id, 'uri', uri)
+                        _type=incident_type, user_id=int(user_id), uri_prefix=uri_prefix)
+        record_id = record['id']
+        uri = record['uri']
 
         output = {}
         output['id'] = record_id
@@ -80,35 +147,123 @@ class Incidents(Resource):
         Returns a single incident record
         """
         #: Initialize database access objects
-        USER = User()
         RECORD = Record()
 
         if incident_type not in ('red-flags', 'interventions'):
             return raise_error(404, "The requested url cannot be found")
 
+        #: Sparse fieldsets: ?fields=id,location,status
+        try:
+            fields = parse_fields(request.args.get('fields'), Record.FIELDS)
+        except ValueError as error:
+            return raise_error(400, str(error))
+
         if _id is None:
-            incidents = RECORD.filter_by('type', incident_type[:-1])
-            incidents = list(map(update_createdon, incidents))
+            try:
+                conditions = incident_filters(incident_type[:-1], request.args)
+            except ValueError as error:
+                return raise_error(400, str(error))
+
+        #: Full text search on comments: ?q=<words>
+        text = request.args.get('q', '').strip() if _id is None else ''
+
+        if _id is None:
+            #: Keyset pagination: ?limit=<n>&cursor=<next cursor of previous page>
+            try:
+                limit, after = page_args(request.args, ranked=bool(text))
+            except ValueError as error:
+                return raise_error(400, str(error))
+            stream = request.args.get('stream') in ('1', 'true')
+            if stream and text:
+                return raise_error(400, "Search results cannot be streamed")
+
+            if stream:
+                #: Conditional GET of the whole collection: any change to the
+                #: matching records changes their latest update time or count
+                version = RECORD.version(conditions)
+                etag = make_etag(version['updatedon'], version['count'], request.query_string)
+                response = not_modified(etag, version['updatedon'])
+                if response is not None:
+                    return response
+                headers = validators(etag, version['updatedon'])
+            elif request.if_none_match or request.if_modified_since:
+                #: Conditional GET of a page: read the keys of its records
+                #: alone, from the index, to compare the page's tag
+                if text:
+                    keys, last = RECORD.search(conditions, text, limit, after, ['updatedon'])
+                else:
+                    keys, last = RECORD.page(conditions, limit, after, ['updatedon'])
+                response = not_modified(*page_version(keys, last))
+                if response is not None:
+                    return response
+
+        #: Let the database render rows as JSON, see Model.json_object
+        rendered = current_app.config.get('DB_RENDERING', False)
+
+        if _id is None and stream:
+            #: The whole collection, streamed from a server-side cursor
+            if rendered:
+                incidents = RECORD.iter_filtered(conditions, fields, rendered=True)
+                response = stream_collection(incidents, encoded=True)
+            else:
+                incidents = RECORD.iter_filtered(conditions, fields)
+                response = stream_collection(map(update_createdon, incidents))
+            response.headers.extend(headers)
+            return response
+
+        if _id is None:
+
+            #: The page is tagged from the id and update time of its records
+            columns = fields + ['updatedon'] if 'updatedon' not in fields else fields
+            if text:
+                #: Best matches first, each with its rank
+                incidents, last = RECORD.search(conditions, text, limit, after, columns)
+                headers = validators(*page_version(incidents, last))
+                incidents = [only(update_createdon(incident), fields + ['rank'])
+                             for incident in incidents]
+            elif rendered:
+                incidents, last, keys = RECORD.page_rendered(conditions, limit, after, fields)
+                headers = validators(*page_version(keys, last))
+                return output_rendered(incidents, 200, headers,
+                                       next=encode_cursor(last) if last else None)
+            else:
+                incidents, last = RECORD.page(conditions, limit, after, columns)
+                headers = validators(*page_version(incidents, last))
+                incidents = [only(update_createdon(incident), fields) for incident in incidents]
 
             return {'status': 200,
-                    'data': incidents
-                   }
-        print(_id)
+                    'data': incidents,
+                    'next': encode_cursor(last) if last else None
+                   }, 200, headers
         if not _id.isnumeric():
             return raise_error(400, "Invalid ID. Should be an Integer")
 
         incident_id = int(_id)
         incident_type = incident_type[:-1] # Remove the last 's' from name
-        incident = RECORD.filter_by('id', incident_id)
+
+        if request.if_none_match or request.if_modified_since:
+            #: Answer a conditional GET from the update time alone
+            current = RECORD.by_id(incident_id, ['type', 'updatedon'])
+            if current and current[0]['type'] == incident_type:
+                updatedon = current[0]['updatedon']
+                response = not_modified(make_etag(incident_id, updatedon, request.query_string),
+                                        updatedon)
+                if response is not None:
+                    return response
+
+        incident = RECORD.by_id(incident_id, fields + [f for f in ('type', 'updatedon')
+                                                       if f not in fields])
         if not incident or incident[0]['type'] != incident_type:
             return raise_error(404, "{} not found".format(incident_type))
 
-        incident = update_createdon(incident[0])
+        updatedon = incident[0]['updatedon']
+        headers = validators(make_etag(incident_id, updatedon, request.query_string), updatedon)
+        incident = only(update_createdon(incident[0]), fields)
 
         output = {'status': 200,
                   'data': incident
                  }
-        return output
+        return output, 200, headers
 
     @fresh_jwt_required
     def delete(self, incident_type, _id):
@@ -117,15 +272,12 @@ class Incidents(Resource):
         """
 
         #: Initialize database access objects
-        USER = User()
         RECORD = Record()
 
         if not _id.isnumeric():
             return raise_error(400, "ID should be an integer")
 
-        username = get_jwt_identity()
-        user = USER.filter_by('username', username)[0]
-        user_id = user.get('id')
+        user_id = get_current_user()['id']
 
         if incident_type not in ('red-flags', 'interventions'):
             return raise_error(404, "The requested url cannot be found")
@@ -167,36 +319,17 @@ class UpdateIncident(Resource):
         if field not in ('location', 'comment', 'status'):
             return raise_error(400, "Invalid field name")
 
-        #: Initialize a parser to collect user input
-        parser = reqparse.RequestParser()
-        parser.add_argument(field, type=str, required=True)
-
         #:
         #: Validate user input
         #:
 
         try:
-            data = parser.parse_args(strict=True)
-        except:
-            error_msg = "Invalid input data. Only {} field should be provided".format(field)
-            return raise_error(400, error_msg)
-
-        new_field_value = data.get(field)
-        if field == 'location':
-            new_field_value = valid_location(new_field_value)
-            error_msg = ("Invalid location. Either it is empty,"
-                         "does not conform to 'lat, long' format"
-                         "or exceeds valid ranges(+/- 90, +/- 180)")
-        elif field == 'comment':
-            new_field_value = valid_comment(new_field_value)
-            error_msg = 'comment field should not be empty'
-        elif field == 'status':
-            new_field_value = valid_status(new_field_value)
-            error_msg = ("Invalid status type. Status is either empty or "
-                         "is not one of 'resolved','under investigation' or"
-                         " 'unresolved' ")
-        if not new_field_value:
-            return raise_error(400, error_msg)
+            new_field_value = update_incident_schemas[field].parse()[field]
+        except Invalid as error:
+            if error.kind != INVALID:
+                error_msg = "Invalid input data. Only {} field should be provided".format(field)
+                return raise_error(400, error_msg)
+            return error.response()
 
         #: Get incident record to be updated
         incident = RECORD.filter_by('id', _id)
@@ -205,15 +338,14 @@ class UpdateIncident(Resource):
         createdby = incident[0].get('createdby')
 
         #: Get ID of user accessing endpoint
-        username = get_jwt_identity()
-        user = USER.filter_by('username', username)[0]
-        user_id = user.get('id')
+        user = get_current_user()
+        user_id = user['id']
         
         #: Check for pemissions
         if field != 'status' and user_id != createdby:
             return raise_error(403, "You can only update {} field of "
                                     "your own record.".format(field))
-        if field == 'status' and not user.get('isadmin'):
+        if field == 'status' and not is_admin(user):
             return raise_error(403, "Request forbidden")
 
         #: All relevant checks have passed by this stage, update appropriate field
@@ -225,7 +357,9 @@ class UpdateIncident(Resource):
         output['data'] = [{"id": _id, "message": msg}]
 
         if field == 'status':
-            user_email = user.get('email')
+            #: The token's claims carry no email, read it by id
+            admin = USER.by_id(user_id)
+            user_email = admin[0].get('email') if admin else None
             if user_email:
                 msg = msg + ' to ' + new_field_value
                 send_email(subject="Status Update",
@@ -233,4 +367,83 @@ class UpdateIncident(Resource):
                            recipients=[user_email],
                            body=msg)
                 
-        return output
\ No newline at end of file
+        return output
+
+
+class IncidentsWithin(Resource):
+    """
+    Returns the incidents located inside a bounding box
+    """
+
+    @jwt_required
+    def get(self, incident_type):
+        """
+        Returns a page of the incidents inside
+        ?bbox=<min lat>,<min long>,<max lat>,<max long>, newest first.
+        Accepts the same filters, fields, limit and cursor parameters
+        as the incident collection.
+        """
+        if incident_type not in ('red-flags', 'interventions'):
+            return raise_error(404, "The requested url cannot be found")
+        try:
+            bbox = [float(c) for c in request.args.get('bbox', '').split(',')]
+            assert len(bbox) == 4
+            assert -90 <= bbox[0] <= bbox[2] <= 90
+            assert -180 <= bbox[1] <= bbox[3] <= 180
+        except (AssertionError, ValueError):
+            return raise_error(400, "Invalid bbox. Use 'min lat,min long,max lat,max long' "
+                                    "within valid ranges (+/-90, +/-180).")
+        try:
+            fields = parse_fields(request.args.get('fields'), Record.FIELDS)
+            conditions = incident_filters(incident_type[:-1], request.args)
+            limit, after = page_args(request.args)
+        except ValueError as error:
+            return raise_error(400, str(error))
+
+        incidents, last = Record().within(conditions, bbox, limit, after, fields)
+        incidents = [only(update_createdon(incident), fields) for incident in incidents]
+        return {'status': 200,
+                'data': incidents,
+                'next': encode_cursor(last) if last else None
+               }
+
+
+class IncidentsNearby(Resource):
+    """
+    Returns the incidents located near a point
+    """
+
+    @jwt_required
+    def get(self, incident_type):
+        """
+        Returns up to `limit` incidents within ?radius=<metres> of
+        ?lat=<latitude>&long=<longitude>, nearest first, with their
+        distance in metres. Accepts the same filters and fields as the
+        incident collection.
+        """
+        if incident_type not in ('red-flags', 'interventions'):
+            return raise_error(404, "The requested url cannot be found")
+        max_radius = current_app.config['MAX_SEARCH_RADIUS']
+        latitude = request.args.get('lat', type=float)
+        longitude = request.args.get('long', type=float)
+        radius = request.args.get('radius', type=float)
+        if latitude is None or longitude is None or not valid_location(
+                '{},{}'.format(latitude, longitude)):
+            return raise_error(400, "Invalid point. Provide lat and long within "
+                                    "valid ranges (+/-90, +/-180).")
+        if radius is None or not 0 < radius <= max_radius:
+            return raise_error(400, "Invalid radius. It should be between 0 and "
+                                    "{} metres".format(max_radius))
+        try:
+            fields = parse_fields(request.args.get('fields'), Record.FIELDS)
+            conditions = incident_filters(incident_type[:-1], request.args)
+            limit, _ = page_args(request.args)
+        except ValueError as error:
+            return raise_error(400, str(error))
+
+        incidents = Record().nearby(conditions, latitude, longitude, radius, limit, fields)
+        incidents = [only(update_createdon(incident), fields + ['distance'])
+                     for incident in incidents]
+        return {'status': 200,
+                'data': incidents
+               }
@@ -0,0 +1,41 @@
+'''
+	app.api.v2.stats
+	------------------
+
+	API endpoint exposing runtime statistics for monitoring
+'''
+from flask_restful import Resource
+from flask_jwt_extended import jwt_required
+from app.decorators import admin_required
+from app.db.db import pool_stats
+from app.revocation import get_revocation_cache
+from app.usercache import get_user_cache
+from app.passwords import get_hash_pool
+from app.mailer import get_mailer
+
+
+class Stats(Resource):
+    """
+    Endpoint for returning the worker's runtime statistics
+    """
+
+    @admin_required
+    @jwt_required
+    def get(self):
+        """
+        Returns statistics of the worker serving the request
+        """
+        stats = {'db_pool': pool_stats(),
+                 'hash_pool': get_hash_pool().stats()}
+        revocation_cache = get_revocation_cache()
+        if revocation_cache is not None:
+            stats['revocation_cache'] = revocation_cache.stats()
+        mailer = get_mailer()
+        if mailer is not None:
+            stats['mailer'] = mailer.stats()
+        user_cache = get_user_cache()
+        if user_cache is not None:
+            stats['user_cache'] = user_cache.stats()
+        return {'status': 200,
+                'data': [stats]
+               }
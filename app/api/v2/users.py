@@ -5,11 +5,14 @@
 	API endpoints for for obtaining information about
 	the current user and for listing all registered users
 '''
+from flask import current_app, request
 from flask_restful import Resource
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
+from app.encoding import output_rendered
 from app.models import User as USER_MODEL
 from app.decorators import admin_required
-from app.utils import update_createdon
+from app.utils import (update_createdon, get_current_user, raise_error, stream_collection,
+                       parse_fields)
 
 
 class User(Resource):
@@ -25,10 +28,17 @@ class User(Resource):
 
         USER = USER_MODEL()
 
-        user_identity = get_jwt_identity()
-        user = USER.filter_by('username', user_identity)[0] # A list with user object
+        try:
+            fields = parse_fields(request.args.get('fields'), USER_MODEL.FIELDS)
+        except ValueError as error:
+            return raise_error(400, str(error))
 
-        data = update_createdon(user)
+        current_user = get_current_user()
+        user = USER.by_id(current_user['id'], fields) if current_user else []
+        if not user:
+            return raise_error(404, "User not found")
+
+        data = update_createdon(user[0])
 
         return {'status': 200,
                 'data': [data]
@@ -48,7 +58,24 @@ class Users(Resource):
         """
         USER = USER_MODEL()
 
-        users = USER.all()
+        try:
+            fields = (parse_fields(request.args['fields'], USER_MODEL.FIELDS)
+                      if request.args.get('fields') else None)
+        except ValueError as error:
+            return raise_error(400, str(error))
+
+        #: Let the database render rows as JSON, see Model.json_object
+        rendered = current_app.config.get('DB_RENDERING', False)
+
+        if request.args.get('stream') in ('1', 'true'):
+            if rendered:
+                return stream_collection(USER.iter_all(fields, rendered=True), encoded=True)
+            return stream_collection(map(update_createdon, USER.iter_all(fields)))
+
+        if rendered:
+            return output_rendered(USER.all(fields, rendered=True))
+
+        users = list(map(update_createdon, USER.all(fields)))
 
         return {'status': 200,
                 'data': users
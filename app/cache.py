@@ -0,0 +1,130 @@
+"""
+    app.cache
+    ~~~~~~~~~
+
+    In-process data structures for caching database lookups
+
+"""
+
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+class BloomFilter:
+    """
+    A fixed size set membership filter. It never reports a false
+    negative; false positives occur at about `error_rate` once
+    `capacity` items have been added.
+    """
+
+    def __init__(self, capacity=100000, error_rate=0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        #: Number of items added
+        self.count = 0
+
+    def _positions(self, item):
+        #: md5 only spreads the bits here; hashlib.blake2b would do, but
+        #: needs Python 3.6
+        digest = hashlib.md5(item.encode('utf-8')).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        """
+        Adds an item (a string) to the filter
+        """
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7))
+                   for pos in self._positions(item))
+
+
+class LRUCache:
+    """
+    A thread-safe, bounded mapping that evicts the least recently used
+    entry when full and, optionally, entries older than `ttl` seconds.
+    Hits and misses are counted for monitoring.
+    """
+
+    #: Returned by get when a key is not cached
+    MISSING = object()
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=MISSING):
+        """
+        Returns the value cached for key or default
+        """
+        with self._lock:
+            try:
+                value, stored = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if self.ttl is not None and time.time() - stored > self.ttl:
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """
+        Caches value under key
+        """
+        with self._lock:
+            self._data[key] = (value, time.time())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """
+        Removes key from the cache if present
+        """
+        with self._lock:
+            self._data.pop(key, None)
+
+    def items(self):
+        """
+        Returns a list of the cached (key, value) pairs
+        """
+        with self._lock:
+            return [(key, value) for key, (value, _) in self._data.items()]
+
+    def clear(self):
+        """
+        Removes all entries
+        """
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """
+        Returns the cache's size and hit/miss counters
+        """
+        return {'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses}
@@ -0,0 +1,99 @@
+"""
+    app.compression
+    ~~~~~~~~~~~~~~~
+
+    Compression of JSON responses.
+
+    Responses of COMPRESS_ENDPOINTS in COMPRESS_MIMETYPES are compressed
+    with the best coding the client accepts: brotli when the brotli
+    package is installed, otherwise gzip. Only the collection endpoints
+    are listed: compressing responses that carry secrets, such as the
+    tokens of the auth endpoints, next to data the client sent would
+    let an attacker who sees their size guess them (BREACH). Buffered responses smaller than COMPRESS_MIN_SIZE
+    bytes are sent as they are, since compressing them saves little.
+    Streamed responses are compressed as they are sent, so large
+    listings are never held in memory.
+
+"""
+
+import zlib
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+
+def _gzip_compressor(level):
+    #: wbits 16 + 15 writes a gzip header and trailer
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+
+def _brotli_compressor(quality):
+    compressor = brotli.Compressor(quality=quality)
+    return compressor.process, compressor.finish
+
+
+def choose_encoding(accept_encodings):
+    """
+    Returns the coding to use for a request's Accept-Encoding, or None
+    """
+    codings = ['br', 'gzip'] if brotli is not None else ['gzip']
+    qualities = [(accept_encodings[coding], coding) for coding in codings]
+    #: Prefer the earlier coding on equal quality
+    quality, coding = max(qualities, key=lambda item: (item[0], -codings.index(item[1])))
+    return coding if quality > 0 else None
+
+
+def _compress_stream(chunks, compress, flush):
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = compress(chunk)
+            if data:
+                yield data
+        yield flush()
+    finally:
+        #: Let the wrapped iterable release its cursor and context
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def compress_response(response):
+    """
+    Compresses response if the client accepts a supported coding
+    """
+    config = current_app.config
+    if (not config.get('COMPRESS', True) or request.endpoint not in config.get(
+            'COMPRESS_ENDPOINTS', ()) or response.status_code in (204, 304)
+            or response.status_code < 200 or response.direct_passthrough
+            or response.mimetype not in config.get('COMPRESS_MIMETYPES', ('application/json',))
+            or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    coding = choose_encoding(request.accept_encodings)
+    if coding is None:
+        return response
+    if coding == 'br':
+        compress, flush = _brotli_compressor(config.get('COMPRESS_BROTLI_QUALITY', 4))
+    else:
+        compress, flush = _gzip_compressor(config.get('COMPRESS_LEVEL', 6))
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, compress, flush)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config.get('COMPRESS_MIN_SIZE', 500):
+            return response
+        response.set_data(compress(data) + flush())
+    response.headers['Content-Encoding'] = coding
+    return response
+
+
+def init_app(app):
+    app.after_request(compress_response)
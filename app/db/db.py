@@ -6,96 +6,105 @@ Functiond for setting up the database
 
 """
 
+import random
+import threading
+
 import click
 from flask import current_app, g
 from flask.cli import with_appcontext
 import psycopg2
 from config import Config
+from app.db.pool import ConnectionPool
+from app.db import migrations
+
+_pool_lock = threading.Lock()
+
+
+def get_pool(app=None, dsn=None):
+    """
+    Returns the connection pool for `dsn` (the primary database by
+    default), creating it on first use
+    """
+    app = app or current_app._get_current_object()
+    pools = app.extensions.setdefault('db_pools', {})
+    primary = app.config['DATABASE']
+    dsn = dsn or primary
+    pool = pools.get(dsn)
+    if pool is None:
+        with _pool_lock:
+            pool = pools.get(dsn)
+            if pool is None:
+                pool = ConnectionPool(
+                    dsn,
+                    minconn=app.config.get('DATABASE_POOL_MIN', 1),
+                    maxconn=app.config.get('DATABASE_POOL_MAX', 10),
+                    timeout=app.config.get('DATABASE_POOL_TIMEOUT', 30),
+                    max_age=app.config.get('DATABASE_POOL_MAX_AGE', 0),
+                    readonly=dsn != primary
+                    )
+                pools[dsn] = pool
+    return pool
+
+
+def pool_stats():
+    """
+    Returns usage statistics of the current app's connection pools
+    """
+    stats = get_pool().stats()
+    replicas = current_app.config.get('DATABASE_REPLICAS') or []
+    if replicas:
+        stats['replicas'] = [get_pool(dsn=dsn).stats() for dsn in replicas]
+    return stats
+
+
+def get_db(readonly=False):
+    """
+    Returns the connection checked out for the current app context.
+
+    Read-only callers are routed to one of DATABASE_REPLICAS when
+    configured. Once the primary connection has been checked out,
+    reads stick to it for the rest of the app context so a request
+    always reads its own writes.
+    """
+    if readonly and 'db' not in g:
+        replicas = current_app.config.get('DATABASE_REPLICAS')
+        if replicas:
+            if 'replica_db' not in g:
+                dsn = random.choice(replicas)
+                try:
+                    g.replica_db = get_pool(dsn=dsn).getconn()
+                    g.replica_dsn = dsn
+                except psycopg2.OperationalError:
+                    #: Fall back to the primary if the replica is down
+                    return get_db()
+            return g.replica_db
 
-
-def get_db():
-    
     if 'db' not in g:
-        g.db = psycopg2.connect(
-                current_app.config['DATABASE']
-                )
+        g.db = get_pool().getconn()
 
     return g.db
 
 
 def close_db(e=None):
+    """
+    Returns the app context's connections to their pools
+    """
     db = g.pop('db', None)
 
     if db is not None:
-        db.close()
-
-
-def create_records():
-    
-    query = """
-            create table if not exists records (
-            id serial primary key,
-            type varchar(50) not null,
-            comment varchar(140) not null,
-            location varchar(30) not null,
-            status varchar(50) not null,
-            createdon timestamp with time zone not null default now(),
-            images varchar(120)[] not null,
-            videos varchar(120)[] not null,
-            uri varchar(140),
-            createdby integer not null,
-            user_id integer references users(id) on delete cascade not null
-            );
-        """
-
-    db = get_db()
-    with db:
-        with db.cursor() as cursor:
-            cursor.execute(query)
-
-def create_users():
-
-    query = """
-            create table if not exists users (
-            id serial primary key,
-            username varchar(80) not null,
-            email varchar(100) not null,
-            createdOn timestamp with time zone not null,
-            firstname varchar(100) not null,
-            lastname varchar(100) not null,
-            othernames varchar(100) not null,
-            phoneNumber varchar(100) not null,
-            isAdmin boolean not null,
-            password_hash varchar(100) not null
-            );"""
-
-    db = get_db()
-    with db:
-        with db.cursor() as cursor:
-            cursor.execute(query)
+        get_pool().putconn(db)
 
-def create_blacklist():
-    query = """
-            create table if not exists blacklist (
-            id serial primary key,
-            jti varchar(140) not null
-            );"""
+    replica_db = g.pop('replica_db', None)
+    if replica_db is not None:
+        get_pool(dsn=g.pop('replica_dsn')).putconn(replica_db)
 
-    db = get_db()
-    with db:
-        with db.cursor() as cursor:
-            cursor.execute(query)
 
 def init_db():
-    # db = get_db()
-
-    # with current_app.open_resource('db/schema.sql') as f:
-    #     with db.cursor() as cursor:
-    #         cursor.execute(f.read().decode('utf8'))
-
-    create_records()
-    create_users()
-    create_blacklist()
+    """
+    Brings the database schema up to date. Returns the versions of
+    the migrations that were applied.
+    """
+    return migrations.upgrade(get_db())
 
 
 def clear_tables():
@@ -105,6 +114,8 @@ def clear_tables():
             cursor.execute("""delete from users;""")
             cursor.execute("""delete from records;""")
             cursor.execute("""delete from blacklist;""")
+            cursor.execute("""delete from jobs;""")
+            cursor.execute("""delete from dead_jobs;""")
         db.commit()
 
 def rollback():
@@ -118,10 +129,46 @@ def rollback():
 @click.command('init-db')
 @with_appcontext
 def init_db_command():
-    """Clear the existing data and create new tables."""
+    """Create the tables if they do not exist yet."""
     init_db()
     click.echo('Initialized the database')
 
+@click.command('db-upgrade')
+@with_appcontext
+def db_upgrade_command():
+    """Apply all pending schema migrations."""
+    applied = init_db()
+    for version in applied:
+        click.echo('Applied migration {}'.format(version))
+    click.echo('Database schema is at version {}'.format(migrations.latest_version()))
+
+@click.command('db-status')
+@with_appcontext
+def db_status_command():
+    """Show the schema version and pending migrations."""
+    conn = get_db()
+    click.echo('Database schema is at version {}'.format(migrations.current_version(conn)))
+    for version, description, _ in migrations.pending(conn):
+        click.echo('Pending migration {}: {}'.format(version, description))
+
+@click.command('prune-blacklist')
+@with_appcontext
+def prune_blacklist_command():
+    """Delete revoked tokens that have already expired."""
+    from app.models import Blacklist
+    deleted = Blacklist().prune()
+    click.echo('Pruned {} expired tokens'.format(deleted))
+
+@click.command('worker')
+@click.option('--processes', default=1, help='Number of worker processes')
+@click.option('--burst', is_flag=True, help='Exit once the queue is empty')
+@with_appcontext
+def worker_command(processes, burst):
+    """Run queued jobs."""
+    from app.jobs import run_workers
+    done = run_workers(current_app._get_current_object(), processes, burst)
+    click.echo('Ran {} jobs'.format(done))
+
 @click.command('clear-all-db')
 @with_appcontext
 def clear_all_db_command():
@@ -143,5 +190,9 @@ def init_app(app):
     app.teardown_appcontext(close_db)
     # add a new command that can be called with flask command
     app.cli.add_command(init_db_command)
+    app.cli.add_command(db_upgrade_command)
+    app.cli.add_command(db_status_command)
+    app.cli.add_command(prune_blacklist_command)
+    app.cli.add_command(worker_command)
     app.cli.add_command(rollback_db_command)
     app.cli.add_command(clear_all_db_command)
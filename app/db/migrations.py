@@ -0,0 +1,320 @@
+"""
+app.db.migrations
+~~~~~~~~~~~~~~~~~
+
+Versioned schema migrations.
+
+Each migration is a (version, description, sql) tuple, where sql is
+a string or a function taking a cursor for changes that need Python.
+Migrations are applied in order, each in its own transaction, and
+recorded in the schema_version table. Functions marked with
+@outside_transaction get the connection instead and commit as they go,
+for backfills and index builds that must not lock a busy table. Never edit a migration that has been released;
+add a new one instead.
+
+"""
+
+from psycopg2.extras import execute_values
+from app import geo
+
+#: Lock key used to stop concurrent upgrades (e.g. several dynos
+#: running `flask init-db` at once)
+LOCK_KEY = 7130013
+
+
+def outside_transaction(func):
+    """
+    Marks a migration function that manages its own transactions. It
+    is called with the connection rather than a cursor, so it can
+    commit long backfills batch by batch and build indexes
+    concurrently. It must be safe to run again after failing part way.
+    """
+    func.transaction = False
+    return func
+
+
+def create_index_concurrently(conn, name, definition):
+    """
+    Builds the index `name` without blocking writes to its table. An
+    invalid index left by an interrupted build is dropped first.
+    """
+    conn.commit()
+    autocommit = conn.autocommit
+    #: create index concurrently can't run inside a transaction
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("select indisvalid from pg_index where indexrelid = to_regclass(%s);",
+                           (name,))
+            row = cursor.fetchone()
+            if row is not None and not row[0]:
+                cursor.execute("drop index concurrently if exists {};".format(name))
+            cursor.execute("create index concurrently if not exists {} {};".format(name, definition))
+    finally:
+        conn.autocommit = autocommit
+
+
+def backfill_coordinates(conn, batch_size=5000):
+    """
+    Fills latitude, longitude and geohash of existing records from
+    their 'lat,long' location, committing each batch
+    """
+    last_id = 0
+    while True:
+        with conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""select id, location from records where id > %s
+                                  order by id limit %s;""", (last_id, batch_size))
+                rows = cursor.fetchall()
+                if not rows:
+                    return
+                last_id = rows[-1][0]
+                values = []
+                for _id, location in rows:
+                    point = geo.parse_location(location)
+                    if point is not None:
+                        values.append((_id, point[0], point[1], geo.encode(*point)))
+                if values:
+                    execute_values(cursor, """update records set latitude = v.latitude,
+                        longitude = v.longitude, geohash = v.geohash
+                        from (values %s) as v (id, latitude, longitude, geohash)
+                        where records.id = v.id;""", values)
+
+
+@outside_transaction
+def add_coordinates(conn):
+    """
+    Adds the coordinate columns to records, fills them and indexes
+    the geohash for prefix searches. The columns are added in a
+    transaction of their own, so records are locked only briefly.
+    """
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                alter table records add column if not exists latitude double precision;
+                alter table records add column if not exists longitude double precision;
+                alter table records add column if not exists geohash varchar(12);
+                """)
+    backfill_coordinates(conn)
+    create_index_concurrently(conn, 'records_type_geohash_idx',
+                              'on records (type, geohash text_pattern_ops)')
+
+
+@outside_transaction
+def add_search(conn, batch_size=5000):
+    """
+    Adds the full text search vector of record comments, kept up to
+    date by a trigger, and its GIN index. Existing records are filled
+    a batch per transaction once the trigger covers new ones.
+    """
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                alter table records add column if not exists search tsvector;
+                drop trigger if exists records_search_update on records;
+                create trigger records_search_update
+                    before insert or update of comment on records for each row
+                    execute procedure tsvector_update_trigger(search, 'pg_catalog.english', comment);
+                """)
+    last_id = 0
+    while last_id is not None:
+        with conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""update records set search = to_tsvector('pg_catalog.english', comment)
+                                  where id in (select id from records where id > %s
+                                               order by id limit %s)
+                                  returning id;""", (last_id, batch_size))
+                last_id = max((row[0] for row in cursor.fetchall()), default=None)
+    create_index_concurrently(conn, 'records_search_idx', 'on records using gin (search)')
+
+
+MIGRATIONS = [
+    (1, 'create users, records and blacklist tables', """
+        create table if not exists users (
+        id serial primary key,
+        username varchar(80) not null,
+        email varchar(100) not null,
+        createdOn timestamp with time zone not null,
+        firstname varchar(100) not null,
+        lastname varchar(100) not null,
+        othernames varchar(100) not null,
+        phoneNumber varchar(100) not null,
+        isAdmin boolean not null,
+        password_hash varchar(100) not null
+        );
+
+        create table if not exists records (
+        id serial primary key,
+        type varchar(50) not null,
+        comment varchar(140) not null,
+        location varchar(30) not null,
+        status varchar(50) not null,
+        createdon timestamp with time zone not null default now(),
+        images varchar(120)[] not null,
+        videos varchar(120)[] not null,
+        uri varchar(140),
+        createdby integer not null,
+        user_id integer references users(id) on delete cascade not null
+        );
+
+        create table if not exists blacklist (
+        id serial primary key,
+        jti varchar(140) not null
+        );
+        """),
+
+    (2, 'add indexes and unique constraints used by the models', """
+        create index if not exists records_type_createdon_idx
+            on records (type, createdon desc);
+        create index if not exists records_createdon_idx
+            on records (createdon desc);
+        create index if not exists records_createdby_idx
+            on records (createdby);
+        create index if not exists records_user_id_idx
+            on records (user_id);
+        create unique index if not exists users_username_key
+            on users (username);
+        create unique index if not exists users_email_key
+            on users (email) where email <> '';
+        create unique index if not exists blacklist_jti_key
+            on blacklist (jti);
+        """),
+
+    (3, 'store token expiry in the blacklist', """
+        alter table blacklist add column if not exists expires timestamp with time zone;
+        -- Tokens revoked before this migration expire within the
+        -- default refresh token lifetime
+        update blacklist set expires = now() + interval '30 days' where expires is null;
+        alter table blacklist alter column expires set not null;
+        create index if not exists blacklist_expires_idx on blacklist (expires);
+        """),
+
+    (4, 'version the claims carried in user tokens', """
+        alter table users add column if not exists claims_version integer not null default 1;
+        """),
+
+    (5, 'index records for keyset pagination by type', """
+        create index if not exists records_type_createdon_id_idx
+            on records (type, createdon desc, id desc);
+        drop index if exists records_type_createdon_idx;
+        """),
+
+    (6, 'index records for filtering by status and reporter', """
+        create index if not exists records_type_status_createdon_id_idx
+            on records (type, lower(status), createdon desc, id desc);
+        create index if not exists records_createdby_type_createdon_id_idx
+            on records (createdby, type, createdon desc, id desc);
+        drop index if exists records_createdby_idx;
+        """),
+
+    (7, 'store record coordinates and an indexed geohash', add_coordinates),
+
+    (8, 'index record comments for full text search', add_search),
+
+    (9, 'create the job queue tables', """
+        create table if not exists jobs (
+        id bigserial primary key,
+        task varchar(100) not null,
+        args jsonb not null default '{}',
+        attempts integer not null default 0,
+        max_attempts integer not null,
+        run_at timestamp with time zone not null default now(),
+        createdon timestamp with time zone not null default now(),
+        last_error text
+        );
+        create index if not exists jobs_run_at_id_idx on jobs (run_at, id);
+
+        create table if not exists dead_jobs (
+        id bigint primary key,
+        task varchar(100) not null,
+        args jsonb not null,
+        attempts integer not null,
+        createdon timestamp with time zone not null,
+        failedon timestamp with time zone not null default now(),
+        last_error text
+        );
+        """),
+
+    (10, 'track when records were last updated', """
+        alter table records add column if not exists updatedon timestamp with time zone;
+        update records set updatedon = createdon where updatedon is null;
+        alter table records alter column updatedon set default now();
+        alter table records alter column updatedon set not null;
+        create index if not exists records_type_updatedon_idx
+            on records (type, updatedon desc);
+        """),
+]
+
+
+def latest_version():
+    """
+    Returns the version the schema is at once all migrations are applied
+    """
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def current_version(conn):
+    """
+    Returns the version of the database schema. 0 if no migration
+    has been applied yet.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("select to_regclass('schema_version');")
+        if cursor.fetchone()[0] is None:
+            version = 0
+        else:
+            cursor.execute("select coalesce(max(version), 0) from schema_version;")
+            version = cursor.fetchone()[0]
+    conn.commit()
+    return version
+
+
+def pending(conn):
+    """
+    Returns the migrations that have not been applied yet
+    """
+    version = current_version(conn)
+    return [m for m in MIGRATIONS if m[0] > version]
+
+
+def upgrade(conn):
+    """
+    Applies all pending migrations and returns their versions.
+
+    This is a single cheap query when the schema is current.
+    """
+    if not pending(conn):
+        return []
+
+    applied = []
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute("select pg_advisory_lock(%s);", (LOCK_KEY,))
+    try:
+        with conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    create table if not exists schema_version (
+                    version integer primary key,
+                    description varchar(200) not null,
+                    appliedon timestamp with time zone not null default now()
+                    );""")
+        #: Re-read the version now that we hold the lock
+        for version, description, sql in pending(conn):
+            if not getattr(sql, 'transaction', True):
+                #: Commits as it goes, only the version is recorded below
+                sql(conn)
+            with conn:
+                with conn.cursor() as cursor:
+                    if isinstance(sql, str):
+                        cursor.execute(sql)
+                    elif getattr(sql, 'transaction', True):
+                        sql(cursor)
+                    cursor.execute("""insert into schema_version (version, description)
+                                      values (%s, %s);""", (version, description))
+            applied.append(version)
+    finally:
+        with conn:
+            with conn.cursor() as cursor:
+                cursor.execute("select pg_advisory_unlock(%s);", (LOCK_KEY,))
+    return applied
@@ -0,0 +1,188 @@
+"""
+app.db.pool
+~~~~~~~~~~~
+
+A small thread-safe PostgreSQL connection pool used by get_db.
+
+"""
+
+import os
+import threading
+import time
+
+import psycopg2
+from psycopg2 import extensions
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """
+    Raised when no connection could be checked out of the pool
+    within the configured timeout
+    """
+
+
+class ConnectionPool:
+    """
+    Keeps a bounded number of open connections to a single database
+    and hands them out to requests.
+
+    :param dsn: connection string passed to psycopg2.connect
+    :param minconn: number of connections opened up front
+    :param maxconn: maximum number of connections open at any time
+    :param timeout: seconds to wait for a free connection before
+                    raising PoolTimeout
+    :param max_age: seconds after which a connection is closed and
+                    replaced instead of being reused. 0 disables it.
+    :param readonly: open read-only autocommit sessions, e.g. for
+                     connections to a replica
+    """
+
+    def __init__(self, dsn, minconn=1, maxconn=10, timeout=30, max_age=0,
+                 readonly=False):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_age = max_age
+        self.readonly = readonly
+
+        self._lock = threading.Condition()
+        self._reset()
+        for _ in range(self.minconn):
+            self._idle.append((self._connect(), time.time()))
+
+    def _reset(self):
+        """
+        (Re)initialises the pool's state for the current process
+        """
+        self._pid = os.getpid()
+        #: idle connections as (connection, created) pairs
+        self._idle = []
+        #: checked out connections mapped to their creation time
+        self._used = {}
+        #: connections being opened, outside the lock
+        self._connecting = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._timeouts = 0
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn)
+        if self.readonly:
+            conn.set_session(readonly=True, autocommit=True)
+        return conn
+
+    def _check_pid(self):
+        """
+        Connections must never be shared across a fork (e.g. gunicorn
+        workers forked from a preloaded master). A child process starts
+        with a fresh pool and leaves the inherited sockets alone so that
+        the parent's connections are not torn down. Its connections
+        are opened as they are needed.
+        """
+        if self._pid != os.getpid():
+            #: Hold on to inherited connections so they are never
+            #: garbage collected (and closed) in the child
+            self._inherited = getattr(self, '_inherited', [])
+            self._inherited.extend(conn for conn, _ in self._idle)
+            self._inherited.extend(self._used)
+            self._reset()
+
+    def _expired(self, created):
+        return self.max_age and time.time() - created > self.max_age
+
+    def getconn(self):
+        """
+        Checks out a connection, opening a new one if none is idle and
+        the pool is not full. Blocks for up to `timeout` seconds
+        otherwise. New connections are opened without holding the lock,
+        so a slow server doesn't hold up the other checkouts.
+        """
+        with self._lock:
+            self._check_pid()
+            started = time.time()
+            waited = False
+            while not self._idle and len(self._used) + self._connecting >= self.maxconn:
+                remaining = self.timeout - (time.time() - started)
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout('Timed out waiting for a database connection')
+                waited = True
+                self._lock.wait(remaining)
+            if waited:
+                self._waits += 1
+                self._wait_time += time.time() - started
+
+            while self._idle:
+                conn, created = self._idle.pop()
+                if conn.closed or self._expired(created):
+                    conn.close()
+                    continue
+                self._used[conn] = created
+                return conn
+
+            #: Hold a slot for the new connection while it is opened
+            self._connecting += 1
+            pid = self._pid
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._lock:
+                if self._pid == pid:
+                    self._connecting -= 1
+                self._lock.notify()
+            raise
+        with self._lock:
+            if self._pid == pid:
+                self._connecting -= 1
+            self._used[conn] = time.time()
+        return conn
+
+    def putconn(self, conn, close=False):
+        """
+        Returns a connection to the pool. Any transaction left open is
+        rolled back so the next user gets a clean connection.
+        """
+        with self._lock:
+            if self._pid != os.getpid() or conn not in self._used:
+                return
+            created = self._used.pop(conn)
+            if not conn.closed:
+                status = conn.get_transaction_status()
+                if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                    close = True
+                elif status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            if close or conn.closed or self._expired(created):
+                conn.close()
+            else:
+                self._idle.append((conn, created))
+            self._lock.notify()
+
+    def closeall(self):
+        """
+        Closes every connection held by the pool
+        """
+        with self._lock:
+            for conn, _ in self._idle:
+                conn.close()
+            for conn in self._used:
+                conn.close()
+            self._idle = []
+            self._used = {}
+            self._lock.notify_all()
+
+    def stats(self):
+        """
+        Returns a snapshot of the pool's usage for monitoring
+        """
+        with self._lock:
+            return {
+                'in_use': len(self._used),
+                'idle': len(self._idle),
+                'connecting': self._connecting,
+                'max': self.maxconn,
+                'waits': self._waits,
+                'wait_time': self._wait_time,
+                'timeouts': self._timeouts
+            }
@@ -8,9 +8,8 @@ Custom decorators
 """
 
 from functools import wraps
-from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
-from app.models import User
-from app.utils import raise_error
+from flask_jwt_extended import verify_jwt_in_request
+from app.utils import raise_error, get_current_user, is_admin
 
 def admin_required(fn):
     """
@@ -19,11 +18,8 @@ def admin_required(fn):
     """
     @wraps(fn)
     def wrapper(*args, **kwargs):
-        USER = User()
         verify_jwt_in_request()
-        user_name = get_jwt_identity()
-        user = USER.filter_by('username', user_name)
-        if not user[0].get('isadmin'):
+        if not is_admin(get_current_user()):
             return raise_error(403, 'Only admins can access this endpoint')
         return fn(*args, **kwargs)
     return wrapper
\ No newline at end of file
@@ -0,0 +1,146 @@
+"""
+    app.encoding
+    ~~~~~~~~~~~~
+
+    JSON encoding of API responses.
+
+    The fastest available encoder is used: orjson, then ujson, then
+    the standard library. JSON_ENCODER = 'orjson', 'ujson' or 'json'
+    picks one explicitly. All of them write datetimes in the format
+    the API has always used, e.g. 'Mon, 03 Dec 2018 14:05 PM', and
+    write query rows (app.rows.Row) as objects, so rows can be returned
+    without copying them or reformatting their dates first.
+
+    With DB_RENDERING the database renders collections as JSON itself
+    and output_rendered() only wraps them in the response envelope.
+
+"""
+
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from flask import current_app, make_response
+
+from app.rows import Row
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import ujson
+except ImportError:  # pragma: no cover
+    ujson = None
+
+DAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+def format_datetime(value):
+    """
+    Returns value formatted as strftime('%a, %d %b %Y %H:%M %p') does
+    in the C locale, about twice as fast
+    """
+    return '%s, %02d %s %d %02d:%02d %s' % (
+        DAYS[value.weekday()], value.day, MONTHS[value.month - 1], value.year,
+        value.hour, value.minute, 'AM' if value.hour < 12 else 'PM')
+
+
+def default(obj):
+    """
+    Returns a JSON serializable version of the types the encoders
+    don't handle (or handle differently)
+    """
+    if isinstance(obj, Row):
+        return obj.as_dict()
+    if isinstance(obj, datetime):
+        return format_datetime(obj)
+    if isinstance(obj, date):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError('{!r} is not JSON serializable'.format(obj))
+
+
+def _orjson_dumps(data):
+    return orjson.dumps(data, default=default,
+                        option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+
+
+def _plain(data):
+    #: json and ujson write tuples, Rows included, as arrays without
+    #: asking default()
+    if isinstance(data, Row):
+        return data.as_dict()
+    if isinstance(data, dict):
+        return {key: _plain(value) for key, value in data.items()}
+    if isinstance(data, list):
+        return [_plain(item) for item in data]
+    return data
+
+
+def _ujson_dumps(data):
+    return ujson.dumps(_plain(data), default=default, ensure_ascii=False).encode('utf-8')
+
+
+def _json_dumps(data):
+    return json.dumps(_plain(data), default=default, ensure_ascii=False,
+                      separators=(',', ':')).encode('utf-8')
+
+
+ENCODERS = {'json': _json_dumps}
+if ujson is not None:
+    ENCODERS['ujson'] = _ujson_dumps
+if orjson is not None:
+    ENCODERS['orjson'] = _orjson_dumps
+
+
+def get_encoder(name=None):
+    """
+    Returns the encoder function called name, or the fastest one
+    installed
+    """
+    if name and name != 'auto':
+        try:
+            return ENCODERS[name]
+        except KeyError:
+            raise ValueError('JSON encoder {!r} is not installed'.format(name))
+    for name in ('orjson', 'ujson', 'json'):
+        if name in ENCODERS:
+            return ENCODERS[name]
+
+
+def dumps(data):
+    """
+    Returns data encoded as JSON in UTF-8 bytes
+    """
+    return get_encoder(current_app.config.get('JSON_ENCODER'))(data)
+
+
+def output_json(data, code, headers=None):
+    """
+    Makes a Flask response with a JSON encoded body (Flask-RESTful
+    representation)
+    """
+    response = make_response(dumps(data) + b'\n', code)
+    response.headers.extend(headers or {})
+    response.mimetype = 'application/json'
+    return response
+
+
+def output_rendered(data, code=200, headers=None, **members):
+    """
+    Makes a response with the {"status": code, "data": data} envelope
+    and any other members, where data is JSON text already rendered
+    (by the database, see Model.json_object) and is sent unchanged
+    """
+    body = [b'{"status":%d,"data":' % code, data.encode('utf-8')]
+    for name, value in sorted(members.items()):
+        body.extend((b',', dumps(name), b':', dumps(value)))
+    body.append(b'}\n')
+    response = make_response(b''.join(body), code)
+    response.headers.extend(headers or {})
+    response.mimetype = 'application/json'
+    return response
@@ -0,0 +1,107 @@
+"""
+    app.geo
+    ~~~~~~~
+
+    Geohash encoding and helpers for location searches.
+
+    A geohash is a short string naming a cell of a grid over the earth;
+    locations in the same cell share its prefix. Storing the geohash of
+    each record lets a plain btree index find the records in an area by
+    prefix, without PostGIS.
+
+"""
+
+import math
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+#: Precision of stored geohashes (cells of a few centimetres)
+PRECISION = 12
+
+#: Mean radius of the earth in metres
+EARTH_RADIUS = 6371000.0
+
+
+def parse_location(location):
+    """
+    Returns the (latitude, longitude) of a 'lat,long' string or None
+    if it is not a valid location
+    """
+    try:
+        latitude, longitude = [float(c) for c in location.split(',')]
+    except (AttributeError, ValueError):
+        return None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return latitude, longitude
+
+
+def encode(latitude, longitude, precision=PRECISION):
+    """
+    Returns the geohash of a point
+    """
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, char = [], 0, 0
+    even = True
+    while len(chars) < precision:
+        rng, value = (lng_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        char <<= 1
+        if value >= mid:
+            char |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[char])
+            bits, char = 0, 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """
+    Returns the (height, width) in degrees of geohash cells of the
+    given precision
+    """
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def cover(min_lat, min_lng, max_lat, max_lng, max_cells=16):
+    """
+    Returns the geohash prefixes of the cells covering a bounding box,
+    using the finest precision that needs at most max_cells cells.
+    Returns an empty list when even single character cells are too
+    many, i.e. the box is too large for the index to help.
+    """
+    best = []
+    for precision in range(1, PRECISION + 1):
+        height, width = cell_size(precision)
+        x0 = int((min_lng + 180) // width)
+        x1 = int(min((max_lng + 180) // width, 2 ** ((5 * precision + 1) // 2) - 1))
+        y0 = int((min_lat + 90) // height)
+        y1 = int(min((max_lat + 90) // height, 2 ** (5 * precision // 2) - 1))
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > max_cells:
+            break
+        best = [encode(-90 + (y + 0.5) * height, -180 + (x + 0.5) * width, precision)
+                for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+    return best
+
+
+def radius_bbox(latitude, longitude, radius):
+    """
+    Returns the (min_lat, min_lng, max_lat, max_lng) box enclosing the
+    circle of `radius` metres around a point, clipped to valid ranges
+    """
+    dlat = math.degrees(radius / EARTH_RADIUS)
+    cos_lat = math.cos(math.radians(latitude))
+    min_lat, max_lat = max(-90.0, latitude - dlat), min(90.0, latitude + dlat)
+    if cos_lat < 1e-6 or abs(latitude) + dlat >= 90:
+        #: The circle contains a pole so spans all longitudes
+        return min_lat, -180.0, max_lat, 180.0
+    dlng = math.degrees(radius / (EARTH_RADIUS * cos_lat))
+    return (min_lat, max(-180.0, longitude - dlng),
+            max_lat, min(180.0, longitude + dlng))
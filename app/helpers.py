@@ -9,7 +9,9 @@ Implements various helpers
 
 from flask_mail import Message
 from app import mail
-from flask import jsonify
+from app.mailer import get_mailer
+from flask import current_app
+from app.encoding import output_json
 
 def make_token_header(token):
     """
@@ -20,17 +22,27 @@ def make_token_header(token):
 
 def send_email(subject, sender, recipients, body):
     """
-    A function for sending an email
+    A function for sending an email. The email is queued for the
+    background sender (see app.mailer) unless MAIL_ASYNC is False, or
+    as a job for `flask worker` if MAIL_USE_JOBS is True.
+    Returns False if it had to be dropped.
     """
+    if current_app.config.get('MAIL_USE_JOBS'):
+        from app.models import Job
+        Job().add('send_email', {'subject': subject, 'sender': sender,
+                                 'recipients': recipients, 'body': body})
+        return True
     msg = Message(subject=subject, sender=sender, recipients=recipients)
     msg.body = body
-    mail.send(msg)
+    mailer = get_mailer()
+    if mailer is None:
+        mail.send(msg)
+        return True
+    return mailer.send(msg)
 
 def raise_error(status_code, message):
     """
     Returns a template for generating a custom error message
     """
-    response = jsonify({"status": status_code,
-                        "error": message})
-    response.status_code = status_code
-    return response
+    return output_json({"status": status_code,
+                        "error": message}, status_code)
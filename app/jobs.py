@@ -0,0 +1,232 @@
+"""
+    app.jobs
+    ~~~~~~~~
+
+    Background jobs stored in PostgreSQL.
+
+    Job.add inserts a row in the jobs table, on the request's connection,
+    so a job can be queued in the same transaction as the change it
+    follows up. `flask worker` runs them: each worker claims a batch of
+    due jobs with FOR UPDATE SKIP LOCKED, so any number of workers can
+    share the queue without waiting on each other. The claim counts the
+    attempt and leases the jobs for JOBS_LEASE seconds, by moving their
+    run_at, and is committed before they run. The jobs are deleted once
+    they have run. A job whose worker dies is run again once its lease
+    runs out, so tasks must tolerate running more than once.
+
+    A failed job is retried after JOBS_RETRY_BACKOFF seconds, doubled
+    on each attempt. After its max_attempts it is moved to dead_jobs
+    along with its last error. That includes jobs whose every attempt
+    killed the worker running them.
+
+"""
+
+import multiprocessing
+import select
+import signal
+import threading
+import traceback
+
+import psycopg2
+from flask_mail import Message
+
+#: Task functions by name
+TASKS = {}
+
+
+def task(name):
+    """
+    Registers the decorated function as the task `name`
+    """
+    def register(func):
+        TASKS[name] = func
+        return func
+    return register
+
+
+@task('send_email')
+def send_email_task(subject, sender, recipients, body):
+    from app import mail
+    msg = Message(subject=subject, sender=sender, recipients=recipients)
+    msg.body = body
+    mail.send(msg)
+
+
+@task('prune_blacklist')
+def prune_blacklist_task():
+    from app.models import Blacklist
+    Blacklist().prune()
+
+
+class Worker:
+    """
+    Claims and runs jobs on its own database connection
+    """
+
+    def __init__(self, app, batch_size=100, poll_interval=1, backoff=10, lease=300):
+        self.app = app
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.backoff = backoff
+        self.lease = lease
+        self.conn = None
+        self.stopping = False
+        #: Jobs run successfully and jobs that failed
+        self.done = 0
+        self.failed = 0
+
+    @classmethod
+    def from_app(cls, app):
+        return cls(app,
+                   batch_size=app.config.get('JOBS_BATCH_SIZE', 100),
+                   poll_interval=app.config.get('JOBS_POLL_INTERVAL', 1),
+                   backoff=app.config.get('JOBS_RETRY_BACKOFF', 10),
+                   lease=app.config.get('JOBS_LEASE', 300))
+
+    def connect(self):
+        self.conn = psycopg2.connect(self.app.config['DATABASE'])
+        #: Job.add notifies this channel, waking the worker at once
+        self.conn.autocommit = True
+        with self.conn.cursor() as cursor:
+            cursor.execute('listen jobs;')
+        self.conn.autocommit = False
+
+    def run_job(self, name, args):
+        """
+        Runs one job in its own app context. Returns None on success
+        or the error.
+        """
+        if name not in TASKS:
+            return 'Unknown task {!r}'.format(name)
+        with self.app.app_context():
+            try:
+                TASKS[name](**args)
+            except Exception:
+                self.app.logger.exception('Job %s failed', name)
+                return traceback.format_exc()
+        return None
+
+    def claim(self):
+        """
+        Claims up to batch_size due jobs, counting the attempt and
+        leasing them, and commits the claim. Jobs that have used up
+        their attempts without finishing are moved to dead_jobs.
+        Returns (id, task, args, attempts, max_attempts) of the jobs
+        claimed.
+        """
+        with self.conn:
+            with self.conn.cursor() as cursor:
+                cursor.execute("""
+                    update jobs set attempts = attempts + 1,
+                    run_at = now() + %s * interval '1 second'
+                    where id in (select id from jobs where run_at <= now()
+                                 order by run_at, id limit %s for update skip locked)
+                    returning id, task, args, attempts, max_attempts;""",
+                               (self.lease, self.batch_size))
+                jobs = sorted(cursor.fetchall())
+                for job_id, _, _, attempts, max_attempts in jobs:
+                    if attempts > max_attempts:
+                        self.failed += 1
+                        self.bury(cursor, job_id, max_attempts,
+                                  'The worker stopped while running the job')
+        return jobs
+
+    def bury(self, cursor, job_id, attempts, error):
+        """
+        Moves a job to dead_jobs
+        """
+        cursor.execute("""
+            with dead as (delete from jobs where id = %s
+                          returning id, task, args, createdon)
+            insert into dead_jobs (id, task, args, attempts, createdon, last_error)
+            select id, task, args, %s, createdon, %s from dead;""",
+                       (job_id, attempts, error))
+
+    def run_batch(self):
+        """
+        Claims up to batch_size due jobs and runs them. Returns the
+        number of jobs claimed.
+        """
+        jobs = self.claim()
+        done, failed = [], []
+        for job_id, name, args, attempts, max_attempts in jobs:
+            if attempts > max_attempts:
+                continue
+            error = self.run_job(name, args)
+            if error is None:
+                done.append(job_id)
+            else:
+                failed.append((job_id, name, attempts, max_attempts, error))
+        with self.conn:
+            with self.conn.cursor() as cursor:
+                for job_id, name, attempts, max_attempts, error in failed:
+                    self.failed += 1
+                    if attempts >= max_attempts or name not in TASKS:
+                        self.bury(cursor, job_id, attempts, error)
+                    else:
+                        cursor.execute("""
+                            update jobs set last_error = %s,
+                            run_at = now() + %s * interval '1 second' where id = %s;""",
+                                       (error, self.backoff * 2 ** (attempts - 1), job_id))
+                if done:
+                    cursor.execute("delete from jobs where id = any(%s);", (done,))
+                    self.done += len(done)
+        return len(jobs)
+
+    def wait(self):
+        """
+        Waits for a notification of a new job or poll_interval seconds,
+        the latter catching delayed and retried jobs as they fall due
+        """
+        if select.select([self.conn], [], [], self.poll_interval)[0]:
+            self.conn.poll()
+            del self.conn.notifies[:]
+
+    def stop(self, *args):
+        """
+        Stops the worker once its current batch is done
+        """
+        self.stopping = True
+
+    def run(self, burst=False):
+        """
+        Runs jobs until stopped, or until the queue has no due jobs if
+        burst is True. Returns the number of jobs run successfully.
+        """
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self.stop)
+        self.connect()
+        try:
+            while not self.stopping:
+                if self.run_batch():
+                    continue
+                if burst:
+                    break
+                self.wait()
+        finally:
+            self.conn.close()
+        return self.done
+
+
+def _work(app, burst, results):
+    results.put(Worker.from_app(app).run(burst))
+
+
+def run_workers(app, processes=1, burst=False):
+    """
+    Runs jobs on `processes` forked worker processes. Returns the
+    number of jobs run successfully.
+    """
+    if processes <= 1:
+        return Worker.from_app(app).run(burst)
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    children = [context.Process(target=_work, args=(app, burst, results))
+                for _ in range(processes)]
+    for child in children:
+        child.start()
+    #: Pass a shutdown on to the workers
+    signal.signal(signal.SIGTERM, lambda *args: [child.terminate() for child in children])
+    for child in children:
+        child.join()
+    return sum(results.get(timeout=1) for child in children if child.exitcode == 0)
@@ -0,0 +1,251 @@
+"""
+    app.mailer
+    ~~~~~~~~~~
+
+    Background email delivery.
+
+    Messages are put on a bounded queue and sent by a per-worker sender
+    thread, so a request never waits on the mail server. The thread
+    keeps its SMTP connection open while messages keep coming and
+    closes it after MAIL_IDLE_TIMEOUT idle seconds. A failed send is
+    retried MAIL_RETRIES times on a new connection, waiting
+    MAIL_RETRY_BACKOFF seconds doubled on each attempt, and is then
+    dropped and logged.
+
+    When the queue holds MAIL_QUEUE_SIZE messages, MAIL_OVERFLOW
+    decides what happens to a new one:
+
+        drop_new -> the new message is dropped
+        drop_oldest -> the oldest queued message is dropped instead
+        block -> the caller waits up to MAIL_QUEUE_TIMEOUT seconds for
+                 room, then the new message is dropped
+
+"""
+
+import atexit
+import os
+import queue
+import smtplib
+import threading
+import time
+
+import click
+from flask import current_app
+
+#: Queued to stop the sender thread
+_STOP = object()
+
+OVERFLOW_POLICIES = ('drop_new', 'drop_oldest', 'block')
+
+
+class Mailer:
+    """
+    A bounded queue of messages and the thread sending them
+    """
+
+    def __init__(self, app, mail, maxsize=1000, overflow='drop_new', queue_timeout=1,
+                 retries=3, backoff=1, idle_timeout=5):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("MAIL_OVERFLOW must be one of {}".format(
+                ', '.join(OVERFLOW_POLICIES)))
+        self.app = app
+        self.mail = mail
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.queue_timeout = queue_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize)
+        self._thread = None
+        self._pid = None
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.retried = 0
+
+    def _start(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                #: A forked worker has neither its parent's thread nor its messages
+                self._queue = queue.Queue(self.maxsize)
+                self._thread = None
+                self._pid = os.getpid()
+            if self._thread is None or not self._thread.is_alive():
+                if self._thread is None:
+                    #: Deliver what is queued when the worker exits
+                    atexit.register(self.stop)
+                self._thread = threading.Thread(target=self._run, name='mailer', daemon=True)
+                self._thread.start()
+
+    def send(self, message):
+        """
+        Queues a flask_mail Message for delivery. Returns False if it
+        was dropped because the queue is full.
+        """
+        self._start()
+        try:
+            self._queue.put_nowait(message)
+            return True
+        except queue.Full:
+            pass
+        if self.overflow == 'drop_oldest':
+            try:
+                self._queue.get_nowait()
+                self._queue.task_done()
+                self._drop('oldest queued message')
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(message)
+                return True
+            except queue.Full:
+                pass
+        elif self.overflow == 'block':
+            try:
+                self._queue.put(message, timeout=self.queue_timeout)
+                return True
+            except queue.Full:
+                pass
+        self._drop('new message')
+        return False
+
+    def _drop(self, which):
+        self.dropped += 1
+        self.app.logger.warning('Mail queue full, dropped the %s', which)
+
+    def _run(self):
+        stopped = False
+        while not stopped:
+            message = self._queue.get()
+            if message is _STOP:
+                self._queue.task_done()
+                return
+            with self.app.app_context():
+                stopped = self._send_batch(message)
+
+    def _send_batch(self, message):
+        """
+        Sends message and the messages that follow it on one connection.
+        Returns True if the thread was asked to stop.
+        """
+        connection = None
+        try:
+            while True:
+                connection = self._deliver(connection, message)
+                self._queue.task_done()
+                try:
+                    message = self._queue.get(timeout=self.idle_timeout)
+                except queue.Empty:
+                    return False
+                if message is _STOP:
+                    self._queue.task_done()
+                    return True
+        finally:
+            self._close(connection)
+
+    def _deliver(self, connection, message):
+        """
+        Sends message, retrying on a new connection, and returns the
+        connection to use for the next message
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                if connection is None:
+                    connection = self.mail.connect().__enter__()
+                connection.send(message)
+                self.sent += 1
+                return connection
+            except (smtplib.SMTPException, OSError) as error:
+                self._close(connection)
+                connection = None
+                if attempt == self.retries:
+                    self.failed += 1
+                    self.app.logger.error('Could not send mail to %s: %s',
+                                          ', '.join(message.recipients), error)
+                    return None
+                self.retried += 1
+                time.sleep(self.backoff * 2 ** attempt)
+
+    @staticmethod
+    def _close(connection):
+        if connection is not None and connection.host is not None:
+            try:
+                connection.host.quit()
+            except (smtplib.SMTPException, OSError):
+                connection.host.close()
+
+    def join(self):
+        """
+        Waits until every queued message has been handled
+        """
+        self._queue.join()
+
+    def stop(self, timeout=5):
+        """
+        Sends the queued messages, waiting at most timeout seconds, and
+        stops the sender thread
+        """
+        thread = self._thread
+        if thread is None or not thread.is_alive() or self._pid != os.getpid():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        thread.join(timeout)
+
+    def stats(self):
+        """
+        Returns the mailer's counters for monitoring
+        """
+        return {'queued': self._queue.qsize(),
+                'sent': self.sent,
+                'failed': self.failed,
+                'retried': self.retried,
+                'dropped': self.dropped}
+
+
+def get_mailer():
+    """
+    Returns the current app's mailer, or None when mail is sent inline
+    with MAIL_ASYNC = False
+    """
+    app = current_app._get_current_object()
+    if not app.config.get('MAIL_ASYNC', True):
+        return None
+    mailer = app.extensions.get('mailer')
+    if mailer is None:
+        mailer = app.extensions.setdefault('mailer', Mailer(
+            app, app.extensions['mail'],
+            maxsize=app.config.get('MAIL_QUEUE_SIZE', 1000),
+            overflow=app.config.get('MAIL_OVERFLOW', 'drop_new'),
+            queue_timeout=app.config.get('MAIL_QUEUE_TIMEOUT', 1),
+            retries=app.config.get('MAIL_RETRIES', 3),
+            backoff=app.config.get('MAIL_RETRY_BACKOFF', 1),
+            idle_timeout=app.config.get('MAIL_IDLE_TIMEOUT', 5)
+            ))
+    return mailer
+
+
+@click.command('smtp-standin')
+@click.option('--port', default=1025, help='Port to listen on')
+def smtp_standin_command(port):
+    """Run a local SMTP server that prints the mail it receives."""
+    from app.smtp import SMTPStandIn
+
+    def show(sender, recipients, data):
+        click.echo('From {} to {}'.format(sender, ', '.join(recipients)))
+        click.echo(data.decode('utf-8', 'replace'))
+
+    server = SMTPStandIn('localhost', port, on_message=show)
+    click.echo('Listening on localhost:{}'.format(server.port))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def init_app(app):
+    app.cli.add_command(smtp_standin_command)
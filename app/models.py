@@ -5,17 +5,59 @@
 '''
 
 
+import itertools
+import json
 from datetime import datetime
-from psycopg2.extras import RealDictCursor
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import current_app
+from psycopg2 import sql
 from app.db.db import get_db
+from app.rows import RowCursor
+from app.usercache import get_user_cache
+from app import passwords
+from app import geo
+
+#: Names for server-side cursors
+_cursor_ids = itertools.count()
+
+#: Operators accepted in filter conditions
+OPERATORS = {
+    '=': '{} = %s',
+    '<': '{} < %s',
+    '<=': '{} <= %s',
+    '>': '{} > %s',
+    '>=': '{} >= %s',
+    #: case insensitive equality
+    'ieq': 'lower({}) = lower(%s)',
+}
+
+#: to_char() pattern giving the date format of app.encoding.format_datetime
+DATE_FORMAT = 'Dy, DD Mon YYYY HH24:MI AM'
+
+#: Columns rendered with DATE_FORMAT by json_object()
+DATE_FIELDS = ('createdon', 'updatedon')
+
+def coordinates(location):
+    """
+    Returns the latitude, longitude and geohash stored for a location,
+    all None if it can't be parsed
+    """
+    point = geo.parse_location(location)
+    if point is None:
+        return None, None, None
+    return point[0], point[1], geo.encode(*point)
 
 class Model:
 
     def __init__(self):
-        #: Get the connection object
-        self.conn = get_db()
-        self.cursor = self.conn.cursor(cursor_factory=RealDictCursor)
+        #: Cursor of the most recently executed query
+        self.cursor = None
+
+    @property
+    def conn(self):
+        """
+        The connection to the primary database
+        """
+        return get_db()
 
     def commit(self):
         """
@@ -24,17 +66,20 @@ class Model:
         self.conn.commit()
 
     
-    def query(self, sql, params=None):
+    def query(self, sql, params=None, readonly=False):
         """
         generic query method
+
+        Read-only queries may be served by a replica
         """
+        self.cursor = get_db(readonly=readonly).cursor(cursor_factory=RowCursor)
         self.cursor.execute(sql, params or ())
 
 
     
     def fetchall(self):
         """
-        fetches all data
+        fetches all data, as app.rows.Row items
         """
         return self.cursor.fetchall()
 
@@ -46,28 +91,136 @@ class Model:
         self.cursor.fetchone()
 
     
+    def iterate(self, sql, params=None, readonly=True):
+        """
+        Runs a query on a named (server-side) cursor and yields its rows,
+        fetching DATABASE_FETCH_SIZE rows at a time, so large results
+        are never held in memory at once.
+        """
+        conn = get_db(readonly=readonly)
+        autocommit = conn.autocommit
+        #: Named cursors only live inside a transaction
+        if autocommit:
+            conn.autocommit = False
+        name = 'iterate_{}'.format(next(_cursor_ids))
+        try:
+            with conn.cursor(name, cursor_factory=RowCursor) as cursor:
+                cursor.itersize = current_app.config.get('DATABASE_FETCH_SIZE', 1000)
+                cursor.execute(sql, params or ())
+                for row in cursor:
+                    yield row
+        finally:
+            if autocommit:
+                conn.rollback()
+                conn.autocommit = True
+
+    
     def clear_all_tables(self):
         """
         Clears all tables
         """
-        self.cursor.execute("""delete from records;""")
-        self.cursor.execute("""delete from users;""")
-        self.cursor.execute("""delete from blacklist;""")
+        self.query("""delete from records;""")
+        self.query("""delete from users;""")
+        self.query("""delete from blacklist;""")
+        self.query("""delete from jobs;""")
+        self.query("""delete from dead_jobs;""")
         self.commit()
+        cache = get_user_cache()
+        if cache is not None:
+            cache.clear()
+
+
+    def columns(self, fields=None):
+        """
+        Returns the select list for a list of field names, or all
+        columns if fields is None. Only names in the model's FIELDS
+        are accepted.
+        """
+        if fields is None:
+            return '*'
+        unknown = set(fields) - set(self.FIELDS)
+        if unknown or not fields:
+            raise ValueError('Unknown fields: {}'.format(', '.join(sorted(unknown))))
+        return ', '.join(fields)
+
+    def json_object(self, fields):
+        """
+        Returns a json_build_object() expression rendering the given
+        fields of a row as the API encodes them, dates included, so the
+        database can return rows as ready made JSON
+        """
+        self.columns(fields)
+        items = []
+        for field in fields:
+            column = sql.Identifier(field)
+            if field in DATE_FIELDS:
+                column = sql.SQL('to_char({}, {})').format(column, sql.Literal(DATE_FORMAT))
+            items.append(sql.SQL('{}, {}').format(sql.Literal(field), column))
+        return sql.SQL('json_build_object({})').format(sql.SQL(', ').join(items))
+
+
+    def where(self, conditions):
+        """
+        Compiles a list of (field, operator, value) conditions into
+        a list of SQL clauses and their parameters. Fields must be in
+        the model's FIELDS and operators in OPERATORS, values are always
+        passed as query parameters.
+        """
+        clauses, params = [], []
+        for field, operator, value in conditions:
+            if field not in self.FIELDS or operator not in OPERATORS:
+                raise ValueError('Invalid condition: {} {}'.format(field, operator))
+            clauses.append(sql.SQL(OPERATORS[operator]).format(sql.Identifier(field)))
+            params.append(value)
+        return clauses, params
+
+    def select(self, conditions=(), fields=None, extra='', extra_params=(), order_by='',
+               limit=None, columns=None):
+        """
+        Builds a select statement on the model's table, returning it
+        with its parameters.
+
+        conditions -> see where(), joined by 'and'
+        fields -> list of columns to return (all by default)
+        extra -> additional trusted SQL condition with its extra_params
+        order_by -> trusted SQL order by list
+        columns -> select list (sql.Composable) to use instead of fields
+        """
+        if columns is None:
+            columns = sql.SQL(self.columns(fields))
+        query = sql.SQL('select {} from {}').format(columns, sql.Identifier(self.table))
+        clauses, params = self.where(conditions)
+        if extra:
+            clauses.append(sql.SQL(extra))
+            params.extend(extra_params)
+        if clauses:
+            query += sql.SQL(' where ') + sql.SQL(' and ').join(clauses)
+        if order_by:
+            query += sql.SQL(' order by ' + order_by)
+        if limit is not None:
+            query += sql.SQL(' limit %s')
+            params.append(limit)
+        return query, params
 
     
-    def filter_by(self, field, value):
+    def filter_by(self, field, value, fields=None):
         """
         field -> str
         Takes a field and a value by which to filter
         Returns a list of all matching items as dictionaries
         in a list or an empty list
+
+        fields -> list of the columns to return (all by default)
         """
-        if isinstance(self, Record):
-            query = """ select * from records where {} = %s;""".format(field)
-        if isinstance(self, User):
-            query = """ select * from users where {} = %s;""".format(field)
-        self.query(query, (value,))
+        self.query(*self.select([(field, '=', value)], fields), readonly=True)
+        return self.fetchall()
+
+    def filter(self, conditions, fields=None):
+        """
+        Returns all items matching every (field, operator, value)
+        condition. See where().
+        """
+        self.query(*self.select(conditions, fields), readonly=True)
         return self.fetchall()
 
     
@@ -80,19 +233,21 @@ class Model:
             query = """select * from records order by createdon desc;"""
         if isinstance(self, User):
             query = """select * from records order by createdon desc;"""
-        self.query(query)
+        self.query(query, readonly=True)
         return self.fetchall()
 
     
-    def by_id(self, item_id):
+    def by_id(self, item_id, fields=None):
         """
         Query an item by id
+
+        fields -> list of the columns to return (all by default)
         """
         if isinstance(self, Record):
-            query = "select * from records where id = %s;"
+            query = "select {} from records where id = %s;"
         if isinstance(self, User):
-            query = "select * from users where id = %s;"
-        self.query(query, (item_id,))
+            query = "select {} from users where id = %s;"
+        self.query(query.format(self.columns(fields)), (item_id,), readonly=True)
         return self.fetchall()
 
     
@@ -111,10 +266,11 @@ class Model:
     def update(self, _id, field, data):
         """
         Given a field(string) and data,
-        updates field with data.
+        updates field with data. Records also get their updatedon
+        time set.
         """
         if isinstance(self, Record):
-            query = "update records set {} = ".format(field)
+            query = "update records set updatedon = now(), {} = ".format(field)
         if isinstance(self, User):
             query = "update users set {} = ".format(field)
         self.query(query + " %s where id = %s", (data, _id))
@@ -136,8 +292,23 @@ class Record(Model):
 
     """Record model"""
 
+    table = 'records'
+
+    #: Columns clients may request
+    FIELDS = ('id', 'type', 'comment', 'location', 'status', 'createdon', 'images',
+              'videos', 'uri', 'createdby', 'user_id', 'latitude', 'longitude', 'updatedon')
+
     def add(self, location, comment, _type, user_id=None, status=None, images=None,
-                 videos=None, uri=None):
+                 videos=None, uri=None, uri_prefix=None):
+        """
+        Inserts a record in a single statement and returns a dictionary
+        with its id, createdon and uri.
+
+        If uri_prefix is given the record's uri is uri_prefix followed by
+        its id. The id is drawn from the sequence inside the statement,
+        so no follow-up update is needed and concurrent inserts always
+        get their own id.
+        """
         self.location = location
         self.comment = comment
         assert _type in ['red-flag', 'intervention'], "Wrong incident type.\
@@ -149,11 +320,16 @@ class Record(Model):
         self.images = images or []
         self.videos = videos or []
         self.uri = uri or ''
+        latitude, longitude, geohash = coordinates(location)
 
-        query = """insert into records (location, comment, type, createdOn, user_id, status,
-        Images, Videos, uri, createdby) values (%(location)s, %(comment)s, %(type)s,
+        query = """with new as (select nextval(pg_get_serial_sequence('records', 'id')) as id)
+        insert into records (id, location, comment, type, createdOn, user_id, status,
+        Images, Videos, uri, createdby, latitude, longitude, geohash)
+        select new.id, %(location)s, %(comment)s, %(type)s,
         %(createdon)s, %(user_id)s, %(status)s, %(images)s, %(videos)s,
-        %(uri)s, %(createdby)s);"""
+        coalesce(%(uri_prefix)s || new.id, %(uri)s), %(createdby)s,
+        %(latitude)s, %(longitude)s, %(geohash)s from new
+        returning id, createdon, uri;"""
 
         self.query(query,
                    {
@@ -166,10 +342,202 @@ class Record(Model):
                        'images': self.images,
                        'videos': self.videos,
                        'uri': self.uri,
-                       'createdby': self.user_id
+                       'uri_prefix': uri_prefix,
+                       'createdby': self.user_id,
+                       'latitude': latitude,
+                       'longitude': longitude,
+                       'geohash': geohash
                    })
-
+        record = self.fetchall()[0]
         self.commit()
+        self.id = record['id']
+        self.uri = record['uri']
+        return record
+
+    def update(self, _id, field, data):
+        """
+        Given a field(string) and data, updates field with data.
+        Updating the location also updates the record's coordinates.
+        """
+        if field == 'location':
+            latitude, longitude, geohash = coordinates(data)
+            self.query("""update records set location = %s, latitude = %s, longitude = %s,
+                          geohash = %s, updatedon = now() where id = %s;""",
+                       (data, latitude, longitude, geohash, _id))
+            self.commit()
+        else:
+            super().update(_id, field, data)
+
+    @staticmethod
+    def bbox_condition(bbox):
+        """
+        Returns the SQL condition, and its parameters, matching records
+        inside bbox, a (min_lat, min_lng, max_lat, max_lng) tuple.
+
+        The geohash prefixes of the cells covering the box narrow the
+        search down through the (type, geohash) index before the exact
+        test on the coordinates.
+        """
+        min_lat, min_lng, max_lat, max_lng = bbox
+        extra = 'latitude between %s and %s and longitude between %s and %s'
+        params = [min_lat, max_lat, min_lng, max_lng]
+        prefixes = geo.cover(*bbox)
+        if prefixes:
+            extra += ' and (' + ' or '.join(['geohash like %s'] * len(prefixes)) + ')'
+            params.extend(prefix + '%' for prefix in prefixes)
+        return extra, params
+
+    def within(self, conditions, bbox, limit, after=None, fields=None):
+        """
+        Returns a page (see page()) of the records matching conditions
+        located inside bbox, a (min_lat, min_lng, max_lat, max_lng) tuple
+        """
+        extra, params = self.bbox_condition(bbox)
+        return self.page(conditions, limit, after, fields, extra, params)
+
+    def nearby(self, conditions, latitude, longitude, radius, limit, fields=None):
+        """
+        Returns up to `limit` records matching conditions within `radius`
+        metres of a point, nearest first. Each record has its distance
+        in metres under 'distance'.
+        """
+        if fields is not None:
+            fields = list(fields) + [f for f in ('id', 'latitude', 'longitude') if f not in fields]
+        extra, params = self.bbox_condition(geo.radius_bbox(latitude, longitude, radius))
+        distance = """({} * 2 * asin(sqrt(power(sin(radians(latitude - %s) / 2), 2)
+            + cos(radians(%s)) * cos(radians(latitude))
+            * power(sin(radians(longitude - %s) / 2), 2))))""".format(geo.EARTH_RADIUS)
+        inner, inner_params = self.select(conditions, fields, extra, params)
+        query = sql.SQL("""select * from (select *, {} as distance from ({}) as area) as near
+                           where distance <= %s order by distance, id limit %s;""").format(
+                               sql.SQL(distance), inner)
+        self.query(query, [latitude, latitude, longitude] + inner_params + [radius, limit],
+                   readonly=True)
+        return self.fetchall()
+
+    def search(self, conditions, text, limit, after=None, fields=None):
+        """
+        Returns up to `limit` records matching conditions (see where())
+        whose comment matches the words in text, best match first, and
+        the (rank, id) key of the last one if there are more. Each
+        record has its rank under 'rank'.
+
+        after -> (rank, id) key returned for the previous page
+        fields -> list of the columns to return. id is always included
+        as it is part of the key.
+        """
+        fields = list(fields or self.FIELDS)
+        if 'id' not in fields:
+            fields.append('id')
+        tsquery = "plainto_tsquery('english', %s)"
+        rank = 'ts_rank(search, {})'.format(tsquery)
+        clauses, params = self.where(conditions)
+        clauses.append(sql.SQL('search @@ ' + tsquery))
+        params = [text] + params + [text]
+        if after is not None:
+            #: Ranks are real; compare at that precision so the key matches
+            clauses.append(sql.SQL('({}, id) < (%s::real, %s)'.format(rank)))
+            params.extend([text, after[0], after[1]])
+        query = sql.SQL('select {}, {} as rank from {} where {} '
+                        'order by rank desc, id desc limit %s;').format(
+                            sql.SQL(self.columns(fields)), sql.SQL(rank),
+                            sql.Identifier(self.table), sql.SQL(' and ').join(clauses))
+        self.query(query, params + [limit + 1], readonly=True)
+        records = self.fetchall()
+        if len(records) > limit:
+            records = records[:limit]
+            last = records[-1]
+            return records, (last['rank'], last['id'])
+        return records, None
+
+    def version(self, conditions):
+        """
+        Returns the latest updatedon time and the number of the records
+        matching conditions (see where()). Any insert, update or delete
+        changes one of them, so they are a cheap validator of a listing.
+        """
+        query = sql.SQL('select max(updatedon) as updatedon, count(*) as count from {}').format(
+            sql.Identifier(self.table))
+        clauses, params = self.where(conditions)
+        if clauses:
+            query += sql.SQL(' where ') + sql.SQL(' and ').join(clauses)
+        self.query(query, params, readonly=True)
+        return self.fetchall()[0]
+
+    def iter_filtered(self, conditions, fields=None, rendered=False):
+        """
+        Yields all records matching conditions (see where()), newest first
+
+        rendered -> True to yield each record as JSON text rendered by
+        the database (see json_object())
+        """
+        if rendered:
+            columns = sql.SQL('{}::text as item').format(self.json_object(fields or self.FIELDS))
+            rows = self.iterate(*self.select(conditions, columns=columns,
+                                             order_by='createdon desc, id desc'))
+            return (row['item'] for row in rows)
+        return self.iterate(*self.select(conditions, fields,
+                                         order_by='createdon desc, id desc'))
+
+    def page_rendered(self, conditions, limit, after=None, fields=None):
+        """
+        Returns a page of records as page() does, but as the text of a
+        JSON array built by the database, dates formatted, so it can be
+        sent as it is. Also returns the id and updatedon of each record.
+        """
+        columns = sql.SQL(
+            '{} as item, createdon, id, updatedon, '
+            'row_number() over (order by createdon desc, id desc) as n'
+        ).format(self.json_object(fields or self.FIELDS))
+        extra, extra_params = '', []
+        if after is not None:
+            extra, extra_params = '(createdon, id) < (%s, %s)', list(after)
+        page, params = self.select(conditions, columns=columns, extra=extra,
+                                   extra_params=extra_params,
+                                   order_by='createdon desc, id desc', limit=limit + 1)
+        query = sql.SQL("""
+            select coalesce(json_agg(item order by n) filter (where n <= %s), '[]')::text as data,
+                   max(createdon) filter (where n = %s) as createdon,
+                   max(id) filter (where n = %s) as id,
+                   count(*) > %s as more,
+                   coalesce(array_agg(id order by n) filter (where n <= %s), '{{}}') as ids,
+                   coalesce(array_agg(updatedon order by n) filter (where n <= %s), '{{}}')
+                       as updatedons
+            from ({}) as page""").format(page)
+        self.query(query, [limit] * 6 + params, readonly=True)
+        row = self.fetchall()[0]
+        keys = [{'id': _id, 'updatedon': updatedon}
+                for _id, updatedon in zip(row['ids'], row['updatedons'])]
+        return row['data'], (row['createdon'], row['id']) if row['more'] else None, keys
+
+    def page(self, conditions, limit, after=None, fields=None, extra='', extra_params=()):
+        """
+        Returns up to `limit` records matching conditions (see where()),
+        newest first, and the (createdon, id) key of the last one if
+        there are more.
+
+        after -> (createdon, id) key returned for the previous page.
+        Pages are read from indexes ending in (createdon, id), so every
+        page costs the same however deep it is.
+        fields -> list of the columns to return. createdon and id are
+        always included as they make up the key.
+        extra -> additional trusted SQL condition with its extra_params
+        """
+        if fields is not None:
+            fields = list(fields) + [f for f in ('createdon', 'id') if f not in fields]
+        extra_params = list(extra_params)
+        if after is not None:
+            extra = ' and '.join(c for c in (extra, '(createdon, id) < (%s, %s)') if c)
+            extra_params.extend(after)
+        self.query(*self.select(conditions, fields, extra, extra_params,
+                                order_by='createdon desc, id desc', limit=limit + 1),
+                   readonly=True)
+        records = self.fetchall()
+        if len(records) > limit:
+            records = records[:limit]
+            last = records[-1]
+            return records, (last['createdon'], last['id'])
+        return records, None
 
     @property
     def serialize(self):
@@ -193,6 +561,12 @@ class User(Model):
 
     """User model"""
 
+    table = 'users'
+
+    #: Columns clients may request
+    FIELDS = ('id', 'username', 'email', 'createdon', 'firstname', 'lastname',
+              'othernames', 'phonenumber', 'isadmin')
+
     def add(self, username, password, email=None, firstname=None, lastname=None,
                 othernames=None, phone_number=None, isadmin=None):
 
@@ -210,10 +584,11 @@ class User(Model):
         (username, password_hash, email, createdOn, firstname, lastname, othernames,
         phoneNumber, isAdmin)
         values (%(username)s, %(password_hash)s, %(email)s, %(registered)s,
-        %(firstname)s, %(lastname)s, %(othernames)s, %(phoneNumber)s, %(isAdmin)s);"""
+        %(firstname)s, %(lastname)s, %(othernames)s, %(phoneNumber)s, %(isAdmin)s)
+        returning id, username, isadmin, claims_version;"""
 
         self.query(query, {'username': self.username,
-                           'password_hash': generate_password_hash(self.password),
+                           'password_hash': passwords.hash_password(self.password),
                            'email':  self.email,
                            'registered': self.registered,
                            'firstname': self.firstname,
@@ -222,22 +597,87 @@ class User(Model):
                            'phoneNumber': self.phone_number,
                            'isAdmin': self.isadmin
                           })
-
+        user = self.fetchall()[0]
         self.commit()
+        self.id = user['id']
+        return user
+
+    def update(self, _id, field, data):
+        """
+        Given a field(string) and data, updates field with data.
+        Changing a user's admin status bumps the version of the
+        claims carried in their tokens, invalidating admin claims
+        issued before the change.
+        """
+        if field.lower() == 'isadmin':
+            self.query("""update users set isadmin = %s, claims_version = claims_version + 1
+                          where id = %s;""", (data, _id))
+            self.commit()
+        else:
+            super().update(_id, field, data)
+        self.invalidate(_id)
+
+    def delete(self, _id):
+        """
+        Deletes the user with the specified id
+        """
+        super().delete(_id)
+        self.invalidate(_id)
+
+    @staticmethod
+    def invalidate(_id):
+        """
+        Drops the user with the given id from the user cache
+        """
+        cache = get_user_cache()
+        if cache is not None:
+            cache.invalidate(_id)
+
+    def claims_version(self, _id):
+        """
+        Returns the current claims version of the user with the given
+        id or None if there is no such user. It is read from the primary
+        so a demotion is seen at once.
+        """
+        self.query("select claims_version from users where id = %s;", (_id,))
+        user = self.fetchall()
+        return user[0]['claims_version'] if user else None
 
         
 
-    def all(self):
+    #: Columns listed by all() unless others are requested
+    LIST_FIELDS = ('id', 'username', 'email', 'firstname', 'lastname', 'othernames',
+                   'phonenumber', 'isadmin')
+
+    def all(self, fields=None, rendered=False):
         """
         Return a list of all users in the database
+
+        rendered -> True to return the text of a JSON array of the
+        users built by the database (see json_object())
         """
-        query = """select
-                id, username, email, firstname, lastname, othernames,
-                phoneNumber, isAdmin from users;"""
-        self.query(query)
+        if rendered:
+            query = sql.SQL("""select coalesce(json_agg({} order by id), '[]')::text as data
+                               from users;""").format(self.json_object(fields or self.LIST_FIELDS))
+            self.query(query, readonly=True)
+            return self.fetchall()[0]['data']
+        query = """select {} from users order by id;""".format(self.columns(fields or self.LIST_FIELDS))
+        self.query(query, readonly=True)
 
         return self.fetchall()
 
+    def iter_all(self, fields=None, rendered=False):
+        """
+        Yields all users as returned by all(), as JSON text if rendered
+        """
+        if rendered:
+            query = sql.SQL("""select {}::text as item from users order by id;""").format(
+                self.json_object(fields or self.LIST_FIELDS))
+            return (row['item'] for row in self.iterate(query))
+        query = """select {} from users order by id;""".format(
+            self.columns(fields or self.LIST_FIELDS))
+        return self.iterate(query)
+
     @property
     def serialize(self):
         """
@@ -264,13 +704,22 @@ class User(Model):
         record = Record(user_id=user_id, **kwargs)
         record.put()
 
-    def by_username(self, username):
+    def by_username(self, username, cached=True):
         """
         Returns a user data item with the given username
         as a dictionary.
+
+        cached -> False to bypass the user cache (see app.usercache).
+        Cached users do not include the password hash.
         """
+        cache = get_user_cache() if cached else None
+        if cache is not None:
+            return cache.get(username, self._by_username)
+        return self._by_username(username)
+
+    def _by_username(self, username):
         query = """ select * from users where username = %s;"""
-        self.query(query, (username,))
+        self.query(query, (username,), readonly=True)
         record = self.fetchall()
         return record[0] if record else {}
 
@@ -280,27 +729,102 @@ class User(Model):
         Returns True if password hash is valid
         False otherwise.
         """
-        return check_password_hash(password_hash, password)
+        return passwords.check_password(password_hash, password)
+
+    def rehash_password(self, user, password):
+        """
+        Re-hashes the password of user (as returned by by_username) if
+        its hash was made with another method or cost than the current
+        PASSWORD_HASH_METHOD. password must already be checked.
+        """
+        if passwords.needs_rehash(user['password_hash']):
+            self.update(user['id'], 'password_hash', passwords.hash_password(password))
 
 class Blacklist(Model):
     """
     Blacklist Model
     """
 
-    def add(self, jti):
+    def add(self, jti, expires):
         """
         store token identifier in the database
 
         :param jti: token identifier
+        :param expires: datetime after which the token is no longer valid
         """
-        query = """insert into blacklist (jti) values (%s);"""
-        self.query(query, (jti,))
+        query = """insert into blacklist (jti, expires) values (%s, %s)
+                   on conflict (jti) do nothing;"""
+        self.query(query, (jti, expires))
         self.commit()
 
+    def prune(self, batch_size=1000):
+        """
+        Deletes the identifiers of tokens that have expired, since
+        those tokens are rejected before the blacklist is checked.
+        Rows are deleted in batches to keep each transaction short.
+        Returns the number of rows deleted.
+        """
+        query = """delete from blacklist where id in
+                   (select id from blacklist where expires < now() limit %s);"""
+        deleted = 0
+        while True:
+            self.query(query, (batch_size,))
+            count = self.cursor.rowcount
+            self.commit()
+            deleted += count
+            if count < batch_size:
+                return deleted
+
     
     def is_blacklisted(self, jti):
         """
         Returns True if tokens jti is in the blacklist
         """
-        self.query("""select * from blacklist where jti = %s;""",(jti,))
+        self.query("""select * from blacklist where jti = %s;""", (jti,), readonly=True)
         return bool(self.fetchall())
+
+    def since(self, last_id):
+        """
+        Returns the (id, jti) of unexpired entries with an id greater
+        than last_id, in id order
+        """
+        self.query("""select id, jti from blacklist where id > %s and expires > now()
+                      order by id;""", (last_id,), readonly=True)
+        return self.fetchall()
+
+
+class Job(Model):
+    """
+    Job queue model. Jobs are run by `flask worker` (see app.jobs).
+    """
+
+    table = 'jobs'
+
+    def add(self, task, args=None, delay=0, max_attempts=None, commit=True):
+        """
+        Queues a call of the task registered under `task` with the
+        keyword arguments in args (JSON serializable), to run after
+        delay seconds. Returns the job's id.
+
+        commit -> False to leave the job in the current transaction, so
+        it is only queued if the caller's next commit succeeds
+        """
+        if max_attempts is None:
+            max_attempts = current_app.config.get('JOBS_MAX_ATTEMPTS', 5)
+        self.query("""insert into jobs (task, args, max_attempts, run_at)
+                      values (%s, %s, %s, now() + %s * interval '1 second')
+                      returning id;""",
+                   (task, json.dumps(args or {}), max_attempts, delay))
+        job_id = self.fetchall()[0]['id']
+        #: Wakes idle workers once the transaction commits
+        self.query("notify jobs;")
+        if commit:
+            self.commit()
+        return job_id
+
+    def dead(self):
+        """
+        Returns the jobs that ran out of attempts, most recent first
+        """
+        self.query("select * from dead_jobs order by failedon desc, id desc;", readonly=True)
+        return self.fetchall()
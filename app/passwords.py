@@ -0,0 +1,141 @@
+"""
+    app.passwords
+    ~~~~~~~~~~~~~
+
+    Password hashing off the request thread.
+
+    Hashing is deliberately slow and CPU bound, so a burst of signups
+    and logins run inline would hold the worker's CPU (and the GIL)
+    while every other request waits. Hashes are computed on a pool of
+    PASSWORD_HASH_WORKERS processes instead. At most PASSWORD_HASH_QUEUE
+    hashes may be waiting or running at once; past that, callers wait
+    up to PASSWORD_HASH_TIMEOUT seconds for a slot and then get
+    HashPoolBusy, which the API reports as 503, rather than queueing
+    without bound. With PASSWORD_HASH_WORKERS = 0 hashes are computed
+    inline.
+
+"""
+
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import current_app
+from werkzeug.security import (generate_password_hash, check_password_hash,
+                               DEFAULT_PBKDF2_ITERATIONS)
+
+
+class HashPoolBusy(Exception):
+    """
+    Raised when no hashing slot frees up in time
+    """
+
+
+class HashPool:
+    """
+    A bounded process pool for password hashing
+    """
+
+    def __init__(self, processes=None, max_pending=None, timeout=5):
+        self.processes = (os.cpu_count() or 1) if processes is None else processes
+        self.max_pending = max_pending or 4 * max(1, self.processes)
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        #: Number of hashes refused for lack of a slot
+        self.rejected = 0
+
+    def _get_executor(self):
+        with self._lock:
+            #: A forked worker can't use its parent's pool
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(self.processes)
+                self._pid = os.getpid()
+            return self._executor
+
+    def run(self, func, *args):
+        """
+        Returns func(*args), computed on the pool
+        """
+        if not self.processes:
+            return func(*args)
+        if not self._slots.acquire(timeout=self.timeout):
+            self.rejected += 1
+            raise HashPoolBusy('Too many passwords waiting to be hashed')
+        try:
+            future = self._get_executor().submit(func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+    def shutdown(self):
+        """
+        Stops the pool's processes
+        """
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown()
+            self._executor = None
+
+    def stats(self):
+        """
+        Returns the pool's size and rejection counter for monitoring
+        """
+        return {'processes': self.processes,
+                'max_pending': self.max_pending,
+                'rejected': self.rejected}
+
+
+def get_hash_pool():
+    """
+    Returns the current app's password hashing pool
+    """
+    app = current_app._get_current_object()
+    pool = app.extensions.get('hash_pool')
+    if pool is None:
+        pool = app.extensions.setdefault('hash_pool', HashPool(
+            processes=app.config.get('PASSWORD_HASH_WORKERS'),
+            max_pending=app.config.get('PASSWORD_HASH_QUEUE'),
+            timeout=app.config.get('PASSWORD_HASH_TIMEOUT', 5)
+            ))
+    return pool
+
+
+def hash_method():
+    """
+    Returns the configured hash method in the form werkzeug records
+    it in hashes, e.g. pbkdf2:sha256:150000
+    """
+    method = current_app.config.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256')
+    if method.startswith('pbkdf2:') and method.count(':') == 1:
+        method += ':{}'.format(DEFAULT_PBKDF2_ITERATIONS)
+    return method
+
+
+def hash_password(password):
+    """
+    Returns a salted hash of password using PASSWORD_HASH_METHOD
+    """
+    return get_hash_pool().run(generate_password_hash, password, hash_method(),
+                               current_app.config.get('PASSWORD_SALT_LENGTH', 8))
+
+
+def check_password(password_hash, password):
+    """
+    Returns True if password matches password_hash
+    """
+    if not password_hash:
+        return False
+    return get_hash_pool().run(check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash):
+    """
+    Returns True if password_hash was made with another method or
+    cost than PASSWORD_HASH_METHOD
+    """
+    return password_hash.split('$', 1)[0] != hash_method()
@@ -0,0 +1,128 @@
+"""
+    app.revocation
+    ~~~~~~~~~~~~~~
+
+    Per-worker cache of revoked token identifiers.
+
+    Nearly every token checked on a protected request has not been
+    revoked. A Bloom filter built from the blacklist table answers
+    "definitely not revoked" without a query; only tokens the filter
+    matches are confirmed against the database, and the answers are
+    kept in an LRU cache. The filter is refreshed incrementally from
+    the blacklist table, so a token revoked through another worker is
+    rejected here after at most REVOCATION_REFRESH_INTERVAL seconds.
+    Tokens revoked through this worker are rejected immediately.
+
+"""
+
+import os
+import threading
+import time
+
+from flask import current_app
+from app.cache import BloomFilter, LRUCache
+from app.models import Blacklist
+
+
+class RevocationCache:
+    """
+    Bloom filter and LRU cache in front of Blacklist.is_blacklisted
+    """
+
+    def __init__(self, capacity=100000, error_rate=0.001, refresh_interval=2,
+                 overlap=100, lru_size=10000):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_interval = refresh_interval
+        #: Each refresh re-reads this many ids below the highest id seen
+        #: so rows whose transactions commit out of id order are not missed
+        self.overlap = overlap
+        self.lru_size = lru_size
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self.bloom = BloomFilter(self.capacity, self.error_rate)
+        self.results = LRUCache(self.lru_size)
+        self._last_id = 0
+        self._refreshed = 0
+        self.queries = 0
+
+    def refresh(self, force=False):
+        """
+        Adds identifiers revoked since the last refresh to the filter.
+        The filter is rebuilt once it holds more than its capacity, with
+        room for twice the identifiers it starts with.
+        """
+        now = time.time()
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            if not force and now - self._refreshed < self.refresh_interval:
+                return
+            if self.bloom.count > self.bloom.capacity:
+                rows = Blacklist().since(0)
+                #: A filter sized for the rows alone would be over capacity
+                #: again at once and rebuilt on every refresh
+                self.bloom = BloomFilter(max(self.capacity, 2 * len(rows)), self.error_rate)
+            else:
+                start = max(0, self._last_id - self.overlap) if self._last_id else 0
+                rows = Blacklist().since(start)
+            for row in rows:
+                if row['jti'] not in self.bloom:
+                    self.bloom.add(row['jti'])
+                #: Drop a cached "not revoked" answer from a false positive
+                self.results.delete(row['jti'])
+                self._last_id = max(self._last_id, row['id'])
+            self._refreshed = now
+
+    def is_revoked(self, jti):
+        """
+        Returns True if the token identified by jti has been revoked
+        """
+        self.refresh()
+        if jti not in self.bloom:
+            return False
+        revoked = self.results.get(jti)
+        if revoked is LRUCache.MISSING:
+            self.queries += 1
+            revoked = Blacklist().is_blacklisted(jti)
+            self.results.set(jti, revoked)
+        return revoked
+
+    def revoke(self, jti):
+        """
+        Records a token revoked by this worker
+        """
+        with self._lock:
+            self.bloom.add(jti)
+        self.results.set(jti, True)
+
+    def stats(self):
+        """
+        Returns the cache's counters for monitoring
+        """
+        stats = self.results.stats()
+        stats.update({'filter_count': self.bloom.count,
+                      'queries': self.queries})
+        return stats
+
+
+def get_revocation_cache():
+    """
+    Returns the current app's revocation cache, or None when it is
+    disabled with REVOCATION_CACHE = False
+    """
+    app = current_app._get_current_object()
+    if not app.config.get('REVOCATION_CACHE', True):
+        return None
+    cache = app.extensions.get('revocation_cache')
+    if cache is None:
+        cache = app.extensions.setdefault('revocation_cache', RevocationCache(
+            capacity=app.config.get('REVOCATION_BLOOM_CAPACITY', 100000),
+            error_rate=app.config.get('REVOCATION_BLOOM_ERROR_RATE', 0.001),
+            refresh_interval=app.config.get('REVOCATION_REFRESH_INTERVAL', 2),
+            lru_size=app.config.get('REVOCATION_LRU_SIZE', 10000)
+            ))
+    return cache
@@ -0,0 +1,159 @@
+"""
+    app.rows
+    ~~~~~~~~
+
+    Compact rows for query results.
+
+    RealDictCursor makes a dict per row, each repeating the column
+    names in its own hash table. A Row is a tuple of the values; the
+    names and their positions are kept once, on a Row class shared by
+    every row of the same columns. Rows read like dicts (row['id'],
+    get, keys, items, `in`, dict(row)) but cannot be changed, and only
+    become dicts when they are encoded (see app.encoding) or copied
+    with dict(row).
+
+"""
+
+from collections.abc import Mapping
+
+from psycopg2.extensions import cursor as _cursor
+
+#: Row classes by column names
+_classes = {}
+
+#: Number of row classes kept. Clients choose the columns of sparse
+#: fieldsets, so the classes are dropped rather than kept without bound
+MAX_CLASSES = 256
+
+
+class Row(tuple):
+    """
+    A read-only mapping of column names to the values of a row
+    """
+
+    __slots__ = ()
+
+    #: Set on the class made for each set of columns by row_class()
+    _fields = ()
+    _index = {}
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                key = self._index[key]
+            except KeyError:
+                raise KeyError(key) from None
+        return tuple.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        index = self._index.get(key)
+        return default if index is None else tuple.__getitem__(self, index)
+
+    def keys(self):
+        return self._fields
+
+    def values(self):
+        return tuple(tuple.__iter__(self))
+
+    def items(self):
+        return zip(self._fields, tuple.__iter__(self))
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __eq__(self, other):
+        if isinstance(other, Mapping):
+            return self.as_dict() == dict(other.items())
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'Row({!r})'.format(self.as_dict())
+
+    def __reduce__(self):
+        return _make_row, (self._fields, tuple(tuple.__iter__(self)))
+
+    def as_dict(self):
+        """
+        Returns the row as a new dict
+        """
+        return dict(zip(self._fields, tuple.__iter__(self)))
+
+    def without(self, *names):
+        """
+        Returns a row without the columns called names
+        """
+        fields = tuple(field for field in self._fields if field not in names)
+        return row_class(fields)(self[field] for field in fields)
+
+
+Mapping.register(Row)
+
+
+def row_class(fields):
+    """
+    Returns the Row class for a tuple of column names
+    """
+    cls = _classes.get(fields)
+    if cls is None:
+        if len(_classes) >= MAX_CLASSES:
+            _classes.clear()
+        cls = type('Row', (Row,), {'__slots__': (), '_fields': fields,
+                                   '_index': {name: index for index, name in enumerate(fields)}})
+        _classes[fields] = cls
+    return cls
+
+
+def _make_row(fields, values):
+    return row_class(fields)(values)
+
+
+class RowCursor(_cursor):
+    """
+    A cursor returning Rows
+    """
+
+    def execute(self, query, vars=None):
+        self._row_class = None
+        return super().execute(query, vars)
+
+    def _make(self):
+        #: Named cursors only describe their result once it is fetched
+        if getattr(self, '_row_class', None) is None:
+            self._row_class = row_class(tuple(column.name for column in self.description))
+        return self._row_class
+
+    def fetchone(self):
+        row = super().fetchone()
+        return row if row is None else self._make()(row)
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(size) if size is not None else super().fetchmany()
+        return list(map(self._make(), rows)) if rows else rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        return list(map(self._make(), rows)) if rows else rows
+
+    def __iter__(self):
+        #: The cursor is its own iterator, next() reads its rows
+        rows = super().__iter__()
+        try:
+            row = next(rows)
+        except StopIteration:
+            return
+        make = self._make()
+        while True:
+            yield make(row)
+            try:
+                row = next(rows)
+            except StopIteration:
+                return
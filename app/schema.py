@@ -0,0 +1,150 @@
+"""
+    app.schema
+    ~~~~~~~~~~
+
+    Validation of request payloads.
+
+    A Schema is declared once, at import, from Fields naming each value,
+    whether it is required and the function that checks it. Schema.load
+    validates a payload in a single pass and Schema.load_many a list of
+    them, for batch endpoints. Errors keep the responses of the
+    reqparse parsers the schemas replace: a missing value is reported
+    as {"message": {<field>: <message>}}, unknown values (strict
+    schemas) as {"message": "Unknown arguments: ..."} and an invalid
+    value as {"status": 400, "error": <message>}.
+
+"""
+
+from flask import request
+from werkzeug.datastructures import MultiDict
+
+from app.encoding import output_json
+
+#: Kinds of errors, in the order they take precedence
+MISSING, UNKNOWN, INVALID = 'missing', 'unknown', 'invalid'
+
+
+class Invalid(Exception):
+    """
+    Raised for a payload that fails validation
+    """
+
+    def __init__(self, kind, message, field=None):
+        super().__init__(message)
+        self.kind = kind
+        self.message = message
+        self.field = field
+
+    def response(self):
+        """
+        Returns the error response for the failure
+        """
+        if self.kind == MISSING:
+            return output_json({'message': {self.field: self.message}}, 400)
+        if self.kind == UNKNOWN:
+            return output_json({'message': self.message}, 400)
+        return output_json({'status': 400, 'error': self.message}, 400)
+
+
+class Field:
+    """
+    A value of a payload
+
+    required -> True if the value must be given; `missing` is the
+    message when it isn't
+    check -> function returning a false value if the value is invalid;
+    `invalid` is the message then. Values of optional fields are only
+    checked when they are not empty.
+    clean -> True to keep the value returned by check instead of the
+    value given
+    """
+
+    __slots__ = ('name', 'required', 'missing', 'check', 'invalid', 'clean')
+
+    def __init__(self, name, required=False, missing=None, check=None, invalid=None,
+                 clean=False):
+        self.name = name
+        self.required = required
+        self.missing = missing or 'Missing required parameter in the JSON body or the post ' \
+                                  'body or the query string'
+        self.check = check
+        self.invalid = invalid
+        self.clean = clean
+
+
+class Schema:
+    """
+    The fields of a payload. strict -> True to reject values that are
+    not one of the fields.
+    """
+
+    def __init__(self, *fields, strict=False):
+        self.fields = tuple((field.name, field.required, field.missing, field.check,
+                             field.invalid, field.clean) for field in fields)
+        self.names = frozenset(field.name for field in fields)
+        self.strict = strict
+
+    def load(self, payload):
+        """
+        Returns the values of the fields in payload (a mapping), None
+        for the optional ones not given. Values that are not strings
+        are converted to strings. Raises Invalid for the first missing
+        value, else for unknown values, else for the first invalid one.
+        """
+        data = {}
+        invalid = None
+        for name, required, missing, check, message, clean in self.fields:
+            value = payload.get(name)
+            if value is None:
+                if required:
+                    raise Invalid(MISSING, missing, name)
+                data[name] = None
+                continue
+            if not isinstance(value, str):
+                value = str(value)
+            if check is not None and invalid is None and (required or value):
+                checked = check(value)
+                if not checked:
+                    invalid = Invalid(INVALID, message, name)
+                elif clean:
+                    value = checked
+            data[name] = value
+        if self.strict:
+            unknown = [name for name in payload if name not in self.names]
+            if unknown:
+                raise Invalid(UNKNOWN, 'Unknown arguments: ' + ', '.join(unknown))
+        if invalid is not None:
+            raise invalid
+        return data
+
+    def load_many(self, payloads):
+        """
+        Validates a list of payloads. Returns the values of the valid
+        ones and a list of (index, Invalid) for the others.
+        """
+        loaded, errors = [], []
+        for index, payload in enumerate(payloads):
+            try:
+                loaded.append(self.load(payload))
+            except Invalid as error:
+                errors.append((index, error))
+        return loaded, errors
+
+    def parse(self):
+        """
+        Validates the current request's payload, see request_payload()
+        """
+        return self.load(request_payload())
+
+
+def request_payload():
+    """
+    Returns the values of the request's JSON body followed by those of
+    its query string and form, as reqparse reads them
+    """
+    payload = MultiDict()
+    body = request.json
+    if isinstance(body, dict):
+        payload.update(body)
+    payload.update(request.values)
+    return payload
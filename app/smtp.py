@@ -0,0 +1,101 @@
+"""
+    app.smtp
+    ~~~~~~~~
+
+    A local SMTP server that accepts every message and keeps it, for
+    development and tests. Point MAIL_SERVER/MAIL_PORT at it:
+
+        flask smtp-standin --port 1025
+        MAIL_SERVER=localhost MAIL_PORT=1025 flask run
+
+"""
+
+import socketserver
+import threading
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        server = self.server
+        sender, recipients = None, []
+        self.reply('220 localhost SMTP stand-in')
+        for line in self.rfile:
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command[:4].upper()
+            if server.fail_next:
+                server.fail_next -= 1
+                self.reply('421 Service not available')
+                return
+            if verb in ('HELO', 'EHLO'):
+                self.reply('250 localhost')
+            elif verb == 'MAIL':
+                sender, recipients = command.split(':', 1)[1].strip(), []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                recipients.append(command.split(':', 1)[1].strip())
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                for data_line in self.rfile:
+                    if data_line in (b'.\r\n', b'.\n'):
+                        break
+                    data.append(data_line[1:] if data_line.startswith(b'..') else data_line)
+                server.deliver(sender, recipients, b''.join(data))
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                #: RSET, NOOP and anything else
+                self.reply('250 OK')
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """
+    An SMTP server on host:port (port 0 picks a free one) that keeps
+    the messages it receives in `messages` as (sender, recipients,
+    data) tuples
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='localhost', port=0, on_message=None):
+        super().__init__((host, port), _Handler)
+        self.port = self.server_address[1]
+        self.messages = []
+        self.on_message = on_message
+        #: Number of commands to answer with an error, to test retries
+        self.fail_next = 0
+        #: Number of connections accepted
+        self.connections = 0
+        self._thread = None
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        super().process_request(request, client_address)
+
+    def deliver(self, sender, recipients, data):
+        self.messages.append((sender, recipients, data))
+        if self.on_message is not None:
+            self.on_message(sender, recipients, data)
+
+    def start(self):
+        """
+        Serves in a background thread
+        """
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stops serving and closes the socket
+        """
+        self.shutdown()
+        self.server_close()
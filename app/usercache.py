@@ -0,0 +1,104 @@
+"""
+    app.usercache
+    ~~~~~~~~~~~~~
+
+    Cache of user rows looked up by username.
+
+    A lookup is first memoised for the rest of the request, in `g`,
+    then kept in a bounded per-worker LRU cache for USER_CACHE_TTL
+    seconds. Updating or deleting a user through this worker drops its
+    entries at once; another worker's changes are seen after at most
+    USER_CACHE_TTL seconds. Password hashes are never cached.
+
+"""
+
+from flask import current_app, g, has_app_context
+from app.cache import LRUCache
+
+
+class UserCache:
+    """
+    Request memo and LRU cache in front of User.by_username
+    """
+
+    def __init__(self, maxsize=10000, ttl=60):
+        self.users = LRUCache(maxsize, ttl)
+        #: Lookups answered by the request memo
+        self.request_hits = 0
+
+    @staticmethod
+    def _memo():
+        if not has_app_context():
+            return None
+        if 'users' not in g:
+            g.users = {}
+        return g.users
+
+    def get(self, username, load):
+        """
+        Returns a copy of the user cached for username, calling
+        load(username) on a miss. Users that do not exist are not
+        cached.
+        """
+        memo = self._memo()
+        if memo is not None and username in memo:
+            self.request_hits += 1
+            return dict(memo[username])
+        user = self.users.get(username)
+        if user is LRUCache.MISSING:
+            user = load(username)
+            if not user:
+                return user
+            user = {key: value for key, value in user.items() if key != 'password_hash'}
+            self.users.set(username, user)
+        if memo is not None:
+            memo[username] = user
+        return dict(user)
+
+    def invalidate(self, user_id):
+        """
+        Drops the entries of the user with the given id
+        """
+        memo = self._memo()
+        if memo is not None:
+            for username in [name for name, user in memo.items() if user['id'] == user_id]:
+                del memo[username]
+        for username, user in self.users.items():
+            if user['id'] == user_id:
+                self.users.delete(username)
+
+    def clear(self):
+        """
+        Drops all entries
+        """
+        memo = self._memo()
+        if memo is not None:
+            memo.clear()
+        self.users.clear()
+
+    def stats(self):
+        """
+        Returns the cache's counters for monitoring
+        """
+        stats = self.users.stats()
+        stats['request_hits'] = self.request_hits
+        return stats
+
+
+def get_user_cache():
+    """
+    Returns the current app's user cache, or None when it is disabled
+    with USER_CACHE = False or there is no app context
+    """
+    if not has_app_context():
+        return None
+    app = current_app._get_current_object()
+    if not app.config.get('USER_CACHE', True):
+        return None
+    cache = app.extensions.get('user_cache')
+    if cache is None:
+        cache = app.extensions.setdefault('user_cache', UserCache(
+            maxsize=app.config.get('USER_CACHE_SIZE', 10000),
+            ttl=app.config.get('USER_CACHE_TTL', 60)
+            ))
+    return cache
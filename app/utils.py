@@ -6,10 +6,21 @@
 
 """
 
+import base64
+import binascii
+import hashlib
+import json
 import re
-from flask import jsonify
+from collections.abc import Mapping
+from datetime import datetime, timedelta, timezone
+from flask import request, Response, stream_with_context
+from werkzeug.http import http_date, quote_etag
+from flask_jwt_extended import get_jwt_claims, get_jwt_identity
 from app import jwt
-from app.models import Blacklist
+from app.encoding import dumps, format_datetime, output_json
+from app.models import Blacklist, User
+from app.revocation import get_revocation_cache
+from app.rows import Row
 
 EMAIL_PATTERN = re.compile(r'^.+@[\w]+\.[\w]+')
 PASSWORD_PATTERN = re.compile(r'.{5,}')
@@ -17,6 +28,8 @@ COMMENT_PATTERN = re.compile(r'.{1,}')
 USERNAME_PATTERN = re.compile(r"^[a-zA-Z][\w]{3,}")
 STATUS_PATTERN = re.compile(r'^(resolved|unresolved|under investigation)$', re.IGNORECASE)
 
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
 def valid_field(field, regex_pattern):
     """
     Returns field if valid else None
@@ -33,10 +46,8 @@ def raise_error(status_code, message):
     """
     Returns a template for generating a custom error message
     """
-    response = jsonify({"status": status_code,
-                        "error": message})
-    response.status_code = status_code
-    return response
+    return output_json({"status": status_code,
+                        "error": message}, status_code)
 
 def valid_location(location):
     """
@@ -89,14 +100,147 @@ def valid_password(password):
 
 def update_createdon(data_item):
     """
-    updates the createdon field's datetime data into
+    updates the createdon (and updatedon) field's datetime data into
     a string representation of the date.
     Returns a new dictionary item with the field
     updated
+    Rows (app.rows.Row) are returned as they are, their dates are
+    formatted when they are encoded
     """
-    data_item['createdon'] = data_item['createdon'].strftime('%a, %d %b %Y %H:%M %p')
+    if isinstance(data_item, Row):
+        return data_item
+    for field in ('createdon', 'updatedon'):
+        if data_item.get(field) is not None:
+            data_item[field] = format_datetime(data_item[field])
     return data_item
 
+def parse_datetime(value):
+    """
+    Parses an ISO 8601 date (2018-12-01) or UTC date and time
+    (2018-12-01T08:30:00) into an aware datetime. Raises ValueError
+    if value has neither format.
+    """
+    for date_format in ('%Y-%m-%d', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M'):
+        try:
+            return datetime.strptime(value, date_format).replace(tzinfo=timezone.utc)
+        except ValueError:
+            pass
+    raise ValueError("Invalid date '{}'".format(value))
+
+def parse_fields(fields, allowed):
+    """
+    Parses the value of a `fields` query parameter, a comma separated
+    list of field names, into a list. Returns the allowed fields if
+    fields is empty. Raises ValueError if a name is not allowed.
+    """
+    if not fields:
+        return list(allowed)
+    names = []
+    for name in fields.split(','):
+        name = name.strip().lower()
+        if name not in allowed:
+            raise ValueError("Unknown field '{}'".format(name))
+        if name not in names:
+            names.append(name)
+    return names
+
+def only(data_item, fields):
+    """
+    Returns data_item without the keys that are not in fields
+    """
+    if len(data_item) == len(fields):
+        return data_item
+    return {key: value for key, value in data_item.items() if key in fields}
+
+def encode_cursor(key):
+    """
+    Returns an opaque pagination cursor for a (createdon, id) key or
+    the (rank, id) key of a search result
+    """
+    value, _id = key
+    if isinstance(value, datetime):
+        value = (value - EPOCH) // timedelta(microseconds=1)
+    data = json.dumps([value, _id]).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii')
+
+def decode_cursor(cursor):
+    """
+    Returns the (createdon, id) or (rank, id) key of a cursor made by
+    encode_cursor. Raises ValueError if the cursor is malformed.
+    """
+    try:
+        value, _id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        assert isinstance(_id, int)
+        if isinstance(value, float):
+            return value, _id
+        assert isinstance(value, int)
+        return EPOCH + timedelta(microseconds=value), _id
+    except (AssertionError, TypeError, ValueError, OverflowError, binascii.Error):
+        raise ValueError('Invalid cursor')
+
+def stream_collection(items, status=200, encoded=False):
+    """
+    Returns a response that writes the {"status": ..., "data": [...]}
+    envelope for an iterable of items incrementally instead of
+    building it in memory
+
+    encoded -> True if items are already JSON text
+    """
+    def generate():
+        yield '{{"status": {}, "data": ['.format(status).encode('utf-8')
+        for index, item in enumerate(items):
+            item = item.encode('utf-8') if encoded else dumps(item)
+            yield (b',' if index else b'') + item
+        yield b']}\n'
+
+    return Response(stream_with_context(generate()), status=status,
+                    mimetype='application/json')
+
+def make_etag(*parts):
+    """
+    Returns an entity tag for a representation identified by parts
+    """
+    return hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+
+def page_version(records, last):
+    """
+    Returns the entity tag and the latest update time of a page of
+    records, from the id and updatedon of each and the key of the page
+    after it. Any change to the records on the page changes them.
+    """
+    keys = tuple((record['id'], record['updatedon']) for record in records)
+    etag = make_etag(keys, last, request.query_string)
+    return etag, max((updatedon for _, updatedon in keys), default=None)
+
+def validators(etag, last_modified=None):
+    """
+    Returns the ETag and Last-Modified headers of a response
+    """
+    headers = {'ETag': quote_etag(etag, weak=True)}
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(last_modified)
+    return headers
+
+def not_modified(etag, last_modified=None):
+    """
+    Returns a 304 response if the request's If-None-Match, or if it
+    has none its If-Modified-Since, shows the client's copy is
+    current. Returns None otherwise.
+    """
+    if request.if_none_match:
+        current = request.if_none_match.contains_weak(etag)
+    elif request.if_modified_since and last_modified is not None:
+        since = request.if_modified_since
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        #: HTTP dates have whole seconds
+        current = last_modified.replace(microsecond=0) <= since
+    else:
+        current = False
+    if not current:
+        return None
+    return Response(status=304, headers=validators(etag, last_modified))
+
 def can_update(parser, field, data_validator):
     '''
     Return field data if it is valid otherwise return None
@@ -112,6 +256,85 @@ def check_if_token_in_blacklist(decrypted_token):
     otherwise
     """
 
+    jti = decrypted_token['jti']
+    cache = get_revocation_cache()
+    if cache is not None:
+        return cache.is_revoked(jti)
+    BLACKLIST = Blacklist()
+    return BLACKLIST.is_blacklisted(jti)
+
+def token_expiry(decrypted_token):
+    """
+    Returns the expiry time of a decoded token as an aware datetime
+    """
+    return datetime.fromtimestamp(decrypted_token['exp'], timezone.utc)
+
+def revoke_token(decrypted_token):
+    """
+    Adds a decoded token to the blacklist. The token is rejected by
+    this worker right away and by the others on their next refresh.
+    """
     BLACKLIST = Blacklist()
     jti = decrypted_token['jti']
-    return BLACKLIST.is_blacklisted(jti)
\ No newline at end of file
+    BLACKLIST.add(jti=jti, expires=token_expiry(decrypted_token))
+    cache = get_revocation_cache()
+    if cache is not None:
+        cache.revoke(jti)
+
+@jwt.user_identity_loader
+def user_identity_lookup(user):
+    """
+    Tokens are created from a user's row or dictionary (or a username).
+    Their identity is the username.
+    """
+    return user['username'] if isinstance(user, Mapping) else user
+
+@jwt.user_claims_loader
+def add_claims_to_access_token(user):
+    """
+    Stores the user's id and admin status in access tokens so that
+    requests don't have to look the user up. `ver` is the user's
+    claims version at the time the token was created.
+    """
+    if not isinstance(user, Mapping):
+        return {}
+    return {'id': user['id'],
+            'isadmin': bool(user['isadmin']),
+            'ver': user['claims_version']}
+
+def get_current_user():
+    """
+    Returns a dictionary with the id, username and admin status of
+    the user making the request, read from the token's claims.
+    Tokens issued without claims fall back to a database lookup.
+    Returns None if the user no longer exists.
+    """
+    username = get_jwt_identity()
+    claims = get_jwt_claims()
+    if 'id' in claims:
+        return {'id': claims['id'],
+                'username': username,
+                'isadmin': claims['isadmin'],
+                'ver': claims['ver']}
+    #: Not the cache: is_admin trusts this row's isadmin with ver None
+    user = User().by_username(username, cached=False)
+    if not user:
+        return None
+    #: ver is None as the data is already current
+    return {'id': user['id'],
+            'username': username,
+            'isadmin': user['isadmin'],
+            'ver': None}
+
+def is_admin(user):
+    """
+    Returns True if user (as returned by get_current_user) is an
+    admin. Admin claims are only trusted while their version matches
+    the user's current claims version, so demoting an admin takes
+    effect immediately.
+    """
+    if not user or not user.get('isadmin'):
+        return False
+    if user.get('ver') is None:
+        return True
+    return User().claims_version(user['id']) == user['ver']
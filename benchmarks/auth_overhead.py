@@ -0,0 +1,57 @@
+"""
+    benchmarks.auth_overhead
+    ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Measures the per-request cost of the token revocation check with
+    and without the in-process revocation cache.
+
+    Needs the test database (TEST_DB_URL). Run from the project root:
+
+        python -m benchmarks.auth_overhead
+"""
+
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from app import create_app
+from app.db import db
+from app.models import Blacklist
+from app.utils import check_if_token_in_blacklist
+from config import TestConfig
+
+REQUESTS = 5000
+REVOKED = 10000
+
+
+def run(cache_enabled):
+    TestConfig.REVOCATION_CACHE = cache_enabled
+    app = create_app(TestConfig)
+    with app.app_context():
+        token = {'jti': str(uuid.uuid4())}
+        check_if_token_in_blacklist(token)
+        started = time.perf_counter()
+        for _ in range(REQUESTS):
+            check_if_token_in_blacklist(token)
+        elapsed = time.perf_counter() - started
+    return elapsed / REQUESTS * 1e6
+
+
+def main():
+    app = create_app(TestConfig)
+    with app.app_context():
+        db.init_db()
+        BLACKLIST = Blacklist()
+        expires = datetime.now(timezone.utc) + timedelta(hours=1)
+        for _ in range(REVOKED):
+            BLACKLIST.add(jti=str(uuid.uuid4()), expires=expires)
+        try:
+            for enabled in (False, True):
+                print('revocation cache {:<8} {:8.1f} us/request'.format(
+                    'enabled' if enabled else 'disabled', run(enabled)))
+        finally:
+            db.clear_tables()
+
+
+if __name__ == '__main__':
+    main()
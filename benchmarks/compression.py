@@ -0,0 +1,63 @@
+"""
+    benchmarks.compression
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    Measures the bytes sent and the server time spent for incident
+    listings with and without gzip, and the transfer time saved on a
+    slow mobile link.
+
+    Needs the test database (TEST_DB_URL). Run from the project root:
+
+        python -m benchmarks.compression
+"""
+
+import json
+import time
+
+from app import create_app
+from app.db import db
+from app.helpers import make_token_header
+from app.models import Record, User
+from config import TestConfig
+
+RECORDS = 5000
+REPEAT = 20
+#: Bytes per second of the link the transfer time is estimated for
+LINK_SPEED = 1000000 / 8
+
+
+def measure(client, url, headers):
+    size, started = 0, time.perf_counter()
+    for _ in range(REPEAT):
+        size = len(client.get(url, headers=headers).data)
+    return size, (time.perf_counter() - started) / REPEAT * 1000
+
+
+def main():
+    app = create_app(TestConfig)
+    with app.app_context():
+        db.init_db()
+        user = User().add(username='bench', password='bench-password')
+        for n in range(RECORDS):
+            Record().add(location='-1.23, 36.5', comment='crooked tendering {}'.format(n),
+                         _type='red-flag', user_id=user['id'])
+    try:
+        client = app.test_client()
+        resp = client.post('/api/v2/auth/login',
+                           data={'username': 'bench', 'password': 'bench-password'})
+        headers = make_token_header(json.loads(resp.data.decode('utf-8'))['data'][0]['access_token'])
+        for url in ('/api/v2/red-flags?limit=50', '/api/v2/red-flags?limit=500',
+                    '/api/v2/red-flags?stream=true'):
+            plain_size, plain_ms = measure(client, url, headers)
+            gzip_size, gzip_ms = measure(client, url, dict(headers, **{'Accept-Encoding': 'gzip'}))
+            saved_ms = (plain_size - gzip_size) / LINK_SPEED * 1000 - (gzip_ms - plain_ms)
+            print('{:<32} {:>9} -> {:>8} bytes  server {:6.1f} -> {:6.1f} ms  '
+                  '{:7.0f} ms saved at 1 Mbit/s'.format(url, plain_size, gzip_size,
+                                                        plain_ms, gzip_ms, saved_ms))
+    finally:
+        with app.app_context():
+            db.clear_tables()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+    benchmarks.db_rendering
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    Measures the time to produce the body of a red-flags listing over
+    100k records, streamed whole and as 500 record pages, when rows are
+    fetched as dicts and encoded in Python against DB_RENDERING, where
+    the database renders them as JSON.
+
+    Needs the test database (TEST_DB_URL). Run from the project root:
+
+        python -m benchmarks.db_rendering
+"""
+
+import time
+
+from app import create_app
+from app.db import db
+from app.encoding import output_json, output_rendered
+from app.models import Record, User
+from app.utils import encode_cursor, only, stream_collection, update_createdon
+from config import TestConfig
+
+RECORDS = 100000
+PAGE_SIZE = 500
+REPEAT = 3
+
+CONDITIONS = [('type', '=', 'red-flag')]
+
+
+def stream(rendered):
+    RECORD = Record()
+    if rendered:
+        response = stream_collection(RECORD.iter_filtered(CONDITIONS, rendered=True),
+                                     encoded=True)
+    else:
+        response = stream_collection(map(update_createdon, RECORD.iter_filtered(CONDITIONS)))
+    return len(b''.join(response.response))
+
+
+def pages(rendered):
+    RECORD = Record()
+    fields = list(Record.FIELDS)
+    after, size = None, 0
+    while True:
+        if rendered:
+            data, after, _ = RECORD.page_rendered(CONDITIONS, PAGE_SIZE, after, fields)
+            response = output_rendered(data, next=encode_cursor(after) if after else None)
+        else:
+            data, after = RECORD.page(CONDITIONS, PAGE_SIZE, after, fields)
+            data = [only(update_createdon(row), fields) for row in data]
+            response = output_json({'status': 200, 'data': data,
+                                    'next': encode_cursor(after) if after else None}, 200)
+        size += len(response.get_data())
+        if after is None:
+            return size
+
+
+def timed(func, rendered):
+    best = float('inf')
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        func(rendered)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main():
+    app = create_app(TestConfig)
+    with app.test_request_context():
+        db.init_db()
+        USER = User()
+        USER.add(username='bench', password='bench-password')
+        user_id = USER.by_username('bench', cached=False)['id']
+        USER.query("""
+            insert into records (type, comment, location, status, images, videos, uri,
+                                 createdby, user_id, createdon)
+            select 'red-flag', 'crooked tendering processes ' || n, '-1.23, 36.5', 'draft',
+                   '{}', '{}', '/api/v2/red-flags/' || n, %s, %s,
+                   timestamptz '2018-12-03' + n * interval '1 minute'
+            from generate_series(1, %s) as n;""", (user_id, user_id, RECORDS))
+        USER.commit()
+        try:
+            for name, func in (('stream', stream), ('pages of {}'.format(PAGE_SIZE), pages)):
+                baseline = timed(func, False)
+                elapsed = timed(func, True)
+                print('{:<14} python {:7.0f} ms  database {:7.0f} ms  {:4.1f}x'.format(
+                    name, baseline, elapsed, baseline / elapsed))
+        finally:
+            db.clear_tables()
+
+
+if __name__ == '__main__':
+    main()
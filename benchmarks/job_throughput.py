@@ -0,0 +1,55 @@
+"""
+    benchmarks.job_throughput
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Measures how many no-op jobs per second `flask worker` processes
+    claim, run and delete.
+
+    Needs the test database (TEST_DB_URL). Run from the project root:
+
+        python -m benchmarks.job_throughput
+"""
+
+import time
+
+from psycopg2.extras import execute_values
+
+from app import create_app
+from app.db import db
+from app.jobs import run_workers, task
+from config import TestConfig
+
+JOBS = 20000
+
+
+@task('noop')
+def noop():
+    pass
+
+
+def enqueue(count):
+    conn = db.get_db()
+    with conn.cursor() as cursor:
+        execute_values(cursor, "insert into jobs (task, max_attempts) values %s",
+                       [('noop', 5)] * count)
+    conn.commit()
+
+
+def main():
+    app = create_app(TestConfig)
+    with app.app_context():
+        db.init_db()
+        try:
+            for processes in (1, 2, 4):
+                enqueue(JOBS)
+                started = time.perf_counter()
+                done = run_workers(app, processes, burst=True)
+                elapsed = time.perf_counter() - started
+                assert done == JOBS
+                print('{} processes {:8.0f} jobs/s'.format(processes, done / elapsed))
+        finally:
+            db.clear_tables()
+
+
+if __name__ == '__main__':
+    main()
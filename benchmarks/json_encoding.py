@@ -0,0 +1,68 @@
+"""
+    benchmarks.json_encoding
+    ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Measures the time to encode a 10k record listing: Flask-RESTful's
+    stdlib representation after formatting dates with strftime, as
+    the API did before, against each encoder in app.encoding. Needs no
+    database.
+
+        python -m benchmarks.json_encoding
+"""
+
+import time
+from datetime import datetime, timedelta, timezone
+
+from flask_restful.representations.json import output_json as restful_output_json
+
+from app import create_app
+from app.encoding import ENCODERS, output_json
+from config import TestConfig
+
+RECORDS = 10000
+REPEAT = 10
+
+
+def rows():
+    createdon = datetime(2018, 12, 3, tzinfo=timezone.utc)
+    return [{'id': n, 'type': 'red-flag', 'comment': 'crooked tendering processes {}'.format(n),
+             'location': '-1.23, 36.5', 'status': 'draft', 'images': [], 'videos': [],
+             'uri': '/api/v2/red-flags/{}'.format(n), 'createdby': 7, 'user_id': 7,
+             'latitude': -1.23, 'longitude': 36.5,
+             'createdon': createdon + timedelta(minutes=n), 'updatedon': createdon}
+            for n in range(RECORDS)]
+
+
+def strftime_dates(row):
+    for field in ('createdon', 'updatedon'):
+        row[field] = row[field].strftime('%a, %d %b %Y %H:%M %p')
+    return row
+
+
+def timed(func):
+    best = float('inf')
+    for _ in range(REPEAT):
+        data = rows()
+        started = time.perf_counter()
+        func(data)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main():
+    app = create_app(TestConfig)
+    #: Flask-RESTful indents its output in debug mode
+    app.debug = False
+    with app.test_request_context():
+        baseline = timed(lambda data: restful_output_json(
+            {'status': 200, 'data': [strftime_dates(row) for row in data]}, 200))
+        print('{:<28} {:7.1f} ms'.format('flask-restful json', baseline))
+        for name in sorted(ENCODERS):
+            app.config['JSON_ENCODER'] = name
+            elapsed = timed(lambda data: output_json({'status': 200, 'data': data}, 200))
+            print('{:<28} {:7.1f} ms  {:4.1f}x'.format('app.encoding ' + name, elapsed,
+                                                     baseline / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+    benchmarks.login_throughput
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Measures login throughput per core with passwords hashed inline
+    and on the hashing process pool, and the latency of a cheap request
+    served while the logins run.
+
+    Needs the test database (TEST_DB_URL). Run from the project root:
+
+        python -m benchmarks.login_throughput
+"""
+
+import os
+import statistics
+import threading
+import time
+
+from app import create_app
+from app.db import db
+from app.models import User
+from config import TestConfig
+
+THREADS = 8
+LOGINS = 200
+HASH_METHOD = 'pbkdf2:sha256:150000'
+
+
+def run(workers):
+    TestConfig.PASSWORD_HASH_WORKERS = workers
+    TestConfig.PASSWORD_HASH_METHOD = HASH_METHOD
+    app = create_app(TestConfig)
+    with app.app_context():
+        User().add(username='bench', password='bench-password')
+    done = threading.Event()
+    latencies = []
+
+    def login(count):
+        client = app.test_client()
+        for _ in range(count):
+            resp = client.post('/api/v2/auth/login',
+                               data={'username': 'bench', 'password': 'bench-password'})
+            assert resp.status_code == 200
+
+    def probe():
+        client = app.test_client()
+        while not done.is_set():
+            started = time.perf_counter()
+            client.get('/api/v2/red-flags')
+            latencies.append(time.perf_counter() - started)
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=login, args=(LOGINS // THREADS,))
+               for _ in range(THREADS)]
+    prober = threading.Thread(target=probe)
+    prober.start()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    done.set()
+    prober.join()
+    app.extensions['hash_pool'].shutdown()
+    with app.app_context():
+        db.clear_tables()
+    return LOGINS / elapsed, statistics.median(latencies) * 1000
+
+
+def main():
+    app = create_app(TestConfig)
+    with app.app_context():
+        db.init_db()
+    cores = os.cpu_count() or 1
+    for workers in (0, cores):
+        logins, latency = run(workers)
+        print('{:<14} {:7.1f} logins/s {:7.1f} logins/s/core '
+              '{:7.1f} ms median other request'.format(
+                  'inline' if not workers else '{} processes'.format(workers),
+                  logins, logins / cores, latency))
+
+
+if __name__ == '__main__':
+    main()
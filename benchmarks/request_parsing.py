@@ -0,0 +1,73 @@
+"""
+    benchmarks.request_parsing
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Measures the per-request cost of parsing and validating the create
+    and update incident payloads with reqparse and the app.utils
+    validators, as the endpoints did before, and with the app.schema
+    schemas. Needs no database.
+
+        python -m benchmarks.request_parsing
+"""
+
+import time
+
+from flask_restful import reqparse
+
+from app import create_app
+from app.api.v2.incidents import create_incident_schema, update_incident_schemas
+from app.utils import valid_comment, valid_location
+from config import TestConfig
+
+REQUESTS = 20000
+
+CREATE = {'comment': 'Crooked tendering processes at the county', 'location': '-1.28, 36.82'}
+UPDATE = {'comment': 'Tendering processes at the county'}
+
+create_parser = reqparse.RequestParser()
+create_parser.add_argument('comment', type=str, required=True, help='comment not provided')
+create_parser.add_argument('location', type=str, required=True, help='location not provided')
+
+
+def reqparse_create():
+    data = create_parser.parse_args(strict=True)
+    return valid_location(data['location']) and valid_comment(data['comment'])
+
+
+def reqparse_update():
+    parser = reqparse.RequestParser()
+    parser.add_argument('comment', type=str, required=True)
+    return valid_comment(parser.parse_args(strict=True)['comment'])
+
+
+def schema_create():
+    return create_incident_schema.parse()
+
+
+def schema_update():
+    return update_incident_schemas['comment'].parse()['comment']
+
+
+def timed(app, func, payload, as_json):
+    kwargs = {'json': payload} if as_json else {'data': payload}
+    with app.test_request_context('/', method='POST', **kwargs):
+        func()
+        started = time.perf_counter()
+        for _ in range(REQUESTS):
+            func()
+        return (time.perf_counter() - started) / REQUESTS * 1e6
+
+
+def main():
+    app = create_app(TestConfig)
+    for name, payload, old, new in (('create', CREATE, reqparse_create, schema_create),
+                                    ('update', UPDATE, reqparse_update, schema_update)):
+        for as_json in (False, True):
+            baseline = timed(app, old, payload, as_json)
+            elapsed = timed(app, new, payload, as_json)
+            print('{:<7} {:<5} reqparse {:6.1f} us  schema {:6.1f} us  {:4.1f}x'.format(
+                name, 'json' if as_json else 'form', baseline, elapsed, baseline / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+    benchmarks.row_memory
+    ~~~~~~~~~~~~~~~~~~~~~
+
+    Measures the memory held by the result of fetching 100k records
+    (all columns, as Record.page and Record.filter do) as
+    RealDictCursor dicts, as the models did before, and as app.rows
+    Rows, and the time to fetch and encode them.
+
+    Needs the test database (TEST_DB_URL). Run from the project root:
+
+        python -m benchmarks.row_memory
+"""
+
+import gc
+import time
+import tracemalloc
+
+from psycopg2.extras import RealDictCursor
+
+from app import create_app
+from app.db import db
+from app.encoding import dumps
+from app.models import Record, User
+from app.rows import RowCursor
+from config import TestConfig
+
+RECORDS = 100000
+
+
+def fetch(cursor_factory):
+    with db.get_db().cursor(cursor_factory=cursor_factory) as cursor:
+        cursor.execute(*Record().select([('type', '=', 'red-flag')], Record.FIELDS))
+        return cursor.fetchall()
+
+
+def measure(cursor_factory):
+    gc.collect()
+    tracemalloc.start()
+    rows = fetch(cursor_factory)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del rows
+    started = time.perf_counter()
+    dumps({'status': 200, 'data': fetch(cursor_factory)})
+    return size, time.perf_counter() - started
+
+
+def main():
+    app = create_app(TestConfig)
+    with app.test_request_context():
+        db.init_db()
+        USER = User()
+        USER.add(username='bench', password='bench-password')
+        user_id = USER.by_username('bench', cached=False)['id']
+        USER.query("""
+            insert into records (type, comment, location, status, images, videos, uri,
+                                 createdby, user_id, createdon)
+            select 'red-flag', 'crooked tendering processes ' || n, '-1.23, 36.5', 'draft',
+                   '{}', '{}', '/api/v2/red-flags/' || n, %s, %s,
+                   timestamptz '2018-12-03' + n * interval '1 minute'
+            from generate_series(1, %s) as n;""", (user_id, user_id, RECORDS))
+        USER.commit()
+        try:
+            baseline = None
+            for name, factory in (('RealDictCursor', RealDictCursor), ('RowCursor', RowCursor)):
+                size, elapsed = measure(factory)
+                baseline = baseline or size
+                print('{:<16} {:6.1f} MB per 100k rows  {:4.2f}x  fetch+encode {:6.0f} ms'.format(
+                    name, size / 1e6 * 100000 / RECORDS, baseline / size, elapsed * 1000))
+        finally:
+            db.clear_tables()
+
+
+if __name__ == '__main__':
+    main()
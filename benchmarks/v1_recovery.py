@@ -0,0 +1,77 @@
+"""
+    benchmarks.v1_recovery
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    Measures how long the durable v1 store takes to log writes under
+    each fsync policy, to write a snapshot of 1M records and to
+    restore them on start, from the snapshot and from a log alone.
+    Needs no database; files are written to a temporary directory.
+
+        python -m benchmarks.v1_recovery
+"""
+
+import gc
+import tempfile
+import time
+
+from app.api.v1.models import Record, Store
+from app.api.v1.persistence import Journal
+
+RECORDS = 1000000
+LOGGED = 100000
+SYNCED = 2000
+
+
+def fill(store, count):
+    for n in range(count):
+        record = Record(location='-1.23, 36.5', comment='crooked tendering processes {}'.format(n))
+        record.add_field('uri', 'http://localhost/api/v1/red-flags/{}'.format(record.data_id))
+        store.put(record.data_id, record)
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def open_store(path, **kwargs):
+    store = Store()
+    journal = Journal(path, snapshot_ops=0, **kwargs)
+    journal.open(store)
+    return store, journal
+
+
+def main():
+    for policy in ('never', 'interval', 'always'):
+        with tempfile.TemporaryDirectory() as path:
+            store, journal = open_store(path, fsync=policy)
+            count = SYNCED if policy == 'always' else LOGGED
+            elapsed, _ = timed(fill, store, count)
+            journal.close()
+            print('log writes, fsync {:<9} {:9.0f} writes/s'.format(policy, count / elapsed))
+
+    with tempfile.TemporaryDirectory() as path:
+        store, journal = open_store(path, fsync='never')
+        fill(store, LOGGED)
+        journal.close()
+        elapsed, (store, journal) = timed(open_store, path)
+        journal.close()
+        print('restore {} records from the log      {:6.2f} s'.format(LOGGED, elapsed))
+
+    with tempfile.TemporaryDirectory() as path:
+        store, journal = open_store(path, fsync='never')
+        fill(store, RECORDS)
+        elapsed, _ = timed(journal.compact)
+        journal.close()
+        print('snapshot of {} records              {:6.2f} s'.format(RECORDS, elapsed))
+        del store
+        gc.collect()
+        elapsed, (store, journal) = timed(open_store, path)
+        journal.close()
+        assert len(store.snapshot()) == RECORDS
+        print('restore {} records from the snapshot {:6.2f} s'.format(RECORDS, elapsed))
+
+
+if __name__ == '__main__':
+    main()
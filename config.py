@@ -23,11 +23,76 @@ class Config:
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=60)
     JWT_BLACKLIST_ENABLED = True
     JWT_BLACKLIST_TOKEN_CHECKS = ['access', 'refresh']
+
+    #: Per-worker cache of revoked tokens. Tokens revoked by another
+    #: worker are rejected after at most REVOCATION_REFRESH_INTERVAL seconds
+    REVOCATION_CACHE = True
+    REVOCATION_REFRESH_INTERVAL = float(os.environ.get('REVOCATION_REFRESH_INTERVAL', 2))
+    REVOCATION_BLOOM_CAPACITY = 100000
+    REVOCATION_BLOOM_ERROR_RATE = 0.001
+    REVOCATION_LRU_SIZE = 10000
+
+    #: Password hashing. Raising the cost re-hashes each user's
+    #: password at their next login. Hashes run on a pool of
+    #: PASSWORD_HASH_WORKERS processes (one per CPU by default, 0 to
+    #: hash inline) with at most PASSWORD_HASH_QUEUE waiting or running
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:150000')
+    PASSWORD_SALT_LENGTH = 8
+    PASSWORD_HASH_WORKERS = (int(os.environ['PASSWORD_HASH_WORKERS'])
+                             if 'PASSWORD_HASH_WORKERS' in os.environ else None)
+    PASSWORD_HASH_QUEUE = None
+    PASSWORD_HASH_TIMEOUT = 5
+
+    #: Per-worker cache of users looked up by username. Changes made
+    #: through another worker are seen after at most USER_CACHE_TTL seconds
+    USER_CACHE = True
+    USER_CACHE_SIZE = 10000
+    USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', 60))
     PROPAGATE_EXCEPTIONS = True
     
     #: Database url
     DATABASE = os.environ.get('DATABASE_URL')
 
+    #: Connection pool settings
+    DATABASE_POOL_MIN = int(os.environ.get('DATABASE_POOL_MIN', 1))
+    DATABASE_POOL_MAX = int(os.environ.get('DATABASE_POOL_MAX', 10))
+    #: Seconds to wait for a free connection
+    DATABASE_POOL_TIMEOUT = float(os.environ.get('DATABASE_POOL_TIMEOUT', 30))
+    #: Seconds after which a connection is recycled. 0 disables it
+    DATABASE_POOL_MAX_AGE = float(os.environ.get('DATABASE_POOL_MAX_AGE', 0))
+
+    #: Comma separated read replica urls. Read-only queries are
+    #: spread across them
+    DATABASE_REPLICAS = [dsn.strip() for dsn in
+                         os.environ.get('DATABASE_REPLICAS', '').split(',')
+                         if dsn.strip()]
+
+    #: Rows fetched per round trip when streaming large results
+    DATABASE_FETCH_SIZE = int(os.environ.get('DATABASE_FETCH_SIZE', 1000))
+
+    #: Default and maximum number of items per page of a collection
+    PAGE_SIZE = int(os.environ.get('PAGE_SIZE', 50))
+    MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', 500))
+
+    #: JSON encoder of API responses: auto (fastest installed), orjson, ujson or json
+    JSON_ENCODER = os.environ.get('JSON_ENCODER', 'auto')
+    #: Have the database render collections as JSON, dates formatted,
+    #: instead of building and encoding a dict per row
+    DB_RENDERING = os.environ.get('DB_RENDERING', '').lower() in ('1', 'true')
+
+    #: Response compression, see app.compression
+    COMPRESS = True
+    COMPRESS_MIMETYPES = ('application/json',)
+    #: Only listings, never responses carrying tokens, see app.compression
+    COMPRESS_ENDPOINTS = ('v2.incidents', 'v2.incidents_within', 'v2.incidents_nearby',
+                          'v2.users')
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 500))
+    COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+    COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 4))
+
+    #: Largest radius in metres accepted by location searches
+    MAX_SEARCH_RADIUS = float(os.environ.get('MAX_SEARCH_RADIUS', 50000))
+
     #: Mail server configuration values
     MAIL_SERVER=os.environ.get('MAIL_SERVER')
     MAIL_PORT=os.environ.get('MAIL_PORT')
@@ -35,6 +100,34 @@ class Config:
     MAIL_USE_TLS=os.environ.get('MAIL_USE_TLS')
     MAIL_USERNAME=os.environ.get('MAIL_USERNAME')
 
+    #: Background delivery, see app.mailer
+    MAIL_ASYNC = True
+    MAIL_QUEUE_SIZE = 1000
+    MAIL_OVERFLOW = os.environ.get('MAIL_OVERFLOW', 'drop_new')
+    MAIL_QUEUE_TIMEOUT = 1
+    MAIL_RETRIES = 3
+    MAIL_RETRY_BACKOFF = 1
+    MAIL_IDLE_TIMEOUT = 5
+    #: Send mail from `flask worker` jobs instead of the sender thread
+    MAIL_USE_JOBS = os.environ.get('MAIL_USE_JOBS', '').lower() in ('1', 'true')
+
+    #: Directory keeping the v1 store on disk, see app.api.v1.persistence.
+    #: The store is only kept in memory if unset
+    V1_STORE_PATH = os.environ.get('V1_STORE_PATH')
+    #: always, interval or never
+    V1_STORE_FSYNC = os.environ.get('V1_STORE_FSYNC', 'interval')
+    V1_STORE_FSYNC_INTERVAL = float(os.environ.get('V1_STORE_FSYNC_INTERVAL', 1))
+    #: Writes logged between snapshots
+    V1_STORE_SNAPSHOT_OPS = int(os.environ.get('V1_STORE_SNAPSHOT_OPS', 100000))
+
+    #: Job queue, see app.jobs
+    JOBS_BATCH_SIZE = 100
+    JOBS_POLL_INTERVAL = 1
+    JOBS_MAX_ATTEMPTS = 5
+    JOBS_RETRY_BACKOFF = 10
+    #: Seconds a claimed job is left to its worker before it is run again
+    JOBS_LEASE = 300
+
 class TestConfig(Config):
     '''
     configuration values for testing
@@ -44,4 +137,9 @@ class TestConfig(Config):
     DEBUG = True
     PROPAGATE_EXCEPTIONS = True
     DATABASE = os.environ.get('TEST_DB_URL')
+    #: Hash inline and cheaply so the suite stays fast
+    PASSWORD_HASH_WORKERS = 0
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'
+    #: Keep the v1 store in memory
+    V1_STORE_PATH = None
 
@@ -6,6 +6,7 @@
 
 """
 
+import threading
 import unittest
 from app.api.v1.models import Record
 
@@ -79,5 +80,30 @@ class RecordModel(unittest.TestCase):
         self.assertEqual(self.r1.status, "Under Investigation")
         self.assertEqual(self.r1.user, None)
 
+    def test_ids_unique_across_threads(self):
+        ids = []
+        def create():
+            for _ in range(500):
+                r = Record(**self.data)
+                Record.put(r)
+                ids.append(r.data_id)
+        threads = [threading.Thread(target=create) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(ids)), 4000)
+        self.assertEqual(len(Record.all()), 4000)
+
+    def test_snapshot_follows_writes(self):
+        Record.put(self.r1)
+        first = Record.all()
+        # Reads without a write in between share the serialized items
+        self.assertIs(Record.all()[0], first[0])
+        Record.put(self.r2)
+        self.assertEqual(len(Record.all()), 2)
+        Record.delete(self.r1.data_id)
+        self.assertEqual([r['id'] for r in Record.all()], [self.r2.data_id])
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -0,0 +1,96 @@
+"""
+    app.tests.v1.persistence
+    ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Tests for the durable mode of the v1 store
+
+"""
+import os
+import pytest
+from app.api.v1.models import Record, Store
+from app.api.v1.persistence import Journal, init_app
+from app import create_app
+from config import TestConfig
+
+data = {'location': '-1, 36', 'comment': 'Judges soliciting for bribes'}
+
+
+def reopen(path, **kwargs):
+    store = Store()
+    journal = Journal(str(path), **kwargs)
+    journal.open(store)
+    return store, journal
+
+
+def test_log_replayed(tmp_path):
+    store, journal = reopen(tmp_path, fsync='always')
+    records = [Record(**data) for _ in range(3)]
+    for record in records:
+        store.put(record.data_id, record)
+    records[0].add_field('uri', 'http://localhost/api/v1/red-flags/1')
+    store.put(records[0].data_id, records[0])
+    store.delete(records[1].data_id)
+    journal.close()
+
+    store, journal = reopen(tmp_path)
+    assert list(store.snapshot()) == [records[0].serialize, records[2].serialize]
+    #: Ids keep counting from the last one given out
+    assert store.next_id() > records[2].data_id
+    journal.close()
+
+def test_snapshot(tmp_path):
+    store, journal = reopen(tmp_path, fsync='never', snapshot_ops=0)
+    for _ in range(5):
+        record = Record(**data)
+        store.put(record.data_id, record)
+    journal.compact()
+    store.clear()
+    record = Record(**data)
+    store.put(record.data_id, record)
+    journal.close()
+    #: The snapshot replaced the log written before it
+    names = sorted(os.listdir(str(tmp_path)))
+    assert len([name for name in names if name.startswith('snapshot-')]) == 1
+    assert len([name for name in names if name.startswith('log-')]) == 1
+
+    store, journal = reopen(tmp_path)
+    assert [item['id'] for item in store.snapshot()] == [record.data_id]
+    journal.close()
+
+def test_torn_write_ignored(tmp_path):
+    store, journal = reopen(tmp_path, fsync='never')
+    record = Record(**data)
+    store.put(record.data_id, record)
+    journal.log.write(b'{"seq": 2, "op": "pu')
+    journal.close()
+
+    store, journal = reopen(tmp_path)
+    assert [item['id'] for item in store.snapshot()] == [record.data_id]
+    journal.close()
+
+def test_one_process_per_directory(tmp_path):
+    store, journal = reopen(tmp_path)
+    with pytest.raises(RuntimeError):
+        reopen(tmp_path)
+    journal.close()
+    with pytest.raises(ValueError):
+        Journal(str(tmp_path), fsync='sometimes')
+
+def test_app_store(tmp_path):
+    class DurableConfig(TestConfig):
+        V1_STORE_PATH = str(tmp_path)
+    journal = None
+    try:
+        app = create_app(DurableConfig)
+        journal = Record._store.journal
+        assert journal is not None and journal.path == str(tmp_path)
+        client = app.test_client()
+        resp = client.post('/api/v1/red-flags', data=data)
+        assert resp.status_code == 201
+        #: Another app of the same process shares the store
+        init_app(app)
+        assert Record._store.journal is journal
+    finally:
+        if journal is not None:
+            journal.close()
+        Record.clear_all()
@@ -6,10 +6,12 @@
 """
 
 from app.models import Record, User, Blacklist
-from datetime import datetime
+from datetime import datetime, timedelta
 import pytest
 import json
+from flask_jwt_extended import decode_token
 from app.helpers import make_token_header
+from app.utils import token_expiry
 
 
 def test_register(client):
@@ -136,3 +138,53 @@ def test_logout_validate_input(client, auth):
     resp = auth.logout(refresh_token, refresh=True)
     assert resp.status_code == 401
     assert b"Token has been revoked" in resp.data
+
+def test_revocation_cache(app, client, auth):
+    from app.revocation import get_revocation_cache
+    cache = get_revocation_cache()
+
+    resp = auth.login()
+    access_token = json.loads(resp.data.decode('utf-8'))['data'][0]['access_token']
+    resp = client.get('/api/v2/user', headers=make_token_header(access_token))
+    assert resp.status_code == 200
+    #: Unrevoked tokens are answered by the filter alone
+    assert cache.queries == 0
+
+    #: A token revoked through another worker is picked up on refresh
+    token = decode_token(access_token)
+    Blacklist().add(jti=token['jti'], expires=token_expiry(token))
+    cache.refresh(force=True)
+    resp = client.get('/api/v2/user', headers=make_token_header(access_token))
+    assert resp.status_code == 401
+    assert b"Token has been revoked" in resp.data
+
+def test_revocation_filter_grows(app):
+    from app.revocation import RevocationCache
+    expires = datetime.utcnow() + timedelta(hours=1)
+    for n in range(6):
+        Blacklist().add(jti='grows-{}'.format(n), expires=expires)
+    with app.app_context():
+        cache = RevocationCache(capacity=2)
+        cache.refresh(force=True)
+        assert cache.bloom.count == 6
+        #: Over capacity: rebuilt with room to grow, not at the old size
+        cache.refresh(force=True)
+        assert cache.bloom.capacity >= 12
+        assert cache.bloom.count == 6
+        assert cache.is_revoked('grows-5')
+        capacity = cache.bloom.capacity
+        cache.refresh(force=True)
+        assert cache.bloom.capacity == capacity
+
+def test_rehash_on_login(app, auth):
+    """
+    Passwords are re-hashed at login after the hash cost is raised
+    """
+    app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:2000'
+    resp = auth.login()
+    assert resp.status_code == 200
+    password_hash = User().by_username('test', cached=False)['password_hash']
+    assert password_hash.startswith('pbkdf2:sha256:2000$')
+    #: Still valid
+    assert auth.login().status_code == 200
+    assert auth.login(password='wrong').status_code == 401
@@ -0,0 +1,37 @@
+'''
+	tests.v2.test_cache
+	----------------------
+
+	Tests for in-process caches
+'''
+import time
+from app.cache import BloomFilter, LRUCache
+
+
+def test_bloom_filter():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    for i in range(1000):
+        bloom.add('jti-{}'.format(i))
+    #: No false negatives
+    assert all('jti-{}'.format(i) in bloom for i in range(1000))
+    false_positives = sum('other-{}'.format(i) in bloom for i in range(1000))
+    assert false_positives < 50
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is LRUCache.MISSING
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.stats()['hits'] == 3
+    assert cache.stats()['misses'] == 1
+
+def test_lru_cache_ttl():
+    cache = LRUCache(maxsize=2, ttl=0.01)
+    cache.set('a', 1)
+    time.sleep(0.02)
+    assert cache.get('a', None) is None
+    assert len(cache) == 0
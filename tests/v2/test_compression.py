@@ -0,0 +1,79 @@
+'''
+	tests.v2.test_compression
+	----------------------------
+
+	Tests for response compression
+'''
+import gzip
+import json
+from werkzeug.http import parse_accept_header
+from app.compression import choose_encoding
+from app.helpers import make_token_header
+
+DATA = {'location': '-1.23, 36.5', 'comment': 'crooked tendering processes'}
+
+
+def test_choose_encoding():
+    assert choose_encoding(parse_accept_header('gzip, deflate')) == 'gzip'
+    assert choose_encoding(parse_accept_header('*')) in ('gzip', 'br')
+    assert choose_encoding(parse_accept_header('gzip;q=0, identity')) is None
+    assert choose_encoding(parse_accept_header('')) is None
+
+def test_compressed_listing(client, auth):
+    resp = auth.login()
+    access_token = json.loads(resp.data.decode('utf-8'))['data'][0]['access_token']
+    headers = make_token_header(access_token)
+    for _ in range(20):
+        client.post('/api/v2/red-flags', data=DATA, headers=headers)
+
+    plain = client.get('/api/v2/red-flags', headers=headers)
+    assert 'Content-Encoding' not in plain.headers
+    assert 'Accept-Encoding' in plain.headers['Vary']
+
+    gzip_headers = dict(headers, **{'Accept-Encoding': 'gzip'})
+    resp = client.get('/api/v2/red-flags', headers=gzip_headers)
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert int(resp.headers['Content-Length']) == len(resp.data) < len(plain.data)
+    assert gzip.decompress(resp.data) == plain.data
+
+    #: Streamed responses are compressed as they are sent
+    plain = client.get('/api/v2/red-flags?stream=true', headers=headers)
+    resp = client.get('/api/v2/red-flags?stream=true', headers=gzip_headers)
+    assert resp.is_streamed
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(resp.data) == plain.data
+
+def test_small_responses_are_not_compressed(client, auth):
+    resp = auth.login()
+    access_token = json.loads(resp.data.decode('utf-8'))['data'][0]['access_token']
+    resp = client.get('/api/v2/user', headers=dict(make_token_header(access_token),
+                                                    **{'Accept-Encoding': 'gzip'}))
+    assert resp.status_code == 200
+    assert 'Content-Encoding' not in resp.headers
+
+def test_compression_settings(app, client, auth):
+    app.config['COMPRESS_MIN_SIZE'] = 0
+    resp = auth.login()
+    access_token = json.loads(resp.data.decode('utf-8'))['data'][0]['access_token']
+    headers = dict(make_token_header(access_token), **{'Accept-Encoding': 'gzip'})
+    resp = client.get('/api/v2/red-flags', headers=headers)
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    app.config['COMPRESS'] = False
+    resp = client.get('/api/v2/red-flags', headers=headers)
+    assert 'Content-Encoding' not in resp.headers
+
+def test_only_collections_are_compressed(app, client, auth):
+    app.config['COMPRESS_MIN_SIZE'] = 0
+    resp = client.post('/api/v2/auth/login', data={'username': 'test', 'password': 'test-password'},
+                       headers={'Accept-Encoding': 'gzip'})
+    assert resp.status_code == 200
+    #: Responses carrying tokens never are
+    assert 'Content-Encoding' not in resp.headers
+    refresh_token = json.loads(resp.data.decode('utf-8'))['data'][0]['refresh_token']
+    resp = client.post('/api/v2/auth/refresh', headers=dict(make_token_header(refresh_token),
+                                                            **{'Accept-Encoding': 'gzip'}))
+    assert resp.status_code == 200
+    assert 'Content-Encoding' not in resp.headers
+    access_token = json.loads(auth.login().data.decode('utf-8'))['data'][0]['access_token']
+    headers = dict(make_token_header(access_token), **{'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in client.get('/api/v2/user', headers=headers).headers
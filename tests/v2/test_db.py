@@ -5,20 +5,105 @@
     Tests for database initialization functions
 '''
 
+import threading
+import time
 import pytest
 import psycopg2
-from app.db.db import get_db
+from app.db.db import get_db, get_pool, init_db
+from app.db import migrations
+from app.db.pool import ConnectionPool, PoolTimeout
+from app.models import Record, User
 
 
 def test_get_close_db(app):
+    in_use = get_pool().stats()['in_use']
     with app.app_context():
         db = get_db()
         assert db is get_db()
+        assert get_pool().stats()['in_use'] == in_use + 1
 
-    with pytest.raises(psycopg2.InterfaceError) as e:
-        db.cursor().execute('SELECT 1')
+    #: The connection is returned to the pool, not closed
+    assert get_pool().stats()['in_use'] == in_use
+    assert not db.closed
+    with app.app_context():
+        assert get_db() is db
+
+def test_pool_rolls_back_returned_connections(app):
+    pool = ConnectionPool(app.config['DATABASE'], minconn=0, maxconn=1)
+    conn = pool.getconn()
+    conn.cursor().execute('SELECT 1')
+    pool.putconn(conn)
+    assert conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    pool.closeall()
+
+def test_pool_timeout(app):
+    pool = ConnectionPool(app.config['DATABASE'], minconn=0, maxconn=1, timeout=0.1)
+    conn = pool.getconn()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    assert pool.stats()['timeouts'] == 1
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+    pool.closeall()
+
+def test_pool_max_age(app):
+    pool = ConnectionPool(app.config['DATABASE'], minconn=1, maxconn=1, max_age=0.01)
+    conn = pool.getconn()
+    time.sleep(0.02)
+    pool.putconn(conn)
+    assert conn.closed
+    assert pool.getconn() is not conn
+    pool.closeall()
+
+def test_pool_resets_after_fork(app, monkeypatch):
+    pool = ConnectionPool(app.config['DATABASE'], minconn=1, maxconn=1)
+    conn = pool.getconn()
+    monkeypatch.setattr('os.getpid', lambda: -1)
+    #: The child gets a fresh connection even though the pool was full
+    assert pool.getconn() is not conn
+    assert not conn.closed
+    monkeypatch.undo()
+    conn.close()
+
+def test_pool_connects_outside_lock(app, monkeypatch):
+    pool = ConnectionPool(app.config['DATABASE'], minconn=1, maxconn=2)
+    other = pool.getconn()
+    connect, release = pool._connect, threading.Event()
 
-    assert 'closed' in str(e)
+    def slow_connect():
+        release.wait(5)
+        return connect()
+
+    monkeypatch.setattr(pool, '_connect', slow_connect)
+    opened = []
+    thread = threading.Thread(target=lambda: opened.append(pool.getconn()))
+    thread.start()
+    time.sleep(0.05)
+    assert pool.stats()['connecting'] == 1
+    #: Connections are still returned and checked out meanwhile
+    pool.putconn(other)
+    assert pool.getconn() is other
+    release.set()
+    thread.join()
+    assert pool.stats()['in_use'] == 2
+    assert pool.stats()['connecting'] == 0
+    pool.closeall()
+
+def test_pool_connect_failure_frees_slot(app, monkeypatch):
+    pool = ConnectionPool(app.config['DATABASE'], minconn=0, maxconn=1, timeout=0.1)
+
+    def failing_connect():
+        raise psycopg2.OperationalError('could not connect')
+
+    monkeypatch.setattr(pool, '_connect', failing_connect)
+    with pytest.raises(psycopg2.OperationalError):
+        pool.getconn()
+    monkeypatch.undo()
+    #: The failed attempt doesn't count against maxconn
+    conn = pool.getconn()
+    assert pool.stats()['connecting'] == 0
+    pool.putconn(conn)
+    pool.closeall()
 
 def test_init_db_command(runner, monkeypatch):
     class Recorder(object):
@@ -54,4 +139,80 @@ def test_rollback_db_command(runner, monkeypatch):
     monkeypatch.setattr('app.db.rollback', fake_rollback)
     result = runner.invoke(args=['rollback-db'])
     assert 'rolled back' in result.output
-    assert Recorder.called
\ No newline at end of file
+    assert Recorder.called
+
+def test_reads_routed_to_replica(app):
+    app.config['DATABASE_REPLICAS'] = [app.config['DATABASE'] + ' application_name=replica']
+    with app.app_context():
+        replica = get_db(readonly=True)
+        assert replica is get_db(readonly=True)
+        assert replica.readonly
+
+        #: Once the primary is in use reads follow it
+        primary = get_db()
+        assert primary is not replica
+        assert get_db(readonly=True) is primary
+    app.config['DATABASE_REPLICAS'] = []
+
+def test_init_db_is_noop_when_current(app):
+    #: The fixture has already brought the schema up to date
+    assert migrations.current_version(get_db()) == migrations.latest_version()
+    assert not migrations.pending(get_db())
+    assert init_db() == []
+
+def test_db_status_command(runner):
+    result = runner.invoke(args=['db-status'])
+    assert 'version {}'.format(migrations.latest_version()) in result.output
+    assert 'Pending' not in result.output
+
+def test_db_upgrade_command(runner):
+    result = runner.invoke(args=['db-upgrade'])
+    assert 'version {}'.format(migrations.latest_version()) in result.output
+
+def test_prune_blacklist_command(runner):
+    result = runner.invoke(args=['prune-blacklist'])
+    assert 'Pruned 0 expired tokens' in result.output
+
+def test_add_coordinates_outside_transaction(app):
+    user_id = User().by_username('test')['id']
+    for index in range(3):
+        Record().add('-1.28, 36.82', 'comment {}'.format(index), 'red-flag', user_id=user_id)
+    conn = get_db()
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute("update records set latitude = null, longitude = null, geohash = null;")
+            cursor.execute("drop index records_type_geohash_idx;")
+
+    assert not getattr(migrations.add_coordinates, 'transaction', True)
+    migrations.add_coordinates(conn)
+    assert conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    assert not conn.autocommit
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute("select count(*) from records where geohash is null;")
+            assert cursor.fetchone()[0] == 0
+            cursor.execute("""select indisvalid from pg_index
+                              where indexrelid = 'records_type_geohash_idx'::regclass;""")
+            assert cursor.fetchone()[0]
+
+def test_add_search_outside_transaction(app):
+    user_id = User().by_username('test')['id']
+    for index in range(3):
+        Record().add('-1.28, 36.82', 'bribes at office {}'.format(index), 'red-flag',
+                     user_id=user_id)
+    conn = get_db()
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute("update records set search = null;")
+            cursor.execute("drop index records_search_idx;")
+
+    assert not getattr(migrations.add_search, 'transaction', True)
+    migrations.add_search(conn, batch_size=2)
+    assert conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute("select count(*) from records where search @@ to_tsquery('bribe');")
+            assert cursor.fetchone()[0] == 3
+            cursor.execute("""select indisvalid from pg_index
+                              where indexrelid = 'records_search_idx'::regclass;""")
+            assert cursor.fetchone()[0]
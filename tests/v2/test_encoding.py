@@ -0,0 +1,86 @@
+'''
+	tests.v2.test_encoding
+	-------------------------
+
+	Tests for JSON encoding of responses
+'''
+import json
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+import pytest
+from app.encoding import ENCODERS, format_datetime, get_encoder, output_json
+from app.helpers import make_token_header
+from app.models import Record, User
+from app.utils import update_createdon
+
+ROW = {'id': 1, 'comment': 'crooked tendering', 'images': ['a.png'], 'rank': Decimal('0.5'),
+       'createdon': datetime(2018, 12, 3, 14, 5, 30, tzinfo=timezone.utc), 'uri': None}
+
+
+@pytest.mark.parametrize('name', sorted(ENCODERS))
+def test_encoders(name):
+    data = json.loads(get_encoder(name)({'status': 200, 'data': [ROW]}).decode('utf-8'))
+    #: Dates look the same as when formatted by update_createdon
+    expected = update_createdon(dict(ROW, rank=0.5))
+    assert data == {'status': 200, 'data': [expected]}
+
+def test_format_datetime():
+    value = datetime(2018, 1, 1)
+    for _ in range(400):
+        assert format_datetime(value) == value.strftime('%a, %d %b %Y %H:%M %p')
+        value += timedelta(days=1, hours=5, minutes=7)
+
+def test_unknown_encoder():
+    with pytest.raises(ValueError):
+        get_encoder('simplejson-9000')
+
+def test_output_json(app):
+    response = output_json({'status': 201, 'data': []}, 201, {'X-Test': 'yes'})
+    assert response.status_code == 201
+    assert response.mimetype == 'application/json'
+    assert response.headers['X-Test'] == 'yes'
+    assert json.loads(response.get_data(as_text=True)) == {'status': 201, 'data': []}
+
+@pytest.mark.parametrize('name', sorted(ENCODERS))
+def test_responses_use_encoder(app, client, auth, name):
+    app.config['JSON_ENCODER'] = name
+    resp = auth.login()
+    assert resp.mimetype == 'application/json'
+    access_token = json.loads(resp.data.decode('utf-8'))['data'][0]['access_token']
+    resp = client.get('/api/v2/user', headers=make_token_header(access_token))
+    assert json.loads(resp.data.decode('utf-8'))['data'][0]['username'] == 'test'
+    resp = client.get('/api/v2/red-flags/abc', headers=make_token_header(access_token))
+    assert resp.status_code == 400
+    assert json.loads(resp.data.decode('utf-8')) == {'status': 400,
+                                                     'error': 'Invalid ID. Should be an Integer'}
+
+def test_db_rendering(app, client, auth):
+    """
+    Collections rendered by the database match those built in Python
+    """
+    RECORD = Record()
+    user_id = User().by_username('test')['id']
+    for index in range(30):
+        RECORD.add('-1.28, 36.82', 'comment {}'.format(index), 'red-flag',
+                   user_id=user_id, images=['a.png'])
+    #: Dates across every hour and day of the week
+    RECORD.query("""update records set createdon = timestamptz '2018-12-03 00:00+00'
+                    + id * interval '29 hours 7 minutes';""")
+    RECORD.commit()
+    resp = auth.signup(username='mahatma', password='gandhi', admin=True)
+    headers = make_token_header(json.loads(resp.data.decode('utf-8'))['data'][0]['access_token'])
+
+    urls = ['/api/v2/red-flags?limit=7', '/api/v2/red-flags?fields=id,createdon&limit=30',
+            '/api/v2/red-flags?limit=100', '/api/v2/red-flags?stream=true',
+            '/api/v2/users', '/api/v2/users?stream=true&fields=id,username,createdon']
+    for base in urls:
+        url = base
+        while url:
+            app.config['DB_RENDERING'] = False
+            expected = json.loads(client.get(url, headers=headers).data.decode('utf-8'))
+            app.config['DB_RENDERING'] = True
+            resp = client.get(url, headers=headers)
+            assert resp.status_code == 200
+            assert resp.mimetype == 'application/json'
+            assert json.loads(resp.data.decode('utf-8')) == expected
+            url = expected.get('next') and base + '&cursor=' + expected['next']
@@ -0,0 +1,34 @@
+'''
+	tests.v2.test_geo
+	--------------------
+
+	Tests for geohash helpers
+'''
+from app import geo
+
+
+def test_encode():
+    assert geo.encode(57.64911, 10.40744, 11) == 'u4pruydqqvj'
+    assert geo.encode(-1.23, 36.5).startswith(geo.encode(-1.23, 36.5, 5))
+
+def test_parse_location():
+    assert geo.parse_location('-1.23, 36.5') == (-1.23, 36.5)
+    assert geo.parse_location('91,0') is None
+    assert geo.parse_location('nowhere') is None
+    assert geo.parse_location(None) is None
+
+def test_cover():
+    box = (-1.3, 36.4, -1.2, 36.6)
+    cells = geo.cover(*box)
+    assert 0 < len(cells) <= 16
+    #: Points inside the box fall in one of the cells
+    for lat, lng in ((-1.3, 36.4), (-1.25, 36.5), (-1.2, 36.6)):
+        assert any(geo.encode(lat, lng).startswith(cell) for cell in cells)
+    #: Too large for the index
+    assert geo.cover(-90, -180, 90, 180) == []
+
+def test_radius_bbox():
+    min_lat, min_lng, max_lat, max_lng = geo.radius_bbox(0, 0, 111195)
+    assert round(max_lat, 3) == 1.0 and round(min_lat, 3) == -1.0
+    assert round(max_lng, 3) == 1.0 and round(min_lng, 3) == -1.0
+    assert geo.radius_bbox(89.9, 10, 50000)[1::2] == (-180.0, 180.0)
@@ -447,3 +447,327 @@ def test_patch_status(client, auth):
     resp = client.patch(update_uri, data={'status': 'resolved'}, 
             headers=make_token_header(access_token))
     assert resp.status_code == 403
+
+def test_paginate_incidents(client, auth):
+    """
+    Tests keyset pagination of incident collections
+    """
+    resp = auth.login()
+    access_token = json.loads(resp.data.decode('utf-8'))['data'][0]['access_token']
+    headers = make_token_header(access_token)
+
+    for _ in range(5):
+        resp = client.post('/api/v2/red-flags', data=DATA, headers=headers)
+        assert resp.status_code == 201
+
+    ids = []
+    url = '/api/v2/red-flags?limit=2'
+    while url:
+        resp = client.get(url, headers=headers)
+        assert resp.status_code == 200
+        data = json.loads(resp.data.decode('utf-8'))
+        assert len(data['data']) <= 2
+        ids.extend(item['id'] for item in data['data'])
+        url = data['next'] and '/api/v2/red-flags?limit=2&cursor=' + data['next']
+    #: Every record exactly once, newest first
+    assert len(ids) == 5
+    assert ids == sorted(ids, reverse=True)
+
+    resp = client.get('/api/v2/red-flags?limit=0', headers=headers)
+    assert resp.status_code == 400
+    resp = client.get('/api/v2/red-flags?cursor=garbage', headers=headers)
+    assert resp.status_code == 400
+
+def test_stream_incidents(client, auth):
+    """
+    Tests streaming a whole collection
+    """
+    resp = auth.login()
+    access_token = json.loads(resp.data.decode('utf-8'))['data'][0]['access_token']
+    headers = make_token_header(access_token)
+
+    for _ in range(3):
+        client.post('/api/v2/red-flags', data=DATA, headers=headers)
+
+    resp = client.get('/api/v2/red-flags?stream=true', headers=headers)
+    assert resp.status_code == 200
+    assert resp.is_streamed
+    assert resp.mimetype == 'application/json'
+    streamed = json.loads(resp.data.decode('utf-8'))
+
+    resp = client.get('/api/v2/red-flags', headers=headers)
+    paged = json.loads(resp.data.decode('utf-8'))
+    assert streamed['status'] == 200
+    assert streamed['data'] == paged['data']
+
+def test_incident_fields(client, auth):
+    """
+    Tests sparse fieldsets on incident resources
+    """
+    resp = auth.login()
+    access_token = json.loads(resp.data.decode('utf-8'))['data'][0]['access_token']
+    headers = make_token_header(access_token)
+    resp = client.post('/api/v2/red-flags', data=DATA, headers=headers)
+    uri = json.loads(resp.data.decode('utf-8'))['uri']
+
+    resp = client.get('/api/v2/red-flags?fields=id,location,status', headers=headers)
+    assert resp.status_code == 200
+    data = json.loads(resp.data.decode('utf-8'))
+    assert set(data['data'][0]) == {'id', 'location', 'status'}
+
+    resp = client.get(uri + '?fields=comment', headers=headers)
+    assert resp.status_code == 200
+    data = json.loads(resp.data.decode('utf-8'))
+    assert data['data'] == {'comment': DATA['comment']}
+
+    resp = client.get('/api/v2/red-flags?fields=id,password_hash', headers=headers)
+    assert resp.status_code == 400
+
+def test_filter_incidents(client, auth):
+    """
+    Tests filtering incident collections
+    """
+    resp = auth.signup(username='patrice', password='lumumba', admin=True)
+    data = json.loads(resp.data.decode('utf-8'))['data'][0]
+    admin_headers = make_token_header(data['access_token'])
+    resp = auth.login()
+    access_token = json.loads(resp.data.decode('utf-8'))['data'][0]['access_token']
+    headers = make_token_header(access_token)
+
+    resp = client.post('/api/v2/red-flags', data=DATA, headers=headers)
+    uri = json.loads(resp.data.decode('utf-8'))['uri']
+    client.post('/api/v2/red-flags', data=DATA, headers=admin_headers)
+    client.patch(uri + '/status', data={'status': 'resolved'}, headers=admin_headers)
+
+    def ids(query):
+        resp = client.get('/api/v2/red-flags' + query, headers=headers)
+        assert resp.status_code == 200
+        return [item['id'] for item in json.loads(resp.data.decode('utf-8'))['data']]
+
+    assert len(ids('')) == 2
+    resolved = ids('?status=Resolved')
+    assert len(resolved) == 1
+    assert ids('?createdby={}'.format(User().by_username('test')['id'])) == resolved
+    assert len(ids('?status=draft')) == 1
+    assert len(ids('?from=2000-01-01&to=2999-01-01T00:00:00')) == 2
+    assert ids('?to=2000-01-01') == []
+
+    for query in ('?status=lost', '?from=yesterday', '?createdby=me'):
+        resp = client.get('/api/v2/red-flags' + query, headers=headers)
+        assert resp.status_code == 400
+
+def test_incidents_within(client, auth):
+    """
+    Tests bounding box searches
+    """
+    resp = auth.login()
+    access_token = json.loads(resp.data.decode('utf-8'))['data'][0]['access_token']
+    headers = make_token_header(access_token)
+    for location in ('-1.23, 36.5', '-1.25, 36.52', '-1.24, 36.51', '0.31, 32.58'):
+        client.post('/api/v2/red-flags', data={'location': location, 'comment': 'here'},
+                    headers=headers)
+
+    ids, url = [], '/api/v2/red-flags/within?bbox=-1.3,36.4,-1.2,36.6&limit=2'
+    while url:
+        resp = client.get(url, headers=headers)
+        assert resp.status_code == 200
+        data = json.loads(resp.data.decode('utf-8'))
+        ids.extend(item['id'] for item in data['data'])
+        url = data['next'] and ('/api/v2/red-flags/within?bbox=-1.3,36.4,-1.2,36.6'
+                                '&limit=2&cursor=' + data['next'])
+    assert len(ids) == 3
+    assert ids == sorted(ids, reverse=True)
+
+    resp = client.get('/api/v2/interventions/within?bbox=-1.3,36.4,-1.2,36.6', headers=headers)
+    assert json.loads(resp.data.decode('utf-8'))['data'] == []
+    #: Too large for the index is still correct
+    resp = client.get('/api/v2/red-flags/within?bbox=-90,-180,90,180&fields=location',
+                      headers=headers)
+    assert len(json.loads(resp.data.decode('utf-8'))['data']) == 4
+
+    for bbox in ('', '1,2,3', '-1.2,36.4,-1.3,36.6', '-1,36,1,181', 'a,b,c,d'):
+        resp = client.get('/api/v2/red-flags/within?bbox=' + bbox, headers=headers)
+        assert resp.status_code == 400
+
+def test_incidents_nearby(client, auth):
+    """
+    Tests radius searches
+    """
+    resp = auth.login()
+    access_token = json.loads(resp.data.decode('utf-8'))['data'][0]['access_token']
+    headers = make_token_header(access_token)
+    for location in ('-1.25, 36.5', '-1.23, 36.5', '0.31, 32.58'):
+        client.post('/api/v2/red-flags', data={'location': location, 'comment': 'here'},
+                    headers=headers)
+
+    resp = client.get('/api/v2/red-flags/nearby?lat=-1.22&long=36.5&radius=5000',
+                      headers=headers)
+    assert resp.status_code == 200
+    data = json.loads(resp.data.decode('utf-8'))['data']
+    assert [item['location'] for item in data] == ['-1.23, 36.5', '-1.25, 36.5']
+    assert 1100 < data[0]['distance'] < 1125
+
+    resp = client.get('/api/v2/red-flags/nearby?lat=-1.22&long=36.5&radius=5000&fields=comment',
+                      headers=headers)
+    data = json.loads(resp.data.decode('utf-8'))['data']
+    assert set(data[0]) == {'comment', 'distance'}
+
+    for query in ('lat=-1.22&long=36.5', 'lat=-1.22&radius=10', 'lat=95&long=36.5&radius=10',
+                  'lat=-1.22&long=36.5&radius=0', 'lat=-1.22&long=36.5&radius=1e9'):
+        resp = client.get('/api/v2/red-flags/nearby?' + query, headers=headers)
+        assert resp.status_code == 400
+
+def test_patch_location_moves_coordinates(client, auth):
+    """
+    Tests that coordinates follow location updates
+    """
+    resp = auth.login()
+    access_token = json.loads(resp.data.decode('utf-8'))['data'][0]['access_token']
+    headers = make_token_header(access_token)
+    resp = client.post('/api/v2/red-flags', data=DATA, headers=headers)
+    uri = json.loads(resp.data.decode('utf-8'))['uri']
+    client.patch(uri + '/location', data={'location': '0.31, 32.58'}, headers=headers)
+
+    resp = client.get('/api/v2/red-flags/within?bbox=0,32,1,33', headers=headers)
+    assert len(json.loads(resp.data.decode('utf-8'))['data']) == 1
+    resp = client.get('/api/v2/red-flags/within?bbox=-1.3,36.4,-1.2,36.6', headers=headers)
+    assert json.loads(resp.data.decode('utf-8'))['data'] == []
+
+def test_search_incidents(client, auth):
+    """
+    Tests full text search of incident comments
+    """
+    resp = auth.login()
+    access_token = json.loads(resp.data.decode('utf-8'))['data'][0]['access_token']
+    headers = make_token_header(access_token)
+    comments = ['bribes demanded at the county office',
+                'officer demanded bribes, then more bribes',
+                'potholes on the highway',
+                'bribe asked for a permit']
+    for comment in comments:
+        client.post('/api/v2/red-flags', data={'location': '-1.23, 36.5', 'comment': comment},
+                    headers=headers)
+
+    def search(query):
+        resp = client.get('/api/v2/red-flags?q=' + query, headers=headers)
+        assert resp.status_code == 200
+        return json.loads(resp.data.decode('utf-8'))
+
+    data = search('bribes')
+    #: Stemmed matches, best first
+    assert [item['comment'] for item in data['data']][0] == comments[1]
+    assert len(data['data']) == 3
+    assert all('rank' in item for item in data['data'])
+    assert search('demanded bribes&status=draft&fields=comment')['data'][0] == {
+        'comment': comments[1], 'rank': search('demanded bribes')['data'][0]['rank']}
+    assert search('flooding')['data'] == []
+
+    #: Ranked pages cover every match exactly once
+    ids, url = [], '/api/v2/red-flags?q=bribe&limit=1'
+    while url:
+        resp = client.get(url, headers=headers)
+        assert resp.status_code == 200
+        data = json.loads(resp.data.decode('utf-8'))
+        ids.extend(item['id'] for item in data['data'])
+        url = data['next'] and '/api/v2/red-flags?q=bribe&limit=1&cursor=' + data['next']
+    assert sorted(ids) == sorted(item['id'] for item in search('bribe')['data'])
+    assert len(ids) == 3
+
+    #: Cursors do not mix between searches and plain listings
+    resp = client.get('/api/v2/red-flags?limit=1', headers=headers)
+    cursor = json.loads(resp.data.decode('utf-8'))['next']
+    resp = client.get('/api/v2/red-flags?q=bribe&cursor=' + cursor, headers=headers)
+    assert resp.status_code == 400
+    resp = client.get('/api/v2/red-flags?q=bribe&stream=true', headers=headers)
+    assert resp.status_code == 400
+
+    #: The search vector follows comment updates
+    uri = '/api/v2/red-flags/{}/comment'.format(search('potholes')['data'][0]['id'])
+    client.patch(uri, data={'comment': 'flooding on the highway'}, headers=headers)
+    assert len(search('flooding')['data']) == 1
+    assert search('potholes')['data'] == []
+
+def test_conditional_get(client, auth):
+    """
+    Tests ETag and Last-Modified validation of incident resources
+    """
+    resp = auth.login()
+    access_token = json.loads(resp.data.decode('utf-8'))['data'][0]['access_token']
+    headers = make_token_header(access_token)
+    resp = client.post('/api/v2/red-flags', data=DATA, headers=headers)
+    uri = json.loads(resp.data.decode('utf-8'))['uri']
+
+    for url in (uri, '/api/v2/red-flags', '/api/v2/red-flags?stream=true'):
+        resp = client.get(url, headers=headers)
+        assert resp.status_code == 200
+        etag, last_modified = resp.headers['ETag'], resp.headers['Last-Modified']
+        resp = client.get(url, headers=dict(headers, **{'If-None-Match': etag}))
+        assert resp.status_code == 304
+        assert resp.data == b''
+        assert resp.headers['ETag'] == etag
+        resp = client.get(url, headers=dict(headers, **{'If-Modified-Since': last_modified}))
+        assert resp.status_code == 304
+        #: Other representations have other tags
+        resp = client.get(url + ('&' if '?' in url else '?') + 'fields=id',
+                          headers=dict(headers, **{'If-None-Match': etag}))
+        assert resp.status_code == 200
+
+    resp = client.get('/api/v2/red-flags', headers=headers)
+    collection_etag = resp.headers['ETag']
+    resp = client.get(uri, headers=headers)
+    assert 'updatedon' in json.loads(resp.data.decode('utf-8'))['data']
+    etag = resp.headers['ETag']
+
+    #: Updates change both tags
+    client.patch(uri + '/comment', data={'comment': 'new comment'}, headers=headers)
+    resp = client.get(uri, headers=dict(headers, **{'If-None-Match': etag}))
+    assert resp.status_code == 200
+    assert json.loads(resp.data.decode('utf-8'))['data']['comment'] == 'new comment'
+    resp = client.get('/api/v2/red-flags', headers=dict(headers, **{'If-None-Match': collection_etag}))
+    assert resp.status_code == 200
+
+    #: So do deletes
+    resp = client.post('/api/v2/red-flags', data=DATA, headers=headers)
+    other_uri = json.loads(resp.data.decode('utf-8'))['uri']
+    resp = client.get('/api/v2/red-flags', headers=headers)
+    collection_etag = resp.headers['ETag']
+    client.delete(other_uri, headers=headers)
+    resp = client.get('/api/v2/red-flags', headers=dict(headers, **{'If-None-Match': collection_etag}))
+    assert resp.status_code == 200
+
+def test_conditional_get_of_pages(app, client, auth, monkeypatch):
+    """
+    Pages are tagged from their records, the collection's version is
+    only read for streams
+    """
+    resp = auth.login()
+    access_token = json.loads(resp.data.decode('utf-8'))['data'][0]['access_token']
+    headers = make_token_header(access_token)
+    for _ in range(3):
+        client.post('/api/v2/red-flags', data=DATA, headers=headers)
+
+    def version(self, conditions):
+        raise AssertionError('version read for a page')
+
+    monkeypatch.setattr(Record, 'version', version)
+    for rendered in (False, True):
+        app.config['DB_RENDERING'] = rendered
+        for url in ('/api/v2/red-flags?limit=2', '/api/v2/red-flags?q=tendering&limit=2'):
+            resp = client.get(url, headers=headers)
+            assert resp.status_code == 200
+            etag = resp.headers['ETag']
+            resp = client.get(url, headers=dict(headers, **{'If-None-Match': etag}))
+            assert resp.status_code == 304
+    app.config['DB_RENDERING'] = False
+
+    #: A change to a record on the page changes its tag, others don't
+    resp = client.get('/api/v2/red-flags?limit=2', headers=headers)
+    first, etag = json.loads(resp.data.decode('utf-8'))['data'], resp.headers['ETag']
+    oldest = min(incident['id'] for incident in Record().filter([]))
+    assert oldest not in [incident['id'] for incident in first]
+    Record().update(oldest, 'comment', 'new comment')
+    resp = client.get('/api/v2/red-flags?limit=2', headers=dict(headers, **{'If-None-Match': etag}))
+    assert resp.status_code == 304
+    Record().update(first[1]['id'], 'comment', 'new comment')
+    resp = client.get('/api/v2/red-flags?limit=2', headers=dict(headers, **{'If-None-Match': etag}))
+    assert resp.status_code == 200
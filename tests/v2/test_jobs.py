@@ -0,0 +1,116 @@
+'''
+	tests.v2.test_jobs
+	---------------------
+
+	Tests for the job queue
+'''
+import threading
+from app import mail
+from app.db.db import get_db
+from app.helpers import send_email
+from app.jobs import Worker, task
+from app.models import Job
+
+#: Arguments of the test_record jobs run
+calls = []
+
+
+@task('test_record')
+def record(n):
+    calls.append(n)
+
+@task('test_fail')
+def fail():
+    raise RuntimeError('no luck')
+
+
+def test_run_jobs(app):
+    del calls[:]
+    JOB = Job()
+    for n in range(3):
+        JOB.add('test_record', {'n': n})
+    assert Worker(app).run(burst=True) == 3
+    assert calls == [0, 1, 2]
+    assert JOB.filter([]) == []
+
+def test_job_in_transaction(app):
+    del calls[:]
+    Job().add('test_record', {'n': 1}, commit=False)
+    get_db().rollback()
+    Job().add('test_record', {'n': 2}, commit=False)
+    get_db().commit()
+    Worker(app).run(burst=True)
+    assert calls == [2]
+
+def test_delayed_job(app):
+    del calls[:]
+    Job().add('test_record', {'n': 1}, delay=60)
+    assert Worker(app).run(burst=True) == 0
+    assert calls == []
+
+def test_failed_jobs(app):
+    JOB = Job()
+    JOB.add('test_fail', max_attempts=3)
+    JOB.add('no_such_task')
+    worker = Worker(app, backoff=0)
+    worker.run(burst=True)
+    assert worker.failed == 4
+    assert JOB.filter([]) == []
+    dead = {job['task']: job for job in JOB.dead()}
+    assert dead['test_fail']['attempts'] == 3
+    assert 'RuntimeError: no luck' in dead['test_fail']['last_error']
+    assert dead['no_such_task']['attempts'] == 1
+
+def test_claim_counts_attempt(app):
+    JOB = Job()
+    JOB.add('test_record', {'n': 1}, max_attempts=2)
+    worker = Worker(app, lease=0)
+    worker.connect()
+    #: Claimed and left unfinished, as by a worker killed by the job
+    assert [job[3] for job in worker.claim()] == [1]
+    assert JOB.filter([])[0]['attempts'] == 1
+    assert [job[3] for job in worker.claim()] == [2]
+    #: Out of attempts: buried, not run again
+    assert worker.run_batch() == 1
+    worker.conn.close()
+    assert JOB.filter([]) == []
+    dead = JOB.dead()[0]
+    assert dead['attempts'] == 2
+    assert 'stopped' in dead['last_error']
+
+def test_claimed_jobs_leased(app):
+    del calls[:]
+    Job().add('test_record', {'n': 1})
+    worker = Worker(app)
+    worker.connect()
+    assert len(worker.claim()) == 1
+    #: Another worker doesn't take a job while its lease lasts
+    assert Worker(app).run(burst=True) == 0
+    worker.conn.close()
+    assert calls == []
+
+def test_workers_share_the_queue(app):
+    del calls[:]
+    for n in range(300):
+        Job().add('test_record', {'n': n})
+    workers = [Worker(app, batch_size=10) for _ in range(3)]
+    threads = [threading.Thread(target=worker.run, args=(True,)) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    #: Every job ran exactly once
+    assert sorted(calls) == list(range(300))
+    assert sum(worker.done for worker in workers) == 300
+
+def test_worker_command(app, runner):
+    Job().add('prune_blacklist')
+    result = runner.invoke(args=['worker', '--burst'])
+    assert 'Ran 1 jobs' in result.output
+
+def test_send_email_job(app):
+    app.config['MAIL_USE_JOBS'] = True
+    assert send_email('Status Update', 'admin@example.com', ['user@example.com'], 'Resolved')
+    with mail.record_messages() as outbox:
+        Worker(app).run(burst=True)
+    assert [message.recipients for message in outbox] == [['user@example.com']]
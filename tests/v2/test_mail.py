@@ -0,0 +1,104 @@
+'''
+	tests.v2.test_mail
+	---------------------
+
+	Tests for background email delivery
+'''
+import json
+import time
+import pytest
+from flask_mail import Message
+from app import create_app, mail
+from app.helpers import make_token_header, send_email
+from app.mailer import Mailer, get_mailer
+from app.smtp import SMTPStandIn
+from config import TestConfig
+
+
+@pytest.fixture
+def smtp():
+    server = SMTPStandIn().start()
+    yield server
+    server.stop()
+
+@pytest.fixture
+def mail_app(smtp):
+    class MailConfig(TestConfig):
+        MAIL_SERVER = 'localhost'
+        MAIL_PORT = smtp.port
+        MAIL_SUPPRESS_SEND = False
+        MAIL_USE_TLS = False
+        MAIL_USERNAME = None
+        MAIL_PASSWORD = None
+        MAIL_DEBUG = False
+        MAIL_RETRY_BACKOFF = 0.01
+        MAIL_IDLE_TIMEOUT = 0.5
+    return create_app(MailConfig)
+
+def message(n):
+    return Message(subject='Status Update', sender='admin@example.com',
+                   recipients=['user{}@example.com'.format(n)], body='Update {}'.format(n))
+
+def test_send_email_in_background(mail_app, smtp):
+    with mail_app.app_context():
+        for n in range(3):
+            assert send_email('Status Update', 'admin@example.com',
+                              ['user{}@example.com'.format(n)], 'Update')
+        get_mailer().join()
+        stats = get_mailer().stats()
+    assert [recipients for _, recipients, _ in smtp.messages] == [
+        ['<user{}@example.com>'.format(n)] for n in range(3)]
+    #: One connection for the burst
+    assert smtp.connections == 1
+    assert stats['sent'] == 3 and stats['queued'] == 0
+
+def test_mail_retries(mail_app, smtp):
+    smtp.fail_next = 1
+    with mail_app.app_context():
+        mailer = get_mailer()
+        mailer.send(message(1))
+        mailer.join()
+    assert len(smtp.messages) == 1
+    assert mailer.stats()['retried'] == 1
+
+    smtp.fail_next = 10
+    with mail_app.app_context():
+        mailer.send(message(2))
+        mailer.join()
+    assert len(smtp.messages) == 1
+    assert mailer.stats()['failed'] == 1
+
+@pytest.mark.parametrize('overflow, delivered', [('drop_new', [2]), ('drop_oldest', [3])])
+def test_mail_overflow(mail_app, smtp, overflow, delivered):
+    mailer = Mailer(mail_app, mail_app.extensions['mail'], maxsize=1, overflow=overflow,
+                    retries=1, backoff=0.3, idle_timeout=0.1)
+    #: Keep the sender busy retrying message 1 while the queue fills
+    smtp.fail_next = 2
+    with mail_app.app_context():
+        mailer.send(message(1))
+        time.sleep(0.1)
+        assert mailer.send(message(2))
+        assert mailer.send(message(3)) == (overflow != 'drop_new')
+        mailer.join()
+    assert mailer.stats()['dropped'] == 1
+    assert [int(data.decode().rsplit(' ', 1)[1]) for _, _, data in smtp.messages] == delivered
+    mailer.stop()
+
+def test_patch_status_queues_email(client, auth):
+    resp = client.post('/api/v2/auth/signup', data={'username': 'patrice', 'password': 'lumumba',
+                                                    'isadmin': True, 'email': 'admin@example.com'})
+    admin_headers = make_token_header(json.loads(resp.data.decode('utf-8'))['data'][0]['access_token'])
+    resp = client.post('/api/v2/auth/signup', data={'username': 'owner', 'password': 'owner-pass',
+                                                    'email': 'owner@example.com'})
+    headers = make_token_header(json.loads(resp.data.decode('utf-8'))['data'][0]['access_token'])
+    resp = client.post('/api/v2/red-flags', data={'location': '-1.23, 36.5', 'comment': 'bribes'},
+                       headers=headers)
+    uri = json.loads(resp.data.decode('utf-8'))['uri']
+
+    with mail.record_messages() as outbox:
+        resp = client.patch(uri + '/status', data={'status': 'resolved'}, headers=admin_headers)
+        assert resp.status_code == 200
+        get_mailer().join()
+    assert len(outbox) == 1
+    assert outbox[0].recipients == ['admin@example.com']
+    assert outbox[0].body.endswith('to resolved')
@@ -4,10 +4,12 @@
 """
 
 from app.models import Record, User, Blacklist
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+import threading
 import pytest
 import json
 from app.helpers import make_token_header
+from app.db.db import get_db
 
 
 def test_create_record(client):
@@ -70,3 +72,81 @@ def test_delete_user(client):
     USER.delete(user_id)
     user = USER.by_id(user_id)
     assert not bool(user)
+
+def test_read_your_writes_with_replicas(app):
+    app.config['DATABASE_REPLICAS'] = [app.config['DATABASE'] + ' application_name=replica']
+    with app.app_context():
+        USER = User()
+        assert USER.by_username('test')
+        assert USER.cursor.connection.readonly
+
+        USER.add(username='john', password='iamsosecret')
+        #: Reads after a write are served by the primary
+        assert USER.by_username('john')
+        assert not USER.cursor.connection.readonly
+    app.config['DATABASE_REPLICAS'] = []
+
+def test_prune_blacklist(client):
+    BLACKLIST = Blacklist()
+    now = datetime.now(timezone.utc)
+    BLACKLIST.add(jti='expired', expires=now - timedelta(minutes=1))
+    BLACKLIST.add(jti='valid', expires=now + timedelta(minutes=60))
+    assert BLACKLIST.is_blacklisted('expired')
+    assert BLACKLIST.prune() == 1
+    assert not BLACKLIST.is_blacklisted('expired')
+    assert BLACKLIST.is_blacklisted('valid')
+
+def test_add_record_returns_id_and_uri(client):
+    USER = User()
+    user = USER.add(username='john', password='iamsosecret')
+    RECORD = Record()
+    record = RECORD.add(location='23,34', comment='conmen', _type='intervention',
+                        user_id=user['id'], uri_prefix='http://localhost/interventions/')
+    assert record['uri'] == 'http://localhost/interventions/{}'.format(record['id'])
+    assert record['createdon']
+    assert RECORD.by_id(record['id'])[0]['uri'] == record['uri']
+
+def test_concurrent_record_creation(app):
+    user_id = User().add(username='john', password='iamsosecret')['id']
+    results = []
+
+    def create():
+        with app.app_context():
+            for _ in range(10):
+                record = Record().add(location='23,34', comment='conmen', _type='intervention',
+                                      user_id=user_id, uri_prefix='/interventions/')
+                results.append(record)
+
+    threads = [threading.Thread(target=create) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len({record['id'] for record in results}) == 40
+    for record in results:
+        assert record['uri'] == '/interventions/{}'.format(record['id'])
+
+def test_iterate_on_replica(app):
+    app.config['DATABASE_REPLICAS'] = [app.config['DATABASE'] + ' application_name=replica']
+    app.config['DATABASE_FETCH_SIZE'] = 1
+    with app.app_context():
+        USER = User()
+        users = list(USER.iter_all())
+        assert [user['username'] for user in users] == ['test']
+        assert get_db(readonly=True).autocommit
+    app.config['DATABASE_REPLICAS'] = []
+
+def test_filter_conditions(client):
+    RECORD = Record()
+    user_id = User().add(username='john', password='iamsosecret')['id']
+    RECORD.add(location='23,34', comment='conmen', _type='intervention', user_id=user_id)
+    RECORD.add(location='23,34', comment='conmen', _type='red-flag', user_id=user_id,
+               status='Resolved')
+    assert len(RECORD.filter([('createdby', '=', user_id)])) == 2
+    assert len(RECORD.filter([('createdby', '=', user_id), ('status', 'ieq', 'resolved')])) == 1
+    #: Only known fields and operators are accepted
+    with pytest.raises(ValueError):
+        RECORD.filter([('password_hash', '=', 'x')])
+    with pytest.raises(ValueError):
+        RECORD.filter([('id', '; drop table records', 1)])
@@ -0,0 +1,46 @@
+'''
+	tests.v2.test_passwords
+	--------------------------
+
+	Tests for password hashing
+'''
+import threading
+import time
+import pytest
+from werkzeug.security import check_password_hash
+from app.passwords import HashPool, HashPoolBusy, hash_password, check_password, needs_rehash
+
+
+def test_hash_pool():
+    pool = HashPool(processes=1)
+    try:
+        assert pool.run(pow, 2, 10) == 1024
+        assert pool.run(check_password_hash, 'pbkdf2:sha256:1000$salt$nope', 'pw') is False
+    finally:
+        pool.shutdown()
+
+def test_hash_pool_is_bounded():
+    pool = HashPool(processes=1, max_pending=1, timeout=0.05)
+    try:
+        pool.run(pow, 2, 2)
+        thread = threading.Thread(target=pool.run, args=(time.sleep, 0.5))
+        thread.start()
+        time.sleep(0.1)
+        with pytest.raises(HashPoolBusy):
+            pool.run(pow, 2, 2)
+        assert pool.stats()['rejected'] == 1
+        thread.join()
+        #: The slot is released once the hash is done
+        assert pool.run(pow, 2, 2) == 4
+    finally:
+        pool.shutdown()
+
+def test_hash_password(app):
+    password_hash = hash_password('secret')
+    assert password_hash.startswith('pbkdf2:sha256:1000$')
+    assert check_password(password_hash, 'secret')
+    assert not check_password(password_hash, 'guess')
+    assert not check_password('', 'secret')
+    assert not needs_rehash(password_hash)
+    app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:2000'
+    assert needs_rehash(password_hash)
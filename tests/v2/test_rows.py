@@ -0,0 +1,52 @@
+'''
+	tests.v2.test_rows
+	-------------------------
+
+	Tests for the compact rows returned by model queries
+'''
+import json
+import pickle
+from datetime import datetime, timezone
+import pytest
+from app.encoding import ENCODERS, get_encoder
+from app.models import Record, User
+from app.rows import Row, row_class
+
+
+def test_row_mapping():
+    row = row_class(('id', 'username'))((1, 'test'))
+    assert row['username'] == 'test'
+    assert row[0] == 1
+    assert row.get('email') is None
+    assert 'id' in row and 'test' not in row
+    assert list(row) == ['id', 'username']
+    assert dict(row) == {'id': 1, 'username': 'test'}
+    assert row == {'id': 1, 'username': 'test'}
+    assert row.without('username') == {'id': 1}
+    assert pickle.loads(pickle.dumps(row)) == row
+    with pytest.raises(KeyError):
+        row['email']
+    with pytest.raises(TypeError):
+        row['id'] = 2
+
+@pytest.mark.parametrize('name', sorted(ENCODERS))
+def test_encode_rows(name):
+    createdon = datetime(2018, 12, 3, 14, 5, tzinfo=timezone.utc)
+    row = row_class(('id', 'createdon'))((1, createdon))
+    data = json.loads(get_encoder(name)({'status': 200, 'data': [row]}).decode('utf-8'))
+    assert data == {'status': 200, 'data': [{'id': 1, 'createdon': 'Mon, 03 Dec 2018 14:05 PM'}]}
+
+def test_models_return_rows(app):
+    USER = User()
+    users = USER.all()
+    assert isinstance(users[0], Row)
+    assert users[0]['username'] == 'test'
+    #: Rows of the same columns share their class
+    RECORD = Record()
+    for comment in ('one', 'two'):
+        RECORD.add('-1.28, 36.82', comment, 'red-flag', user_id=users[0]['id'])
+    records = RECORD.filter([('type', '=', 'red-flag')], ['id', 'comment'])
+    assert type(records[0]) is type(records[1])
+    assert sorted(record['comment'] for record in records) == ['one', 'two']
+    assert [dict(row) for row in RECORD.iter_filtered([], ['comment'])] == [{'comment': 'two'},
+                                                                             {'comment': 'one'}]
@@ -0,0 +1,57 @@
+'''
+	tests.v2.test_schema
+	-------------------------
+
+	Tests for request payload validation
+'''
+import json
+import pytest
+from app.schema import INVALID, MISSING, UNKNOWN, Field, Invalid, Schema
+from app.utils import valid_comment, valid_email
+
+SCHEMA = Schema(Field('comment', required=True, missing='comment not provided',
+                      check=valid_comment, invalid='Invalid comment', clean=True),
+                Field('email', check=valid_email, invalid='Invalid email'),
+                strict=True)
+
+
+def test_load():
+    assert SCHEMA.load({'comment': ' bribes '}) == {'comment': 'bribes', 'email': None}
+    #: Optional values are only checked when given
+    assert SCHEMA.load({'comment': 'bribes', 'email': ''})['email'] == ''
+    assert SCHEMA.load({'comment': 5})['comment'] == '5'
+
+@pytest.mark.parametrize('payload, kind', [
+    ({'email': 'nope'}, MISSING),
+    ({'comment': ' ', 'email': 'nope', 'extra': 1}, UNKNOWN),
+    ({'comment': ' ', 'email': 'nope'}, INVALID),
+])
+def test_error_precedence(payload, kind):
+    with pytest.raises(Invalid) as error:
+        SCHEMA.load(payload)
+    assert error.value.kind == kind
+
+def test_load_many():
+    loaded, errors = SCHEMA.load_many([{'comment': 'one'}, {'comment': ''}, {'comment': 'two'}])
+    assert [item['comment'] for item in loaded] == ['one', 'two']
+    assert [(index, error.message) for index, error in errors] == [(1, 'Invalid comment')]
+
+def test_error_responses(app):
+    responses = [Invalid(MISSING, 'comment not provided', 'comment').response(),
+                 Invalid(UNKNOWN, 'Unknown arguments: extra').response(),
+                 Invalid(INVALID, 'Invalid comment', 'comment').response()]
+    assert [json.loads(response.get_data(as_text=True)) for response in responses] == [
+        {'message': {'comment': 'comment not provided'}},
+        {'message': 'Unknown arguments: extra'},
+        {'status': 400, 'error': 'Invalid comment'}]
+    assert all(response.status_code == 400 for response in responses)
+
+def test_json_and_form_payloads(app, client, auth):
+    for post in (lambda data: client.post('/api/v2/auth/signup', data=data),
+                 lambda data: client.post('/api/v2/auth/signup', json=data)):
+        resp = post({'username': 'mahatma'})
+        assert resp.status_code == 400
+        assert json.loads(resp.data.decode('utf-8')) == {
+            'message': {'password': 'Please enter username and password'}}
+        resp = post({'username': '1ma', 'password': 'gandhi'})
+        assert json.loads(resp.data.decode('utf-8'))['error'].startswith('Invalid Username')
@@ -0,0 +1,32 @@
+"""
+    tests.v2.stats
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    Tests for the monitoring resource
+"""
+
+import json
+from app.helpers import make_token_header
+
+
+def test_get_stats(client, auth):
+    """
+    Only admins can read the worker's statistics
+    """
+    resp = client.get('/api/v2/stats')
+    assert resp.status_code == 401
+
+    resp = auth.login()
+    access_token = json.loads(resp.data.decode('utf-8'))['data'][0]['access_token']
+    resp = client.get('/api/v2/stats', headers=make_token_header(access_token))
+    assert resp.status_code == 403
+
+    resp = auth.signup(username='admin', password='admin-password', admin=True)
+    access_token = json.loads(resp.data.decode('utf-8'))['data'][0]['access_token']
+    resp = client.get('/api/v2/stats', headers=make_token_header(access_token))
+    assert resp.status_code == 200
+    data = json.loads(resp.data.decode('utf-8'))['data'][0]
+    assert data['db_pool']['in_use'] >= 1
+    assert 'idle' in data['db_pool']
+    assert 'wait_time' in data['db_pool']
+    assert 'hits' in data['user_cache']
@@ -6,6 +6,7 @@
 """
 
 import json
+from flask_jwt_extended import decode_token
 from app.helpers import make_token_header
 from app.models import User
 
@@ -60,4 +61,94 @@ def test_get_all_users(client, auth):
     assert resp.status_code == 200
     data = json.loads(resp.data.decode('utf-8'))
     print(data)
-    assert len(data['data']) == 4
\ No newline at end of file
+    assert len(data['data']) == 4
+
+def test_token_claims(client, auth):
+    """
+    Access tokens carry the user's id and admin status
+    """
+    resp = auth.signup(username='mahatma', password='gandhi', admin=True)
+    data = json.loads(resp.data.decode('utf-8'))['data'][0]
+    claims = decode_token(data['access_token'])['user_claims']
+    user = User().by_username('mahatma')
+    assert claims == {'id': user['id'], 'isadmin': True, 'ver': user['claims_version']}
+
+def test_admin_demotion_revokes_admin_claims(client, auth):
+    """
+    Admin claims issued before a demotion are no longer honoured
+    """
+    resp = auth.signup(username='mahatma', password='gandhi', admin=True)
+    data = json.loads(resp.data.decode('utf-8'))['data'][0]
+    access_token, refresh_token = data['access_token'], data['refresh_token']
+    resp = client.get('/api/v2/users', headers=make_token_header(access_token))
+    assert resp.status_code == 200
+
+    USER = User()
+    USER.update(USER.by_username('mahatma')['id'], 'isadmin', False)
+    resp = client.get('/api/v2/users', headers=make_token_header(access_token))
+    assert resp.status_code == 403
+
+    #: Refreshed tokens carry the new status
+    resp = client.post('/api/v2/auth/refresh', headers=make_token_header(refresh_token))
+    access_token = json.loads(resp.data.decode('utf-8'))['data'][0]['access_token']
+    assert not decode_token(access_token)['user_claims']['isadmin']
+
+def test_stream_users(client, auth):
+    resp = auth.signup(username='mahatma', password='gandhi', admin=True)
+    access_token = json.loads(resp.data.decode('utf-8'))['data'][0]['access_token']
+    resp = client.get('/api/v2/users?stream=1', headers=make_token_header(access_token))
+    assert resp.status_code == 200
+    data = json.loads(resp.data.decode('utf-8'))
+    assert [user['username'] for user in data['data']] == ['test', 'mahatma']
+
+def test_user_fields(client, auth):
+    resp = auth.login()
+    access_token = json.loads(resp.data.decode('utf-8'))['data'][0]['access_token']
+    resp = client.get('/api/v2/user?fields=id,username', headers=make_token_header(access_token))
+    assert resp.status_code == 200
+    data = json.loads(resp.data.decode('utf-8'))
+    assert data['data'] == [{'id': data['data'][0]['id'], 'username': 'test'}]
+
+    resp = client.get('/api/v2/user?fields=password_hash', headers=make_token_header(access_token))
+    assert resp.status_code == 400
+
+def test_user_cache(app, client, auth):
+    """
+    Tests that users looked up by username are cached and that the
+    cache follows updates
+    """
+    from app.usercache import get_user_cache
+    cache = get_user_cache()
+    USER = User()
+    user = USER.by_username('test')
+    assert 'password_hash' not in user
+    misses = cache.users.misses
+    #: Copies are returned, so callers may modify them
+    user['username'] = 'changed'
+    assert USER.by_username('test')['username'] == 'test'
+    assert cache.users.misses == misses
+    assert cache.request_hits >= 1
+    #: Missing users are not cached
+    assert USER.by_username('newcomer') == {}
+    auth.signup(username='newcomer', password='newcomer-password')
+    assert USER.by_username('newcomer')['username'] == 'newcomer'
+
+    USER.update(user['id'], 'email', 'test@example.com')
+    assert USER.by_username('test')['email'] == 'test@example.com'
+    USER.delete(user['id'])
+    assert USER.by_username('test') == {}
+    #: Logins always read the current password hash
+    resp = auth.login()
+    assert resp.status_code == 401
+
+    #: Refreshing reads the user past the cache, which a change made
+    #: by another worker would not have reached yet
+    resp = auth.login('newcomer', 'newcomer-password')
+    refresh_token = json.loads(resp.data.decode('utf-8'))['data'][0]['refresh_token']
+    assert USER.by_username('newcomer')['isadmin'] is False
+    USER.query("update users set isadmin = true where username = 'newcomer';")
+    USER.commit()
+    resp = client.post('/api/v2/auth/refresh', headers=make_token_header(refresh_token))
+    assert resp.status_code == 200
+    access_token = json.loads(resp.data.decode('utf-8'))['data'][0]['access_token']
+    assert decode_token(access_token)['user_claims']['isadmin'] is True